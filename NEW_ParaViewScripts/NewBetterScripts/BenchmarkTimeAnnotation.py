@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+# Distributed under the MIT License.
+# See LICENSE.txt for details.
+
+from paraview.simple import *
+import argparse
+import os
+import time
+# input file class
+from InputFile import InputFile
+
+#import common functions
+from ReadWriteFunctions import *
+from SetDisplayFunctions import *
+
+
+def parse_benchmark_cmd_line():
+    '''
+    parse command-line arguments
+    :return: dictionary of the command-line args, dashes are underscores
+    '''
+    parser = argparse.ArgumentParser(
+        description='Benchmark per-frame time and memory of the time '
+        'annotation over many frames',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--input-file', type=str, required=True,
+                        help="provide path to "
+                        "yaml file containing visualization parameters")
+    parser.add_argument('--number-of-frames', type=int, default=1000,
+                        help="number of frames to render, the timesteps "
+                        "of the data are cycled through")
+    parser.add_argument('--report-every', type=int, default=100,
+                        help="number of frames averaged per report line")
+    parser.add_argument('--annotate-every-frame', action='store_true',
+                        help="create a new time annotation every frame, "
+                        "as save_images used to, for comparison")
+    return vars(parser.parse_args())
+
+
+def get_resident_memory():
+    '''
+    Current resident memory of this process in MB (Linux only)
+    '''
+    with open('/proc/self/statm', 'r') as statm:
+        resident_pages = int(statm.read().split()[1])
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / 1024.0**2
+
+
+def main(args):
+    '''
+    :param args: command line arguments
+    Render frames without saving them and report the mean time per frame
+    and the resident memory every args["report_every"] frames. Both stay
+    flat when the annotation is reused.
+    '''
+    paraview.simple._DisableFirstRenderCameraReset()
+    input_file = load_input_file(args["input_file"])
+    render_view = CreateRenderView()
+    xdmf_reader = get_xdmf_reader(
+        input_file.pv_file_path, get_required_point_arrays(input_file))
+    Show(xdmf_reader, render_view)
+    render_view.ResetCamera()
+
+    time_steps = list(xdmf_reader.TimestepValues)
+    anim = GetAnimationScene()
+    anim.PlayMode = 'Snap To TimeSteps'
+    if not args["annotate_every_frame"]:
+        display_time(xdmf_reader, render_view)
+
+    print('Frames, Mean frame time (s), Resident memory (MB)')
+    window_start_time = time.time()
+    for frame in range(1, args["number_of_frames"] + 1):
+        anim.AnimationTime = time_steps[frame % len(time_steps)]
+        if args["annotate_every_frame"]:
+            display_time(xdmf_reader, render_view)
+        Render(render_view)
+        if frame % args["report_every"] == 0:
+            mean_frame_time = (time.time() - window_start_time) /\
+                args["report_every"]
+            print('{0}, {1:.4f}, {2:.1f}'.format(frame, mean_frame_time,
+                                                 get_resident_memory()))
+            window_start_time = time.time()
+    return None
+
+
+if __name__ == "__main__":
+    try:
+        main(parse_benchmark_cmd_line())
+    except KeyboardInterrupt:
+        pass
@@ -22,20 +22,30 @@ def main(args):
     :param args: command line arguments
     Render image(s) based on parameters specified
     '''
-    
+    # Split the timesteps between worker processes if requested,
+    # each worker builds its own pipeline
+    if launch_workers(args):
+        return None
+
     # Disable automatic camera reset on 'Show'
     paraview.simple._DisableFirstRenderCameraReset()
     # Get data from file, set default camera properties
     input_file = load_input_file(args["input_file"])
     scalar_variable = input_file.pv_scalar_variable_properties.pv_variable_name
-    xdmf_reader = get_xdmf_reader(input_file.pv_file_path)
+    xdmf_reader = get_xdmf_reader(
+        input_file.pv_file_path, get_required_point_arrays(input_file))
     render_view = create_render_view()
     set_default_camera(render_view)
+    # Only the elements the filter can touch are read, and the points
+    # neighboring elements share are welded, if asked for
+    filter_source = get_filter_source(get_region_source(
+        xdmf_reader, input_file,
+        get_clip_region(input_file.pv_filters.pv_clip)), input_file)
     
     # Clip data
     render_view, pv_clip, display=\
         apply_clip(input_file.pv_filters.pv_clip,
-                   scalar_variable, render_view, xdmf_reader)
+                   scalar_variable, render_view, filter_source)
     # Uncomment next line to tetrahedralize
     # display=tetrahedralize(clip, render_view)
     
@@ -43,19 +53,17 @@ def main(args):
     display=set_representation(
         input_file.pv_scalar_variable_properties.pv_representation, display)
     display, render_view, variable_lookup_table=\
-    set_color_map(scalar_variable, render_view, display,
-                  input_file.pv_scalar_variable_properties.pv_color_map)
-    render_view=\
-    set_opacity(scalar_variable,
-        input_file.pv_scalar_variable_properties.pv_opacity.pv_function_type,
-        input_file.pv_scalar_variable_properties.pv_opacity.pv_value,
-        render_view, xdmf_reader, variable_lookup_table)
+    set_transfer_functions(scalar_variable, render_view, display,
+                           xdmf_reader,
+                           input_file.pv_scalar_variable_properties,
+                           get_data_range(input_file), get_histogram(input_file),
+                           input_file.pv_cache_directory)
 
     # Add a vector field (glyphs in ParaView) if specified in
     # input file
     if input_file.pv_vector_variable_properties.pv_add_vector_field:
         render_view, vector_field_display =\
-        add_vector_field(vector_variable, xdmf_reader, render_view)
+        add_vector_field(vector_variable, filter_source, render_view)
         # Clip data
         
         # Update vector field display
@@ -70,7 +78,8 @@ def main(args):
     render_view.ResetCamera()
 
     # Save images
-    save_images(render_view, xdmf_reader, args["save"])
+    save_images(render_view, xdmf_reader, args,
+                input_file.pv_save_properties)
     
     return None
 
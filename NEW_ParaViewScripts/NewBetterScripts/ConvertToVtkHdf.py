@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+
+# Distributed under the MIT License.
+# See LICENSE.txt for details.
+
+import argparse
+import json
+import os
+import time
+import numpy as np
+from XdmfIndex import get_xdmf_index
+from DataScan import get_data_key, read_data_items, read_points,\
+    scan_mesh_changes
+
+# Rewrites the temporal collection of an XDMF file, one grid per element
+# group and HDF5 file, into a single VTKHDF file (the HDF5 format of
+# VTK's vtkHDFReader, transient UnstructuredGrid): each time step is one
+# merged unstructured grid, as MergeBlocks without merging points. The
+# cells and points are only written once per distinct topology and
+# geometry (see scan_mesh_changes) and shared by the time steps, the point
+# arrays of the time steps follow one another. Datasets are chunked and
+# gzip compressed, the chunks of a time step are contiguous so it is read
+# sequentially. get_xdmf_reader (ReadWriteFunctions) reads the converted
+# file instead of the XDMF file while it is up to date.
+
+# Extension of the converted file, which replaces the XDMF file's
+VTKHDF_EXTENSION = '.vtkhdf'
+# Version of the VTKHDF format written, the first with time steps
+VTKHDF_VERSION = [2, 0]
+# VTK cell type and number of points of the XDMF topology types
+XDMF_CELL_TYPES = {'Hexahedron': (12, 8), 'Tetrahedron': (10, 4),
+                   'Wedge': (13, 6), 'Pyramid': (14, 5),
+                   'Quadrilateral': (9, 4), 'Triangle': (5, 3),
+                   'Polyline': (3, 2)}
+# Default number of values per chunk of the datasets
+CHUNK_SIZE = 2**20
+# Default gzip compression level
+COMPRESSION_LEVEL = 4
+
+
+def get_vtkhdf_name(xdmf_file_name):
+    '''
+    Name of the VTKHDF file converted from an XDMF file, next to it
+    '''
+    return os.path.splitext(xdmf_file_name)[0] + VTKHDF_EXTENSION
+
+
+def get_source_key(xdmf_index):
+    '''
+    Modification times and sizes of the XDMF file and its HDF5 files as
+    stored in the converted file (see get_data_key)
+    '''
+    return json.dumps(get_data_key(xdmf_index))
+
+
+def get_converted_file(xdmf_file_name, point_arrays=None):
+    '''
+    Name of the VTKHDF file converted from an XDMF file if there is one,
+    the XDMF and HDF5 files did not change since and it has the arrays in
+    point_arrays, else None. Also None without h5py, the converted file
+    cannot be checked then.
+    '''
+    vtkhdf_file_name = get_vtkhdf_name(xdmf_file_name)
+    if not os.path.isfile(vtkhdf_file_name):
+        return None
+    try:
+        import h5py
+        with h5py.File(vtkhdf_file_name, 'r') as vtkhdf_file:
+            source_key = vtkhdf_file.attrs.get('Source_key')
+            converted_arrays = list(vtkhdf_file['VTKHDF/PointData']) +\
+                list(vtkhdf_file['VTKHDF/CellData'])
+        if isinstance(source_key, bytes):
+            source_key = source_key.decode('utf-8')
+        if source_key != get_source_key(get_xdmf_index(xdmf_file_name)):
+            return None
+    except Exception:
+        return None
+    # For ex. the vector attributes that are not indexed
+    if point_arrays is not None and\
+       not set(point_arrays).issubset(converted_arrays):
+        return None
+    return vtkhdf_file_name
+
+
+def append_dataset(group, name, values, chunk_size=CHUNK_SIZE,
+                   compression_level=COMPRESSION_LEVEL):
+    '''
+    Append values to the dataset name of group, created resizable,
+    chunked and compressed along its first dimension if needed. Returns
+    the number of rows before them, their offset in the dataset.
+    '''
+    values = np.asarray(values)
+    if name not in group:
+        row_size = int(np.prod(values.shape[1:]))
+        chunk_rows = max(1, min(chunk_size // max(row_size, 1),
+                                len(values)))
+        group.create_dataset(name, data=values,
+                             maxshape=(None,) + values.shape[1:],
+                             chunks=(chunk_rows,) + values.shape[1:],
+                             compression='gzip',
+                             compression_opts=compression_level,
+                             shuffle=True)
+        return 0
+    dataset = group[name]
+    offset = dataset.shape[0]
+    dataset.resize((offset + len(values),) + dataset.shape[1:])
+    dataset[offset:] = values
+    return offset
+
+
+def read_grid_connectivities(grids):
+    '''
+    Flat connectivity of each of some grids
+    '''
+    connectivity = read_data_items([grid.connectivity for grid in grids])
+    sizes = [int(np.prod(grid.connectivity.dimensions)) for grid in grids]
+    return np.split(connectivity, np.cumsum(sizes)[:-1])
+
+
+def get_number_of_points(grid):
+    '''
+    Number of points of a grid, from its coordinate datasets
+    '''
+    if len(grid.coordinates) == 1:
+        return int(np.prod(grid.coordinates[0].dimensions)) // 3
+    return int(np.prod(grid.coordinates[0].dimensions))
+
+
+def read_merged_cells(grids):
+    '''
+    Types, offsets and point ids of the cells of some grids merged into
+    one, the point ids of each grid offset by the points of those before
+    '''
+    types = []
+    connectivity = []
+    sizes = []
+    number_of_points = 0
+    for grid, grid_connectivity in zip(grids,
+                                       read_grid_connectivities(grids)):
+        if grid.topology_type not in XDMF_CELL_TYPES:
+            raise ValueError("Cannot convert the XDMF topology " +
+                             grid.topology_type)
+        cell_type, cell_size = XDMF_CELL_TYPES[grid.topology_type]
+        types.append(np.full(grid.number_of_elements, cell_type,
+                             dtype=np.uint8))
+        sizes.append(np.full(grid.number_of_elements, cell_size,
+                             dtype=np.int64))
+        connectivity.append(grid_connectivity.astype(np.int64) +
+                            number_of_points)
+        number_of_points += get_number_of_points(grid)
+    return np.concatenate(types),\
+        np.concatenate([[0], np.cumsum(np.concatenate(sizes))]),\
+        np.concatenate(connectivity)
+
+
+def convert_xdmf_to_vtkhdf(xdmf_file_name, vtkhdf_file_name=None,
+                           chunk_size=CHUNK_SIZE,
+                           compression_level=COMPRESSION_LEVEL):
+    '''
+    Write the time steps of an XDMF file into one VTKHDF file, by default
+    next to it (see get_vtkhdf_name). Returns the name of the file.
+    '''
+    import h5py
+    xdmf_index = get_xdmf_index(xdmf_file_name)
+    if vtkhdf_file_name is None:
+        vtkhdf_file_name = get_vtkhdf_name(xdmf_index.xdmf_file_name)
+    topology_ids, geometry_ids = scan_mesh_changes(xdmf_index)
+    # Every time step needs offsets into the arrays of an attribute, those
+    # missing from any grid are not converted
+    attribute_names = []
+    for attribute_name in xdmf_index.get_attribute_names():
+        if all(attribute_name in grid.attributes for grids
+               in xdmf_index.time_steps for grid in grids):
+            attribute_names.append(attribute_name)
+        else:
+            print('Skipping ' + attribute_name + ': not in every time step')
+    if xdmf_index.unindexed_attribute_names:
+        print('Skipping ' + ', '.join(xdmf_index.unindexed_attribute_names) +
+              ': not read from single HDF5 datasets (see XdmfIndex), the '
+              'XDMF file is read instead when they are used')
+    number_of_time_steps = len(xdmf_index.time_steps)
+    # Offsets of each time step in the datasets, see the VTKHDF format
+    part_offsets = np.zeros(number_of_time_steps, dtype=np.int64)
+    point_offsets = np.zeros(number_of_time_steps, dtype=np.int64)
+    cell_offsets = np.zeros((number_of_time_steps, 1), dtype=np.int64)
+    connectivity_offsets = np.zeros((number_of_time_steps, 1),
+                                    dtype=np.int64)
+    data_offsets = {'PointData': {}, 'CellData': {}}
+    # Group of each attribute, the same at every time step
+    attribute_groups = {}
+    # Parts (merged cells) and points written, by topology and geometry id
+    written_parts = {}
+    written_points = {}
+    with h5py.File(vtkhdf_file_name + '.tmp', 'w') as vtkhdf_file:
+        root = vtkhdf_file.create_group('VTKHDF')
+        root.attrs['Version'] = np.array(VTKHDF_VERSION, dtype=np.int64)
+        root.attrs.create('Type', np.bytes_('UnstructuredGrid'))
+        for group_name in data_offsets:
+            root.create_group(group_name)
+
+        def append(group, name, values):
+            return append_dataset(group, name, values, chunk_size,
+                                  compression_level)
+        for time_step_index, grids in enumerate(xdmf_index.time_steps):
+            topology_id = topology_ids[time_step_index]
+            if topology_id not in written_parts:
+                types, offsets, connectivity = read_merged_cells(grids)
+                written_parts[topology_id] = (
+                    append(root, 'NumberOfPoints',
+                           [sum(get_number_of_points(grid)
+                                for grid in grids)]),
+                    append(root, 'Types', types),
+                    append(root, 'Connectivity', connectivity))
+                append(root, 'NumberOfCells', [len(types)])
+                append(root, 'NumberOfConnectivityIds', [len(connectivity)])
+                append(root, 'Offsets', offsets)
+            (part_offsets[time_step_index], cell_offsets[time_step_index, 0],
+             connectivity_offsets[time_step_index, 0]) =\
+                written_parts[topology_id]
+            geometry_id = geometry_ids[time_step_index]
+            if geometry_id not in written_points:
+                points = read_points(grids)
+                written_points[geometry_id] = append(root, 'Points', points)
+            point_offsets[time_step_index] = written_points[geometry_id]
+            number_of_points = root['NumberOfPoints'][
+                part_offsets[time_step_index]]
+            number_of_cells = root['NumberOfCells'][
+                part_offsets[time_step_index]]
+            for attribute_name in attribute_names:
+                values = read_data_items([grid.attributes[attribute_name]
+                                          for grid in grids])
+                dimensions = grids[0].attributes[attribute_name].dimensions
+                if len(dimensions) > 1:
+                    values = values.reshape(-1, dimensions[-1])
+                # Attributes are on the points, or else on the cells
+                if len(values) == number_of_points:
+                    group_name = 'PointData'
+                elif len(values) == number_of_cells:
+                    group_name = 'CellData'
+                else:
+                    raise ValueError(
+                        "Cannot convert {0} at time step {1}: not one value "
+                        "per point or per cell".format(attribute_name,
+                                                       time_step_index))
+                if attribute_groups.setdefault(attribute_name,
+                                               group_name) != group_name:
+                    raise ValueError(
+                        "Cannot convert {0} at time step {1}: not in the "
+                        "{2} of the first time step".format(
+                            attribute_name, time_step_index,
+                            attribute_groups[attribute_name]))
+                data_offsets[group_name].setdefault(
+                    attribute_name, np.zeros(number_of_time_steps,
+                                             dtype=np.int64))[
+                    time_step_index] = append(root[group_name],
+                                              attribute_name, values)
+        steps = root.create_group('Steps')
+        steps.attrs['NSteps'] = number_of_time_steps
+        steps.create_dataset('Values', data=np.asarray(xdmf_index.times,
+                                                       dtype=np.float64))
+        steps.create_dataset('PartOffsets', data=part_offsets)
+        steps.create_dataset('NumberOfParts',
+                             data=np.ones(number_of_time_steps,
+                                          dtype=np.int64))
+        steps.create_dataset('PointOffsets', data=point_offsets)
+        steps.create_dataset('CellOffsets', data=cell_offsets)
+        steps.create_dataset('ConnectivityIdOffsets',
+                             data=connectivity_offsets)
+        for group_name, offsets in data_offsets.items():
+            offsets_group = steps.create_group(
+                group_name.replace('Data', 'DataOffsets'))
+            for attribute_name, attribute_offsets in offsets.items():
+                offsets_group.create_dataset(attribute_name,
+                                             data=attribute_offsets)
+        vtkhdf_file.attrs['Source_key'] = get_source_key(xdmf_index)
+    os.rename(vtkhdf_file_name + '.tmp', vtkhdf_file_name)
+    return vtkhdf_file_name
+
+
+def parse_cmd_line():
+    '''
+    parse command-line arguments
+    :return: dictionary of the command-line args, dashes are underscores
+    '''
+    parser = argparse.ArgumentParser(
+        description='Convert an XDMF file and its HDF5 files into one '
+        'VTKHDF file, read instead of them while it is up to date',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('xdmf_file', type=str,
+                        help="path to the XDMF (.xmf) file")
+    parser.add_argument('--output', type=str, default=None,
+                        help="name of the VTKHDF file, by default the XDMF "
+                        "file's with the " + VTKHDF_EXTENSION + " extension")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help="number of values per chunk of the datasets")
+    parser.add_argument('--compression-level', type=int,
+                        default=COMPRESSION_LEVEL, choices=range(10),
+                        help="gzip compression level")
+    parser.add_argument('--force', action='store_true',
+                        help="convert even if the converted file is up to "
+                        "date")
+    return vars(parser.parse_args())
+
+
+def main(args):
+    '''
+    :param args: command line arguments
+    '''
+    if args["output"] is None and not args["force"] and\
+       get_converted_file(args["xdmf_file"]) is not None:
+        print(get_vtkhdf_name(args["xdmf_file"]), 'is up to date')
+        return None
+    start_time = time.time()
+    vtkhdf_file_name = convert_xdmf_to_vtkhdf(
+        args["xdmf_file"], args["output"], args["chunk_size"],
+        args["compression_level"])
+    print('Wrote {0} in {1:.2f} s'.format(vtkhdf_file_name,
+                                          time.time() - start_time))
+    return None
+
+
+if __name__ == "__main__":
+    try:
+        main(parse_cmd_line())
+    except KeyboardInterrupt:
+        pass
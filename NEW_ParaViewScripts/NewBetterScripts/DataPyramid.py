@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+# Distributed under the MIT License.
+# See LICENSE.txt for details.
+
+import argparse
+import os
+import time
+from xml.sax.saxutils import quoteattr
+import numpy as np
+from XdmfIndex import get_xdmf_index
+from DataScan import get_element_layouts, get_lattice_hexahedra,\
+    read_data_items, scan_mesh_changes
+from ConvertToVtkHdf import get_number_of_points
+
+# Coarser levels of SpECTRE data for quick previews: in a level, each
+# element keeps only some of its Gauss-Lobatto points in each dimension,
+# evenly spread and always including the element's corners, for ex. 2
+# (the corners only) or 3. Each level is an XDMF file and an HDF5 file
+# next to the original ones (see get_level_file_name), with the same time
+# steps, grids and point attributes, so everything reading the original
+# data reads a level instead when Level_of_detail is set in the input
+# file. The cells and points of a level are written once per distinct
+# topology and geometry (see scan_mesh_changes).
+
+# Default points per element dimension of the levels built
+LEVELS = [2, 3]
+
+
+def get_level_file_name(xdmf_file_name, points_per_dimension,
+                        extension='.xmf'):
+    '''
+    Name of the XDMF file (or of the HDF5 file, with extension '.h5') of
+    the level of an XDMF file with points_per_dimension points per element
+    dimension
+    '''
+    return os.path.splitext(xdmf_file_name)[0] + '_lod' +\
+        str(points_per_dimension) + extension
+
+
+def get_level_lattice(extents, points_per_dimension):
+    '''
+    Indices, in an element lattice of extents points with x varying
+    fastest, of the points kept with points_per_dimension points per
+    dimension, and the extents of the lattice they form
+    '''
+    axes = [np.unique(np.round(np.linspace(
+        0, extent - 1, min(points_per_dimension, extent))).astype(np.int64))
+        for extent in extents]
+    k, j, i = np.meshgrid(axes[2], axes[1], axes[0], indexing='ij')
+    return (i + extents[0] * (j + extents[1] * k)).ravel(),\
+        tuple(len(axis) for axis in axes)
+
+
+def compute_level_layout(hexahedra, points_per_dimension):
+    '''
+    Ids of the points of a grid kept in a level, and the hexahedra between
+    them, (number of hexahedra, 8) ids of the kept points. The grid's cells
+    must be the hexahedra of element lattices, see get_element_layouts.
+    '''
+    first_hexahedra, first_points, extents = get_element_layouts(hexahedra)
+    element_extents = [tuple(extent) for extent in extents]
+    lattices = dict((extent, get_level_lattice(extent, points_per_dimension))
+                    for extent in set(element_extents))
+    numbers_of_points = np.array([len(lattices[extent][0])
+                                  for extent in element_extents])
+    numbers_of_cells = np.array([np.prod(np.array(lattices[extent][1]) - 1)
+                                 for extent in element_extents])
+    point_offsets = np.concatenate([[0], np.cumsum(numbers_of_points)])
+    cell_offsets = np.concatenate([[0], np.cumsum(numbers_of_cells)])
+    point_ids = np.empty(point_offsets[-1], dtype=np.int64)
+    cells = np.empty((cell_offsets[-1], 8), dtype=np.int64)
+    for extent, (lattice_ids, level_extents) in lattices.items():
+        elements = np.nonzero(np.all(extents == extent, axis=1))[0]
+        point_ids[point_offsets[elements, np.newaxis] +
+                  np.arange(len(lattice_ids))] =\
+            first_points[elements, np.newaxis] + lattice_ids
+        level_hexahedra = get_lattice_hexahedra(level_extents)
+        cells[cell_offsets[elements, np.newaxis] +
+              np.arange(len(level_hexahedra))] =\
+            point_offsets[elements, np.newaxis, np.newaxis] +\
+            level_hexahedra
+    return point_ids, cells
+
+
+def get_number_type(values):
+    '''
+    XDMF NumberType and Precision of a numpy array
+    '''
+    number_type = 'Int' if values.dtype.kind in 'iu' else 'Float'
+    return 'NumberType="{0}" Precision="{1}"'.format(number_type,
+                                                     values.dtype.itemsize)
+
+
+def get_data_item(h5_file, h5_file_name, path, values, indent):
+    '''
+    Write values to path in the HDF5 file if they are not there yet, and
+    return the XDMF <DataItem> referencing them
+    '''
+    if path not in h5_file:
+        h5_file.create_dataset(path, data=values)
+    return '{0}<DataItem Dimensions="{1}" {2} Format="HDF5">\n'\
+        '{0}  {3}:{4}\n{0}</DataItem>\n'.format(
+            indent, ' '.join(str(dimension) for dimension in values.shape),
+            get_number_type(values), os.path.basename(h5_file_name), path)
+
+
+def write_level(xdmf_file_name, points_per_dimension):
+    '''
+    Write the level of an XDMF file with points_per_dimension points per
+    element dimension. Returns the numbers of points of the original data
+    and of the level, over all time steps.
+    '''
+    import h5py
+    xdmf_index = get_xdmf_index(xdmf_file_name)
+    topology_ids, geometry_ids = scan_mesh_changes(xdmf_index)
+    if xdmf_index.unindexed_attribute_names:
+        print('Skipping ' + ', '.join(xdmf_index.unindexed_attribute_names) +
+              ': not read from single HDF5 datasets (see XdmfIndex)')
+    level_file_name = get_level_file_name(xdmf_index.xdmf_file_name,
+                                          points_per_dimension)
+    h5_file_name = get_level_file_name(xdmf_index.xdmf_file_name,
+                                       points_per_dimension, '.h5')
+    # Kept points and cells of each grid, by topology id
+    layouts = {}
+    numbers_of_points = [0, 0]
+    xdmf_lines = ['<?xml version="1.0" ?>\n',
+                  '<!DOCTYPE Xdmf SYSTEM "Xdmf.dtd">\n',
+                  '<Xdmf Version="2.0">\n<Domain>\n',
+                  '<Grid Name="Evolution" GridType="Collection" '
+                  'CollectionType="Temporal">\n']
+    with h5py.File(h5_file_name + '.tmp', 'w') as h5_file:
+        for time_step_index, grids in enumerate(xdmf_index.time_steps):
+            topology_id = topology_ids[time_step_index]
+            geometry_id = geometry_ids[time_step_index]
+            if topology_id not in layouts:
+                layouts[topology_id] = [compute_level_layout(
+                    read_data_items([grid.connectivity]).reshape(
+                        grid.number_of_elements, -1), points_per_dimension)
+                    for grid in grids]
+            xdmf_lines.append('  <Grid Name="Grids" GridType="Collection">\n'
+                              '    <Time Value="{0!r}"/>\n'.format(
+                                  float(xdmf_index.times[time_step_index])))
+            for grid_index, (grid, (point_ids, cells)) in enumerate(
+                    zip(grids, layouts[topology_id])):
+                indent = '        '
+                xdmf_lines.append(
+                    '    <Grid Name={0} GridType="Uniform">\n'
+                    '      <Topology TopologyType="Hexahedron" '
+                    'NumberOfElements="{1}">\n'.format(quoteattr(grid.name),
+                                                        len(cells)))
+                xdmf_lines.append(get_data_item(
+                    h5_file, h5_file_name, '/topology_{0}/grid_{1}/'
+                    'connectivity'.format(topology_id, grid_index),
+                    cells.astype(np.int32), indent))
+                xdmf_lines.append('      </Topology>\n      <Geometry '
+                                  'Type="{0}">\n'.format(
+                                      'XYZ' if len(grid.coordinates) == 1
+                                      else 'X_Y_Z'))
+                # The points kept depend on the topology too
+                geometry_path = '/geometry_{0}_topology_{1}/grid_{2}/'.format(
+                    geometry_id, topology_id, grid_index)
+                for coordinate_index, coordinate in enumerate(
+                        grid.coordinates):
+                    path = geometry_path + 'coordinates_' +\
+                        str(coordinate_index)
+                    if path not in h5_file:
+                        values = read_data_items([coordinate])
+                        if len(grid.coordinates) == 1:
+                            values = values.reshape(-1, 3)
+                        values = values[point_ids]
+                    else:
+                        values = h5_file[path]
+                    xdmf_lines.append(get_data_item(
+                        h5_file, h5_file_name, path, values, indent))
+                xdmf_lines.append('      </Geometry>\n')
+                for attribute_name, attribute in sorted(
+                        grid.attributes.items()):
+                    values = read_data_items([attribute])
+                    if len(attribute.dimensions) > 1:
+                        values = values.reshape(-1, attribute.dimensions[-1])
+                    if len(values) <= point_ids.max():
+                        print('Skipping', attribute_name, ': not one value '
+                              'per point')
+                        continue
+                    xdmf_lines.append(
+                        '      <Attribute Name={0} AttributeType="{1}" '
+                        'Center="Node">\n'.format(
+                            quoteattr(attribute_name),
+                            'Scalar' if values.ndim == 1 else 'Vector'))
+                    xdmf_lines.append(get_data_item(
+                        h5_file, h5_file_name, '/time_step_{0}/grid_{1}/'
+                        '{2}'.format(time_step_index, grid_index,
+                                     attribute_name),
+                        values[point_ids], indent))
+                    xdmf_lines.append('      </Attribute>\n')
+                xdmf_lines.append('    </Grid>\n')
+                numbers_of_points[0] += get_number_of_points(grid)
+                numbers_of_points[1] += len(point_ids)
+            xdmf_lines.append('  </Grid>\n')
+    xdmf_lines.append('</Grid>\n</Domain>\n</Xdmf>\n')
+    os.rename(h5_file_name + '.tmp', h5_file_name)
+    with open(level_file_name + '.tmp', 'w') as level_file:
+        level_file.writelines(xdmf_lines)
+    os.rename(level_file_name + '.tmp', level_file_name)
+    return numbers_of_points
+
+
+def parse_cmd_line():
+    '''
+    parse command-line arguments
+    :return: dictionary of the command-line args, dashes are underscores
+    '''
+    parser = argparse.ArgumentParser(
+        description='Build coarser levels of an XDMF file, read instead of '
+        'it with Level_of_detail in the yaml input file',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('xdmf_file', type=str,
+                        help="path to the XDMF (.xmf) file")
+    parser.add_argument('--points-per-dimension', type=int, nargs='+',
+                        default=LEVELS,
+                        help="points per element dimension of each level, "
+                        "2 keeps the element corners only")
+    return vars(parser.parse_args())
+
+
+def main(args):
+    '''
+    :param args: command line arguments
+    '''
+    for points_per_dimension in args["points_per_dimension"]:
+        if points_per_dimension < 2:
+            print('Skipping level', points_per_dimension, ': an element '
+                  'needs at least 2 points per dimension')
+            continue
+        start_time = time.time()
+        original_points, level_points = write_level(args["xdmf_file"],
+                                                    points_per_dimension)
+        print('Wrote {0}: {1:.1%} of the points in {2:.2f} s'.format(
+            get_level_file_name(args["xdmf_file"], points_per_dimension),
+            level_points / float(max(original_points, 1)),
+            time.time() - start_time))
+    return None
+
+
+if __name__ == "__main__":
+    try:
+        main(parse_cmd_line())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,496 @@
+#!/usr/bin/env python
+
+# Distributed under the MIT License.
+# See LICENSE.txt for details.
+
+import hashlib
+import multiprocessing
+import os
+import pickle
+import numpy as np
+from XdmfIndex import get_file_key
+
+# Number of histogram bins used to estimate percentiles
+PERCENTILE_BINS = 4096
+# Number of values of each connectivity dataset hashed to tell whether
+# the topology changed between time steps, in blocks of
+# TOPOLOGY_SAMPLE_BLOCK values spread over the dataset. The coordinates
+# are hashed in full, a moving mesh keeps its connectivity but may move
+# any of its points.
+TOPOLOGY_SAMPLE_SIZE = 8192
+TOPOLOGY_SAMPLE_BLOCK = 256
+
+# Functions that scan the HDF5 data referenced by an XdmfIndex directly
+# with h5py and numpy, without loading VTK meshes. Results are cached in
+# a sidecar next to the XDMF file, see get_scan_cache_name.
+
+
+def get_scan_cache_name(xdmf_file_name):
+    '''
+    Name of the file caching scan results next to an XDMF file
+    '''
+    return xdmf_file_name + '.scan'
+
+
+def get_data_key(xdmf_index):
+    '''
+    Modification times and sizes of the XDMF file and of every HDF5 file
+    it references, cached scans are reused only while these are unchanged
+    '''
+    h5_file_names = sorted(set(data_item.file_name
+                               for grids in xdmf_index.time_steps
+                               for grid in grids
+                               for data_item in [grid.connectivity] +
+                               grid.coordinates +
+                               list(grid.attributes.values())))
+    return (get_file_key(xdmf_index.xdmf_file_name),) +\
+        tuple(get_file_key(file_name) for file_name in h5_file_names)
+
+
+def read_scan_cache(xdmf_index, scan_key):
+    '''
+    Cached result of the scan identified by scan_key (a tuple of the scan
+    name and its parameters), or None if the data changed since
+    '''
+    try:
+        with open(get_scan_cache_name(xdmf_index.xdmf_file_name),
+                  'rb') as scan_cache:
+            cached_scans = pickle.load(scan_cache)
+    except Exception:
+        return None
+    data_key, result = cached_scans.get(scan_key, (None, None))
+    if data_key != get_data_key(xdmf_index):
+        return None
+    return result
+
+
+def write_scan_cache(xdmf_index, scan_key, result):
+    '''
+    Add the result of a scan to the cache. Workers scanning at once take
+    turns (on systems with fcntl), each adds its result to the others'.
+    '''
+    scan_cache_name = get_scan_cache_name(xdmf_index.xdmf_file_name)
+    lock_file = None
+    try:
+        import fcntl
+        lock_file = open(scan_cache_name + '.lock', 'a')
+        fcntl.lockf(lock_file, fcntl.LOCK_EX)
+    except (ImportError, IOError, OSError):
+        pass
+    try:
+        try:
+            with open(scan_cache_name, 'rb') as scan_cache:
+                cached_scans = pickle.load(scan_cache)
+        except Exception:
+            cached_scans = {}
+        cached_scans[scan_key] = (get_data_key(xdmf_index), result)
+        temporary_name = scan_cache_name + '.tmp' + str(os.getpid())
+        with open(temporary_name, 'wb') as scan_cache:
+            pickle.dump(cached_scans, scan_cache, protocol=2)
+        os.rename(temporary_name, scan_cache_name)
+    except (IOError, OSError):
+        print('Could not write the scan cache', scan_cache_name)
+    finally:
+        # Closing the lock file releases the lock
+        if lock_file is not None:
+            lock_file.close()
+    return None
+
+
+def read_data_items(data_items):
+    '''
+    Read HDF5 datasets, opening each file once, and return them
+    concatenated in order into one flat array. Floating point datasets
+    declared single precision in the XDMF file are read as float32, as
+    the XDMF reader does (see SinglePrecision): the HDF5 library converts
+    them into a float32 buffer, the doubles are never held in memory.
+    '''
+    import h5py
+    arrays = [None] * len(data_items)
+    for file_name in sorted(set(data_item.file_name
+                                for data_item in data_items)):
+        with h5py.File(file_name, 'r') as h5_file:
+            for index, data_item in enumerate(data_items):
+                if data_item.file_name != file_name:
+                    continue
+                dataset = h5_file[data_item.path]
+                if data_item.number_type == 'Float' and\
+                   data_item.precision == 4 and dataset.dtype.kind == 'f':
+                    values = np.empty(dataset.shape, dtype=np.float32)
+                    if values.size > 0:
+                        dataset.read_direct(values)
+                    arrays[index] = values.ravel()
+                else:
+                    arrays[index] = dataset[...].ravel()
+    return np.concatenate(arrays)
+
+
+def get_variable_data_items(xdmf_index, variable):
+    '''
+    Per time step, the DataItems holding variable in every grid
+    '''
+    return [[grid.attributes[variable] for grid in grids]
+            for grids in xdmf_index.time_steps]
+
+
+def compute_range(data_items):
+    '''
+    Minimum and maximum of the finite values of some datasets
+    '''
+    values = read_data_items(data_items)
+    values = values[np.isfinite(values)]
+    if values.size == 0:
+        return (np.inf, -np.inf)
+    return (float(values.min()), float(values.max()))
+
+
+def compute_histogram(arguments):
+    '''
+    Counts of the values of some datasets in bins
+    '''
+    data_items, bin_edges = arguments
+    return np.histogram(read_data_items(data_items), bins=bin_edges)[0]
+
+
+def map_time_steps(function, arguments, number_of_processes):
+    '''
+    Map function over the per time step arguments, on a pool of
+    processes if number_of_processes > 1
+    '''
+    if number_of_processes is None:
+        number_of_processes = multiprocessing.cpu_count()
+    number_of_processes = min(number_of_processes, len(arguments))
+    if number_of_processes <= 1:
+        return [function(argument) for argument in arguments]
+    pool = multiprocessing.Pool(number_of_processes)
+    try:
+        return pool.map(function, arguments)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def scan_variable_range(xdmf_index, variable, number_of_processes=None):
+    '''
+    Minimum and maximum of variable over every time step, computed in
+    parallel over the time steps' HDF5 datasets and cached
+    '''
+    scan_key = ('Range', variable)
+    variable_range = read_scan_cache(xdmf_index, scan_key)
+    if variable_range is not None:
+        return variable_range
+    time_step_ranges = map_time_steps(
+        compute_range, get_variable_data_items(xdmf_index, variable),
+        number_of_processes)
+    variable_range = (min(minimum for minimum, maximum in time_step_ranges),
+                      max(maximum for minimum, maximum in time_step_ranges))
+    write_scan_cache(xdmf_index, scan_key, variable_range)
+    return variable_range
+
+
+def scan_variable_histogram(xdmf_index, variable, number_of_bins,
+                            number_of_processes=None):
+    '''
+    Counts of variable over every time step in number_of_bins bins
+    spanning its global range. Returns (counts, bin_edges), cached.
+    '''
+    scan_key = ('Histogram', variable, number_of_bins)
+    histogram = read_scan_cache(xdmf_index, scan_key)
+    if histogram is not None:
+        return histogram
+    variable_min, variable_max = scan_variable_range(xdmf_index, variable,
+                                                     number_of_processes)
+    bin_edges = np.linspace(variable_min, variable_max, number_of_bins + 1)
+    counts = np.sum(map_time_steps(
+        compute_histogram,
+        [(data_items, bin_edges) for data_items
+         in get_variable_data_items(xdmf_index, variable)],
+        number_of_processes), axis=0)
+    histogram = (counts, bin_edges)
+    write_scan_cache(xdmf_index, scan_key, histogram)
+    return histogram
+
+
+def scan_variable_percentiles(xdmf_index, variable, percentiles,
+                              number_of_processes=None):
+    '''
+    Percentiles (between 0 and 100) of variable over every time step,
+    interpolated in a fine histogram so the data is only streamed through
+    rather than held in memory
+    '''
+    counts, bin_edges = scan_variable_histogram(
+        xdmf_index, variable, PERCENTILE_BINS, number_of_processes)
+    cumulative_fraction = np.concatenate(
+        [[0.0], np.cumsum(counts) / float(max(np.sum(counts), 1))])
+    return [float(np.interp(percentile / 100.0, cumulative_fraction,
+                            bin_edges)) for percentile in percentiles]
+
+
+def hash_dataset(h5_file, data_item, topology_hash, sample_size):
+    '''
+    Add the shape and type of a dataset, and its values, to topology_hash.
+    Datasets with more than sample_size values only have sample_size of
+    them hashed, in blocks spread evenly over the dataset.
+    '''
+    dataset = h5_file[data_item.path]
+    topology_hash.update(repr((dataset.shape, dataset.dtype.str))
+                         .encode('utf-8'))
+    if sample_size is None or dataset.size <= sample_size or\
+       len(dataset.shape) != 1:
+        topology_hash.update(np.ascontiguousarray(dataset[...]))
+        return None
+    block_size = min(TOPOLOGY_SAMPLE_BLOCK, sample_size)
+    for start in np.linspace(0, dataset.size - block_size,
+                             sample_size // block_size).astype(int):
+        topology_hash.update(np.ascontiguousarray(
+            dataset[start:start + block_size]))
+    return None
+
+
+def compute_mesh_hashes(arguments):
+    '''
+    Hashes of the connectivity (sampled) and of the coordinates (all of
+    them) of every grid of a time step
+    '''
+    grids, sample_size = arguments
+    import h5py
+    connectivity_hash = hashlib.sha1()
+    coordinates_hash = hashlib.sha1()
+    for grid in grids:
+        connectivity_hash.update(repr(grid.number_of_elements)
+                                 .encode('utf-8'))
+        with h5py.File(grid.connectivity.file_name, 'r') as h5_file:
+            hash_dataset(h5_file, grid.connectivity, connectivity_hash,
+                         sample_size)
+        for coordinate in grid.coordinates:
+            with h5py.File(coordinate.file_name, 'r') as h5_file:
+                hash_dataset(h5_file, coordinate, coordinates_hash, None)
+    return connectivity_hash.hexdigest(), coordinates_hash.hexdigest()
+
+
+def get_first_ids(hashes):
+    '''
+    For each hash, the index of its first occurrence
+    '''
+    first_ids = {}
+    return [first_ids.setdefault(hash_value, index)
+            for index, hash_value in enumerate(hashes)]
+
+
+def scan_mesh_changes(xdmf_index, sample_size=TOPOLOGY_SAMPLE_SIZE,
+                      number_of_processes=None):
+    '''
+    Which time steps share their mesh. Returns, per time step, the
+    topology id and the geometry id: the index of the first time step with
+    the same connectivity, and with the same connectivity and coordinates.
+    The datasets are compared by shape and a hash of their values, of
+    sample_size of them for the connectivity (of all of them if
+    sample_size is None), cached.
+    '''
+    # Not the key of the ids computed from sampled coordinates
+    scan_key = ('Mesh_changes', sample_size, 'Full_coordinates')
+    mesh_ids = read_scan_cache(xdmf_index, scan_key)
+    if mesh_ids is not None:
+        return mesh_ids
+    mesh_hashes = map_time_steps(
+        compute_mesh_hashes, [(grids, sample_size)
+                              for grids in xdmf_index.time_steps],
+        number_of_processes)
+    mesh_ids = (get_first_ids([connectivity_hash for connectivity_hash,
+                               coordinates_hash in mesh_hashes]),
+                get_first_ids(mesh_hashes))
+    write_scan_cache(xdmf_index, scan_key, mesh_ids)
+    return mesh_ids
+
+
+def get_geometry_unchanged(xdmf_index, sample_size=TOPOLOGY_SAMPLE_SIZE,
+                           number_of_processes=None):
+    '''
+    Per time step, True if its mesh (connectivity and coordinates) is the
+    same as the previous time step's, so filters that only depend on the
+    mesh need not run again
+    '''
+    geometry_ids = scan_mesh_changes(xdmf_index, sample_size,
+                                     number_of_processes)[1]
+    return [False] + [geometry_ids[index] == geometry_ids[index - 1]
+                      for index in range(1, len(geometry_ids))]
+
+
+def read_points(grids):
+    '''
+    (number of points, 3) coordinates of the points of some grids, in
+    order, from one XYZ dataset or X, Y and Z datasets per grid
+    '''
+    if len(grids[0].coordinates) == 1:
+        return read_data_items([grid.coordinates[0]
+                                for grid in grids]).reshape(-1, 3)
+    return np.column_stack([read_data_items([grid.coordinates[dimension]
+                                             for grid in grids])
+                            for dimension in range(3)])
+
+
+def compute_bounds(grids):
+    '''
+    [xmin, xmax, ymin, ymax, zmin, zmax] of the points of some grids
+    '''
+    points = read_points(grids)
+    return [float(bound) for dimension in range(3) for bound in
+            [points[:, dimension].min(), points[:, dimension].max()]]
+
+
+def scan_mesh_bounds(xdmf_index, number_of_processes=None):
+    '''
+    Bounds [xmin, xmax, ymin, ymax, zmin, zmax] of the mesh over every time
+    step, only reading each distinct geometry (see scan_mesh_changes), cached
+    '''
+    scan_key = ('Mesh_bounds',)
+    bounds = read_scan_cache(xdmf_index, scan_key)
+    if bounds is not None:
+        return bounds
+    geometry_ids = scan_mesh_changes(xdmf_index,
+                                     number_of_processes=number_of_processes)[1]
+    time_step_bounds = np.array(map_time_steps(
+        compute_bounds, [xdmf_index.time_steps[geometry_id]
+                         for geometry_id in sorted(set(geometry_ids))],
+        number_of_processes))
+    bounds = []
+    for dimension in range(3):
+        bounds += [float(time_step_bounds[:, 2 * dimension].min()),
+                   float(time_step_bounds[:, 2 * dimension + 1].max())]
+    write_scan_cache(xdmf_index, scan_key, bounds)
+    return bounds
+
+
+def get_first_cells(cells):
+    '''
+    First cell of each element of a grid's (number of cells, points per
+    cell) connectivity. The cells of an element follow one another, as in
+    SpECTRE data, and an element starts with a cell whose points all come
+    after those of the cell before. Other meshes are split the same way,
+    at worst into one element per cell.
+    '''
+    return np.concatenate([[0], np.nonzero(
+        cells[1:].min(axis=1) > cells[:-1].max(axis=1))[0] + 1])
+
+
+def compute_element_bounds(grids):
+    '''
+    Per grid, the first cell of each element (see get_first_cells) and
+    the (number of elements, 6) bounds [xmin, xmax, ymin, ymax, zmin,
+    zmax] of the elements
+    '''
+    element_bounds = []
+    for grid in grids:
+        cells = read_data_items([grid.connectivity]).reshape(
+            grid.number_of_elements, -1)
+        cell_points = read_points([grid])[cells]
+        first_cells = get_first_cells(cells)
+        lower = np.minimum.reduceat(cell_points.min(axis=1), first_cells)
+        upper = np.maximum.reduceat(cell_points.max(axis=1), first_cells)
+        element_bounds.append((first_cells, np.column_stack(
+            [lower[:, 0], upper[:, 0], lower[:, 1], upper[:, 1],
+             lower[:, 2], upper[:, 2]])))
+    return element_bounds
+
+
+def scan_element_bounds(xdmf_index, number_of_processes=None):
+    '''
+    Bounds of the elements of every grid, per topology id (see
+    scan_mesh_changes): for each grid of the topology's time steps, the
+    first cell of each element and its bounds over all the time steps with
+    the topology, so moving meshes keep one set of bounds. Only each
+    distinct geometry is read, cached.
+    '''
+    scan_key = ('Element_bounds',)
+    element_bounds = read_scan_cache(xdmf_index, scan_key)
+    if element_bounds is not None:
+        return element_bounds
+    topology_ids, geometry_ids = scan_mesh_changes(
+        xdmf_index, number_of_processes=number_of_processes)
+    geometries = sorted(set(zip(geometry_ids, topology_ids)))
+    if number_of_processes is None:
+        number_of_processes = multiprocessing.cpu_count()
+    # Geometries are read a few per process at a time, so the bounds of
+    # every geometry of a moving mesh are never held at once
+    batch_size = 4 * max(number_of_processes, 1)
+    element_bounds = {}
+    for batch_start in range(0, len(geometries), batch_size):
+        batch = geometries[batch_start:batch_start + batch_size]
+        for (geometry_id, topology_id), grid_bounds in zip(
+                batch, map_time_steps(
+                    compute_element_bounds,
+                    [xdmf_index.time_steps[geometry_id]
+                     for geometry_id, topology_id in batch],
+                    number_of_processes)):
+            if topology_id not in element_bounds:
+                element_bounds[topology_id] = grid_bounds
+                continue
+            for (first_cells, bounds), (other_first_cells, other_bounds)\
+                    in zip(element_bounds[topology_id], grid_bounds):
+                bounds[:, 0::2] = np.minimum(bounds[:, 0::2],
+                                             other_bounds[:, 0::2])
+                bounds[:, 1::2] = np.maximum(bounds[:, 1::2],
+                                             other_bounds[:, 1::2])
+    write_scan_cache(xdmf_index, scan_key, element_bounds)
+    return element_bounds
+
+
+def get_lattice_hexahedra(extents):
+    '''
+    (number of hexahedra, 8) point ids of the hexahedra between the
+    points of a lattice of extents points, with x varying fastest, in the
+    order SpECTRE writes the cells of an element
+    '''
+    corners = np.array([0, 1, 1 + extents[0], extents[0]])
+    corners = np.concatenate([corners, corners + extents[0] * extents[1]])
+    k, j, i = np.meshgrid(np.arange(extents[2] - 1),
+                          np.arange(extents[1] - 1),
+                          np.arange(extents[0] - 1), indexing='ij')
+    first_points = (i + extents[0] * (j + extents[1] * k)).ravel()
+    return first_points[:, np.newaxis] + corners
+
+
+def get_element_layouts(hexahedra):
+    '''
+    First hexahedron, first point and numbers of points per dimension of
+    each element of a grid of the hexahedra between the points of each
+    element's lattice, as SpECTRE writes them: the points of an element
+    follow one another with x varying fastest, and so do its hexahedra.
+    An element starts with a hexahedron whose first point comes after all
+    points of the previous hexahedron. Raises ValueError if the cells are
+    not laid out this way.
+    '''
+    not_elements = ValueError("The cells are not the point lattices of "
+                              "elements, they cannot be made Lagrange "
+                              "hexahedra")
+    if hexahedra is None or len(hexahedra) == 0:
+        raise not_elements
+    first_hexahedra = np.concatenate(
+        [[0], np.nonzero(hexahedra[1:, 0] > hexahedra[:-1, 6])[0] + 1])
+    numbers_of_hexahedra = np.diff(np.append(first_hexahedra,
+                                             len(hexahedra)))
+    first_points = hexahedra[first_hexahedra, 0]
+    x_extents = hexahedra[first_hexahedra, 3] - first_points
+    xy_extents = hexahedra[first_hexahedra, 4] - first_points
+    if np.any(x_extents < 2) or np.any(xy_extents % x_extents != 0):
+        raise not_elements
+    y_extents = xy_extents // x_extents
+    if np.any(y_extents < 2):
+        raise not_elements
+    xy_cells = (x_extents - 1) * (y_extents - 1)
+    if np.any(numbers_of_hexahedra % xy_cells != 0):
+        raise not_elements
+    extents = np.column_stack([x_extents, y_extents,
+                               numbers_of_hexahedra // xy_cells + 1])
+    # Check every cell against the lattice of its element
+    for element_extents in set(map(tuple, extents)):
+        elements = np.nonzero(np.all(extents == element_extents, axis=1))[0]
+        lattice_hexahedra = get_lattice_hexahedra(element_extents)
+        element_hexahedra = hexahedra[first_hexahedra[elements, np.newaxis] +
+                                      np.arange(len(lattice_hexahedra))]
+        if not np.array_equal(element_hexahedra -
+                              first_points[elements, np.newaxis, np.newaxis],
+                              np.broadcast_to(lattice_hexahedra,
+                                              element_hexahedra.shape)):
+            raise not_elements
+    return first_hexahedra, first_points, extents
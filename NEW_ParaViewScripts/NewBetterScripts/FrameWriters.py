@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+
+# Distributed under the MIT License.
+# See LICENSE.txt for details.
+
+import os
+import struct
+import subprocess
+import sys
+import threading
+import zlib
+import numpy as np
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    from shutil import which
+except ImportError:
+    from distutils.spawn import find_executable as which
+
+# Functions and classes that write rendered frames held in memory
+# as (height, width, 3) uint8 RGB numpy arrays, top row first
+
+
+def capture_frame(render_view, image_resolution):
+    '''
+    Render the view at image_resolution and return the frame buffer
+    as an RGB numpy array
+    '''
+    from paraview.vtk.util.numpy_support import vtk_to_numpy
+    render_view.ViewSize = image_resolution
+    image = render_view.SMProxy.CaptureImage(1)
+    width, height = image.GetDimensions()[:2]
+    pixels = vtk_to_numpy(image.GetPointData().GetScalars())
+    pixels = pixels.reshape(height, width, -1)[:, :, :3]
+    # VTK images start at the bottom row
+    return np.ascontiguousarray(pixels[::-1])
+
+
+def png_chunk(chunk_type, data):
+    '''
+    A PNG chunk: length, type, data and CRC of type and data
+    '''
+    return struct.pack('>I', len(data)) + chunk_type + data +\
+        struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff)
+
+
+def compress_png_rows(frame, compression_level):
+    '''
+    zlib stream of the frame's rows, each prefixed with filter type 0
+    '''
+    height = frame.shape[0]
+    rows = np.hstack([np.zeros((height, 1), dtype=np.uint8),
+                      frame.reshape(height, -1)])
+    return zlib.compress(rows.tobytes(), compression_level)
+
+
+def png_header(frame):
+    '''
+    PNG signature and IHDR chunk for an 8-bit RGB frame
+    '''
+    height, width = frame.shape[:2]
+    return b'\x89PNG\r\n\x1a\n' + png_chunk(
+        b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+
+def encode_png(frame, compression_level):
+    '''
+    Complete PNG file of the frame. zlib releases the GIL while
+    compressing, so several writer threads compress in parallel.
+    '''
+    return png_header(frame) +\
+        png_chunk(b'IDAT', compress_png_rows(frame, compression_level)) +\
+        png_chunk(b'IEND', b'')
+
+
+def encode_image(frame, image_format, compression_level, quality):
+    '''
+    Encode a frame as 'PNG', 'JPEG' or 'WebP'. JPEG and WebP need Pillow,
+    ImportError is raised without it.
+    '''
+    if image_format == 'PNG':
+        return encode_png(frame, compression_level)
+    from PIL import Image
+    import io
+    image_buffer = io.BytesIO()
+    Image.fromarray(frame).save(image_buffer, format=image_format.upper(),
+                                quality=quality)
+    return image_buffer.getvalue()
+
+
+class ImageWriter():
+    def __init__(self, image_format, compression_level=6, quality=90,
+                 number_of_threads=4, on_written=None):
+        '''
+        Compresses and writes frames on a pool of background threads so
+        the next time step renders meanwhile. At most twice as many frames
+        as threads wait in memory, write_image blocks when the pool falls
+        behind. on_written(file_name) is called, one call at a time, once
+        an image is completely on disk.
+        '''
+        # Checked here, the writer threads cannot exit the script
+        if image_format != 'PNG':
+            try:
+                import PIL
+            except ImportError:
+                sys.exit("Saving " + image_format + " images needs Pillow "
+                         "(pip install pillow)")
+        self.image_format = image_format
+        self.compression_level = compression_level
+        self.quality = quality
+        self.on_written = on_written
+        self.frame_queue = queue.Queue(maxsize=2 * number_of_threads)
+        self.on_written_lock = threading.Lock()
+        self.error = None
+        self.threads = []
+        for thread_index in range(number_of_threads):
+            thread = threading.Thread(target=self.write_images)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def write_images(self):
+        while True:
+            item = self.frame_queue.get()
+            if item is None:
+                return None
+            frame, file_name = item
+            if self.error is not None:
+                continue
+            try:
+                image_data = encode_image(frame, self.image_format,
+                                          self.compression_level,
+                                          self.quality)
+                # Written under a temporary name so that a killed job
+                # never leaves a truncated image behind
+                with open(file_name + '.tmp', 'wb') as image_file:
+                    image_file.write(image_data)
+                os.rename(file_name + '.tmp', file_name)
+                if self.on_written is not None:
+                    with self.on_written_lock:
+                        self.on_written(file_name)
+            except Exception as error:
+                # Raised in the rendering thread by write_image/close
+                self.error = error
+
+    def write_image(self, frame, file_name):
+        if self.error is not None:
+            raise self.error
+        self.frame_queue.put((frame, file_name))
+
+    def close(self):
+        for thread in self.threads:
+            self.frame_queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+        return None
+
+
+class FfmpegEncoder():
+    def __init__(self, file_name, frame_rate):
+        '''
+        Encodes raw frames piped to an ffmpeg subprocess, the codec is
+        chosen from the extension of file_name (.mp4 or .webm)
+        '''
+        self.file_name = file_name
+        self.frame_rate = frame_rate
+        self.process = None
+
+    def write(self, frame):
+        if self.process is None:
+            self.start(frame.shape[1], frame.shape[0])
+        self.process.stdin.write(frame.tobytes())
+
+    def start(self, width, height):
+        if self.file_name.endswith('.webm'):
+            codec = ['-c:v', 'libvpx-vp9', '-b:v', '0', '-crf', '30']
+        else:
+            codec = ['-c:v', 'libx264', '-crf', '18']
+        command = ['ffmpeg', '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+                   '-s', '{0}x{1}'.format(width, height),
+                   '-r', str(self.frame_rate), '-i', '-'] + codec +\
+                  ['-pix_fmt', 'yuv420p',
+                   # yuv420p needs an even width and height
+                   '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',
+                   self.file_name]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def close(self):
+        if self.process is None:
+            return None
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            sys.exit("ffmpeg failed to encode " + self.file_name)
+        return None
+
+
+class AnimatedPngEncoder():
+    def __init__(self, file_name, frame_rate, compression_level=6):
+        '''
+        Pure-Python fallback when ffmpeg is not available: writes the
+        frames to an animated PNG (APNG), which browsers play as a movie
+        '''
+        self.file_name = file_name
+        self.frame_rate = frame_rate
+        self.compression_level = compression_level
+        self.output = None
+        self.number_of_frames = 0
+        self.sequence_number = 0
+
+    def write(self, frame):
+        height, width = frame.shape[:2]
+        if self.output is None:
+            self.output = open(self.file_name, 'wb')
+            self.output.write(png_header(frame))
+            # The number of frames is patched in on close
+            self.animation_control_offset = self.output.tell()
+            self.output.write(png_chunk(b'acTL', struct.pack('>II', 0, 0)))
+        # Frame control: sequence, size, offset, delay, dispose, blend
+        self.output.write(png_chunk(b'fcTL', struct.pack(
+            '>IIIIIHHBB', self.sequence_number, width, height, 0, 0,
+            1, int(self.frame_rate), 0, 0)))
+        self.sequence_number += 1
+        image_data = compress_png_rows(frame, self.compression_level)
+        if self.number_of_frames == 0:
+            self.output.write(png_chunk(b'IDAT', image_data))
+        else:
+            self.output.write(png_chunk(
+                b'fdAT', struct.pack('>I', self.sequence_number) + image_data))
+            self.sequence_number += 1
+        self.number_of_frames += 1
+
+    def close(self):
+        if self.output is None:
+            return None
+        self.output.write(png_chunk(b'IEND', b''))
+        self.output.seek(self.animation_control_offset)
+        self.output.write(png_chunk(
+            b'acTL', struct.pack('>II', self.number_of_frames, 0)))
+        self.output.close()
+        return None
+
+
+class VideoWriter():
+    def __init__(self, file_name, frame_rate, max_queued_frames=8):
+        '''
+        Encodes frames on a background thread so that rendering the next
+        frame overlaps with encoding. At most max_queued_frames frames wait
+        in memory, write_frame blocks when the encoder falls behind.
+        Uses ffmpeg if it is installed and an animated PNG otherwise.
+        '''
+        if which('ffmpeg') is not None:
+            self.file_name = file_name
+            self.encoder = FfmpegEncoder(file_name, frame_rate)
+        else:
+            self.file_name = os.path.splitext(file_name)[0] + '.apng'
+            print('ffmpeg not found, writing an animated PNG to ' +
+                  self.file_name)
+            self.encoder = AnimatedPngEncoder(self.file_name, frame_rate)
+        self.frame_queue = queue.Queue(maxsize=max_queued_frames)
+        self.error = None
+        self.thread = threading.Thread(target=self.encode_frames)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def encode_frames(self):
+        while True:
+            frame = self.frame_queue.get()
+            if frame is None:
+                return None
+            if self.error is not None:
+                continue
+            try:
+                self.encoder.write(frame)
+            except Exception as error:
+                # Raised in the rendering thread by write_frame/close
+                self.error = error
+
+    def write_frame(self, frame):
+        if self.error is not None:
+            raise self.error
+        self.frame_queue.put(frame)
+
+    def close(self):
+        self.frame_queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        self.encoder.close()
+        return None
+
+
+def concatenate_videos(part_file_names, file_name):
+    '''
+    Join the videos written by several workers, in order, without
+    re-encoding. Returns False, listing the parts left behind, if ffmpeg
+    is not available or fails.
+    '''
+    if which('ffmpeg') is None:
+        # The workers wrote animated PNGs instead (see VideoWriter)
+        print_parts_left(file_name, [os.path.splitext(part_file_name)[0] +
+                                     '.apng' for part_file_name
+                                     in part_file_names])
+        return False
+    list_file_name = file_name + '.parts.txt'
+    with open(list_file_name, 'w') as list_file:
+        for part_file_name in part_file_names:
+            list_file.write("file '" + os.path.abspath(part_file_name) + "'\n")
+    exit_code = subprocess.call(['ffmpeg', '-y', '-loglevel', 'error',
+                                 '-f', 'concat', '-safe', '0',
+                                 '-i', list_file_name, '-c', 'copy',
+                                 file_name])
+    os.remove(list_file_name)
+    if exit_code != 0:
+        print_parts_left(file_name, part_file_names)
+        return False
+    for part_file_name in part_file_names:
+        os.remove(part_file_name)
+    return True
+
+
+def print_parts_left(file_name, part_file_names):
+    '''
+    Tell which parts could not be joined into file_name
+    '''
+    print('Could not join the parts into ' + file_name + ', left behind:')
+    for part_file_name in part_file_names:
+        print('  ' + part_file_name)
+    return None
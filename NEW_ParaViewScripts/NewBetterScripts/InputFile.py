@@ -2,6 +2,7 @@
 # Distributed under the MIT License.
 # See LICENSE.txt for details.
 
+import os
 import yaml
 
 
@@ -12,6 +13,21 @@ class InputFile():
         set input file data as attributes of an InputFile object
         '''
         self.pv_file_path = input_dict["File_path"]
+        # Optional, points per element dimension of the coarser level of
+        # File_path read instead of it (built by DataPyramid.py)
+        self.pv_level_of_detail = input_dict.get("Level_of_detail", None)
+        # Optional, read the coordinates and attributes as float32 (see
+        # SinglePrecision), halving the memory of the data
+        self.pv_single_precision = input_dict.get("Single_precision", False)
+        # Optional, where computed transfer functions (and other results
+        # that are reused between runs) are cached
+        self.pv_cache_directory = os.path.expanduser(input_dict.get(
+            "Cache_directory", "~/.cache/pv_visualization"))
+        # Optional, weld the points neighboring elements share before
+        # clips, slices and glyphs, those closer than Weld_tolerance times
+        # the size of the mesh
+        self.pv_weld_points = input_dict.get("Weld_points", False)
+        self.pv_weld_tolerance = input_dict.get("Weld_tolerance", 1e-8)
         self.pv_scalar_variable_properties = ScalarVariableProperties(
             input_dict["Scalar_variable_properties"])
         self.pv_vector_variable_properties = VectorVariableProperties(
@@ -33,6 +49,24 @@ class ScalarVariableProperties():
         self.pv_representation = pv_scalar_variable_properties["Representation"]
         self.pv_color_map = pv_scalar_variable_properties["Color_map"]
         self.pv_opacity = Opacity(pv_scalar_variable_properties["Opacity"])
+        # Optional, range of the color map and opacity function:
+        # 'First_timestep' or 'Global' (over all time steps)
+        self.pv_data_range = pv_scalar_variable_properties.get(
+            "Data_range", "First_timestep")
+        # Optional [low, high] percentiles clipping a 'Global' range
+        self.pv_range_percentiles = pv_scalar_variable_properties.get(
+            "Range_percentiles", None)
+        # Optional, points of the image a 'ResampledVolume' representation
+        # resamples the variable onto
+        self.pv_resample_resolution = pv_scalar_variable_properties.get(
+            "Resample_resolution", [128, 128, 128])
+        # Optional, cells the elements are shown as: 'Tetrahedra' or
+        # 'Lagrange' (one Lagrange hexahedron per element), and how many
+        # times ParaView subdivides Lagrange cells when rendering them
+        self.pv_element_cells = pv_scalar_variable_properties.get(
+            "Element_cells", "Tetrahedra")
+        self.pv_subdivision_level = pv_scalar_variable_properties.get(
+            "Subdivision_level", 1)
 
 
 class Opacity():
@@ -43,6 +77,12 @@ class Opacity():
         '''
         self.pv_function_type = pv_opacity["Function_type"]
         self.pv_value = pv_opacity["Value"]
+        # Optional, number of histogram bins for 'Histogram'
+        self.pv_number_of_bins = pv_opacity.get("Number_of_bins", 64)
+        # Optional, the opacity function is simplified to the fewest
+        # points within Tolerance of it, and at most Max_points
+        self.pv_tolerance = pv_opacity.get("Tolerance", 0.005)
+        self.pv_max_points = pv_opacity.get("Max_points", None)
 
 
 class VectorVariableProperties():
@@ -65,6 +105,9 @@ class Filters():
         '''
         self.pv_clip = Clip(pv_filters["Clip"])
         self.pv_slice = Slice(pv_filters["Slice"])
+        # Optional, only read the elements the clip or slice can touch
+        self.pv_region_of_interest = pv_filters.get("Region_of_interest",
+                                                    False)
 
 
 class Clip():
@@ -128,3 +171,18 @@ class SaveProperties():
         image(s) being saved
         '''
         self.pv_image_resolution = pv_save_properties["Image_resolution"]
+        # Optional, animations are saved as one png per timestep by default
+        self.pv_output_format = pv_save_properties.get("Output_format", "PNG")
+        self.pv_frame_rate = pv_save_properties.get("Frame_rate", 24)
+        # Image compression, done on background threads
+        self.pv_compression_level = pv_save_properties.get(
+            "Compression_level", 6)
+        self.pv_quality = pv_save_properties.get("Quality", 90)
+        self.pv_writer_threads = pv_save_properties.get("Writer_threads", 4)
+        # Optional selection of the timesteps rendered: those between
+        # Start_time and End_time, every Time_stride-th of them and at most
+        # Max_frames of these
+        self.pv_start_time = pv_save_properties.get("Start_time", None)
+        self.pv_end_time = pv_save_properties.get("End_time", None)
+        self.pv_time_stride = pv_save_properties.get("Time_stride", 1)
+        self.pv_max_frames = pv_save_properties.get("Max_frames", None)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+# Distributed under the MIT License.
+# See LICENSE.txt for details.
+
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# Block size used to read contiguous datasets into the page cache
+READ_BLOCK_SIZE = 4 * 1024**2
+
+
+def warm_data_item(h5_file, raw_file, data_item):
+    '''
+    Read one HDF5 dataset so that it is in the page cache when the reader
+    asks for it. Contiguous datasets are read as raw bytes at their offset
+    in the file, chunked or compressed datasets through h5py.
+    '''
+    dataset = h5_file[data_item.path]
+    offset = dataset.id.get_offset()
+    if offset is None:
+        dataset[...]
+        return None
+    raw_file.seek(offset)
+    remaining_bytes = dataset.id.get_storage_size()
+    while remaining_bytes > 0:
+        block = raw_file.read(min(READ_BLOCK_SIZE, remaining_bytes))
+        if not block:
+            break
+        remaining_bytes -= len(block)
+    return None
+
+
+class Prefetcher():
+    def __init__(self, xdmf_index, array_names=None):
+        '''
+        Reads the HDF5 datasets of upcoming time steps on a background
+        thread while the current one renders, so the reader's
+        UpdatePipeline is served from the page cache rather than the
+        (parallel) filesystem. Only the attributes in array_names are read
+        (all of them if None), as well as the connectivity and coordinates.
+        Needs h5py, without it prefetch does nothing.
+        '''
+        try:
+            import h5py
+            self.h5py = h5py
+        except ImportError:
+            print('h5py not found, time steps are not prefetched')
+            self.h5py = None
+        self.xdmf_index = xdmf_index
+        self.array_names = array_names
+        self.time_step_queue = queue.Queue()
+        if self.h5py is not None:
+            self.thread = threading.Thread(target=self.read_time_steps)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def read_time_steps(self):
+        while True:
+            time_step_index = self.time_step_queue.get()
+            if time_step_index is None:
+                return None
+            try:
+                self.read_time_step(time_step_index)
+            except Exception as error:
+                # Prefetching is only an optimization, the reader
+                # reports any real problem with the data
+                print('Could not prefetch time step', time_step_index,
+                      error)
+
+    def read_time_step(self, time_step_index):
+        data_items = self.xdmf_index.get_data_items(time_step_index,
+                                                    self.array_names)
+        for file_name in sorted(set(data_item.file_name
+                                    for data_item in data_items)):
+            with self.h5py.File(file_name, 'r') as h5_file:
+                with open(file_name, 'rb') as raw_file:
+                    for data_item in data_items:
+                        if data_item.file_name == file_name:
+                            warm_data_item(h5_file, raw_file, data_item)
+
+    def prefetch(self, time_step_index):
+        '''
+        Queue a time step to be read in the background. Ignored while
+        the previous one is still waiting, prefetching is then behind the
+        rendering and would only compete with the reader.
+        '''
+        if self.h5py is not None and self.time_step_queue.empty():
+            self.time_step_queue.put(time_step_index)
+
+    def close(self):
+        if self.h5py is not None:
+            self.time_step_queue.put(None)
+            self.thread.join()
+        return None
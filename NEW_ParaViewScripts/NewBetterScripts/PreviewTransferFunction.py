@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+# Distributed under the MIT License.
+# See LICENSE.txt for details.
+
+import argparse
+import sys
+import time
+import yaml
+import numpy as np
+import matplotlib as mpl
+mpl.use('Agg')
+import matplotlib.pyplot as plt
+# input file class
+from InputFile import InputFile
+from XdmfIndex import get_xdmf_index
+from DataScan import compute_range, get_variable_data_items,\
+    scan_variable_histogram, scan_variable_percentiles, scan_variable_range
+from TransferFunctions import evaluate_opacity, simplify_curve
+
+# Plots the opacity function set_opacity would build from an input file,
+# over the histogram of the variable, without ParaView: the data is read
+# straight from the HDF5 files (and the scans cached, see DataScan), so
+# opacity parameters can be tried out in a fraction of a second.
+
+
+def parse_cmd_line():
+    '''
+    parse command-line arguments
+    :return: dictionary of the command-line args, dashes are underscores
+    '''
+    parser = argparse.ArgumentParser(
+        description='Preview the opacity function of a yaml input file '
+        'without ParaView',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--input-file', type=str, required=True,
+                        help="provide path to "
+                        "yaml file containing visualization parameters")
+    parser.add_argument('--save', type=str, default='opacity_preview.png',
+                        help="name of the png file to write")
+    parser.add_argument('--histogram-bins', type=int, default=128,
+                        help="number of bins of the plotted histogram")
+    # Override the Opacity of the input file, to try out parameters
+    # without editing it
+    parser.add_argument('--function-type', type=str, default=None,
+                        choices=['Constant', 'Proportional', 'Histogram'],
+                        help="opacity Function_type instead of the input "
+                        "file's")
+    parser.add_argument('--value', type=float, default=None,
+                        help="opacity Value instead of the input file's")
+    parser.add_argument('--number-of-bins', type=int, default=None,
+                        help="opacity Number_of_bins instead of the input "
+                        "file's")
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help="opacity Tolerance instead of the input file's")
+    parser.add_argument('--max-points', type=int, default=None,
+                        help="opacity Max_points instead of the input file's")
+    return vars(parser.parse_args())
+
+
+def load_input_file(input_file_name):
+    '''
+    InputFile of a yaml input file, with the opacity options of
+    the command line applied
+    '''
+    try:
+        with open(input_file_name, 'r') as input_stream:
+            input_dictionary = yaml.safe_load(input_stream)
+    except IOError as error:
+        sys.exit("Could not read the input file: " + str(error))
+    except yaml.YAMLError as error:
+        sys.exit("The input file cannot be parsed: " + str(error))
+    return InputFile(input_dictionary)
+
+
+def apply_overrides(opacity, args):
+    '''
+    Replace the Opacity parameters given on the command line
+    '''
+    if args["function_type"] is not None:
+        opacity.pv_function_type = args["function_type"]
+    if args["value"] is not None:
+        opacity.pv_value = args["value"]
+    if args["number_of_bins"] is not None:
+        opacity.pv_number_of_bins = args["number_of_bins"]
+    if args["tolerance"] is not None:
+        opacity.pv_tolerance = args["tolerance"]
+    if args["max_points"] is not None:
+        opacity.pv_max_points = args["max_points"]
+    return None
+
+
+def get_preview_range(xdmf_index, scalar_properties):
+    '''
+    Range the opacity function is built over, as in get_data_range:
+    over all time steps for a 'Global' Data_range, else the first one's
+    '''
+    variable = scalar_properties.pv_variable_name
+    if scalar_properties.pv_data_range != 'Global':
+        return compute_range(get_variable_data_items(xdmf_index, variable)[0])
+    if scalar_properties.pv_range_percentiles is not None:
+        return scan_variable_percentiles(
+            xdmf_index, variable, scalar_properties.pv_range_percentiles)
+    return scan_variable_range(xdmf_index, variable)
+
+
+def plot_preview(file_name, variable, histogram, var_values,
+                 opacity_function, kept, title):
+    '''
+    Plot the histogram of the variable (log scale) and, on a second axis,
+    the full opacity function and the control points ParaView gets
+    '''
+    counts, bin_edges = histogram
+    figure, histogram_axis = plt.subplots(figsize=(8, 5))
+    histogram_axis.fill_between(bin_edges, np.append(counts, counts[-1]),
+                                step='post', color='0.8', linewidth=0)
+    histogram_axis.set_yscale('symlog')
+    histogram_axis.set_xlabel(variable)
+    histogram_axis.set_ylabel('Number of points (all time steps)')
+    opacity_axis = histogram_axis.twinx()
+    opacity_axis.plot(var_values, opacity_function, color='C0',
+                      label='Opacity function')
+    opacity_axis.plot(var_values[kept], opacity_function[kept], 'o-',
+                      color='C3', markersize=3,
+                      label='{0} control points'.format(len(kept)))
+    opacity_axis.set_ylim(0.0, 1.05)
+    opacity_axis.set_ylabel('Opacity')
+    opacity_axis.legend(loc='upper right')
+    histogram_axis.set_title(title)
+    figure.tight_layout()
+    figure.savefig(file_name)
+    plt.close(figure)
+    return None
+
+
+def main(args):
+    '''
+    :param args: command line arguments
+    '''
+    start_time = time.time()
+    input_file = load_input_file(args["input_file"])
+    scalar_properties = input_file.pv_scalar_variable_properties
+    opacity = scalar_properties.pv_opacity
+    apply_overrides(opacity, args)
+    variable = scalar_properties.pv_variable_name
+    xdmf_index = get_xdmf_index(input_file.pv_file_path)
+    var_range = get_preview_range(xdmf_index, scalar_properties)
+    # The opacity histogram is over the global range, as in get_histogram
+    opacity_histogram = None
+    if opacity.pv_function_type == 'Histogram':
+        opacity_histogram = scan_variable_histogram(
+            xdmf_index, variable, opacity.pv_number_of_bins)
+    var_values, opacity_function = evaluate_opacity(
+        opacity.pv_function_type, opacity.pv_value, var_range,
+        opacity_histogram)
+    kept = simplify_curve(var_values, opacity_function, opacity.pv_tolerance,
+                          opacity.pv_max_points)
+    plot_preview(args["save"], variable,
+                 scan_variable_histogram(xdmf_index, variable,
+                                         args["histogram_bins"]),
+                 var_values, opacity_function, kept,
+                 '{0} opacity over [{1:.4g}, {2:.4g}]'.format(
+                     opacity.pv_function_type, var_range[0], var_range[1]))
+    print('Wrote {0} in {1:.2f} s'.format(args["save"],
+                                          time.time() - start_time))
+    return None
+
+
+if __name__ == "__main__":
+    try:
+        main(parse_cmd_line())
+    except KeyboardInterrupt:
+        pass
@@ -5,12 +5,34 @@
 
 from paraview.simple import *
 import argparse
+import glob
+import hashlib
 import sys
 import yaml
 import numpy as np
 import os
+import struct
+import subprocess
+import time
 # input file class
 from InputFile import InputFile
+from FrameWriters import ImageWriter, VideoWriter, capture_frame,\
+    concatenate_videos, which
+from Prefetcher import Prefetcher
+from XdmfIndex import get_xdmf_index
+from ConvertToVtkHdf import get_converted_file
+from DataPyramid import get_level_file_name
+from DataScan import scan_element_bounds, scan_mesh_bounds,\
+    scan_variable_histogram, scan_variable_percentiles, scan_variable_range
+from SinglePrecision import get_precision_report,\
+    get_single_precision_file_name, print_precision_report
+from RegionOfInterest import get_clip_region, get_region_grid_names,\
+    get_slice_region
+
+# Seconds rank 0 waits for the timings of the other ranks once it is done,
+# a rank that crashed never writes them
+TIMING_TIMEOUT = 1800.0
+
 
 def parse_cmd_line():
     '''
@@ -27,13 +49,35 @@ def parse_cmd_line():
                         help="set to the name of output file to be written."
                         "For animations this saves a png file at each timestep"
                         "and for stills, a png")
+    parser.add_argument('--number-of-workers', type=int, default=1,
+                        help="number of pvbatch processes to split the "
+                        "timesteps of an animation between. Each worker "
+                        "builds the pipeline once and renders its own frames")
+    parser.add_argument('--frame-distribution', type=str,
+                        default='round-robin',
+                        choices=['round-robin', 'blocks'],
+                        help="how timesteps are assigned to workers: "
+                        "every n-th timestep or contiguous blocks")
+    parser.add_argument('--worker-index', type=int, default=None,
+                        help="index of this worker, set by the launching "
+                        "process. Do not set by hand")
+    parser.add_argument('--pvbatch', type=str, default='pvbatch',
+                        help="executable used to launch the workers")
+    parser.add_argument('--no-prefetch', action='store_true',
+                        help="do not read the next timestep's HDF5 data in "
+                        "the background while the current one renders")
+    parser.add_argument('--resume', action='store_true',
+                        help="skip timesteps whose images were completed by "
+                        "an earlier run with the same input file")
     return vars(parser.parse_args())
     
 
-def load_input_file(input_file_name):
+def load_input_file(input_file_name, number_of_processes=1):
     '''
     Read data from yaml input file
     Name/path of yaml file is specified in command line arguments
+    number_of_processes scan the data for Single_precision (see
+    get_data_range)
     '''
     # Check yaml file existence:
     try:
@@ -54,28 +98,376 @@ def load_input_file(input_file_name):
                       % (mark.line + 1, mark.column + 1))
     # Create instance of InputFile class and load data
     input_file = InputFile(input_dictionary)
+    # Read the coarser level of the data if one is selected
+    if input_file.pv_level_of_detail is not None:
+        level_file_name = get_level_file_name(input_file.pv_file_path,
+                                              input_file.pv_level_of_detail)
+        if not os.path.isfile(level_file_name):
+            sys.exit("No level of detail " +
+                     str(input_file.pv_level_of_detail) + " of " +
+                     input_file.pv_file_path + ", build it with: "
+                     "DataPyramid.py " + input_file.pv_file_path +
+                     " --points-per-dimension " +
+                     str(input_file.pv_level_of_detail))
+        input_file.pv_file_path = level_file_name
+    # Read the data as float32 and report how much its ranges change
+    if input_file.pv_single_precision:
+        report = get_precision_report(input_file.pv_file_path,
+                                      get_required_point_arrays(input_file),
+                                      number_of_processes)
+        if get_mpi_rank_and_size()[0] == 0:
+            print_precision_report(report)
+        input_file.pv_file_path = get_single_precision_file_name(
+            input_file.pv_file_path)
     return input_file
 
 
-def get_xdmf_reader(xdmf_file_path):
+def get_required_point_arrays(input_file):
+    '''
+    Names of the point arrays the visualization uses: the scalar
+    variable, which the warp calculators are also built from, and the
+    vector variable if a vector field is added
+    '''
+    point_arrays = [input_file.pv_scalar_variable_properties.pv_variable_name]
+    if input_file.pv_vector_variable_properties.pv_add_vector_field:
+        point_arrays.append(
+            input_file.pv_vector_variable_properties.pv_variable_name)
+    return point_arrays
+
+
+def get_data_range(input_file, number_of_processes=1):
+    '''
+    Range of the scalar variable used for the color map and opacity:
+    None for the range of the first time step, or for a 'Global'
+    Data_range its min and max (or percentiles) over all time steps,
+    scanned from the HDF5 files and cached next to the XDMF file. Without
+    h5py the range of the first time step is used.
+    The data is scanned serially by default: forking a pool of
+    number_of_processes (all cores if None) is only safe before ParaView
+    sets up rendering or MPI, as launch_workers does.
+    '''
+    scalar_properties = input_file.pv_scalar_variable_properties
+    if scalar_properties.pv_data_range != 'Global':
+        return None
+    try:
+        import h5py
+    except ImportError:
+        print('h5py not found, using the range of the first time step '
+              'instead of the Global Data_range')
+        return None
+    xdmf_index = get_xdmf_index(input_file.pv_file_path)
+    if scalar_properties.pv_variable_name in\
+       xdmf_index.unindexed_attribute_names:
+        print(scalar_properties.pv_variable_name + ' is not indexed, using '
+              'the range of the first time step instead of the Global '
+              'Data_range')
+        return None
+    if scalar_properties.pv_range_percentiles is not None:
+        return scan_variable_percentiles(
+            xdmf_index, scalar_properties.pv_variable_name,
+            scalar_properties.pv_range_percentiles, number_of_processes)
+    return scan_variable_range(xdmf_index, scalar_properties.pv_variable_name,
+                               number_of_processes)
+
+
+def get_histogram(input_file, number_of_processes=1):
+    '''
+    Histogram (counts, bin_edges) of the scalar variable over all time
+    steps for the 'Histogram' opacity function, None for the others.
+    Scanned from the HDF5 files (see get_data_range for
+    number_of_processes) and cached next to the XDMF file.
+    '''
+    scalar_properties = input_file.pv_scalar_variable_properties
+    if scalar_properties.pv_opacity.pv_function_type != 'Histogram':
+        return None
+    xdmf_index = get_xdmf_index(input_file.pv_file_path)
+    if scalar_properties.pv_variable_name in\
+       xdmf_index.unindexed_attribute_names:
+        print(scalar_properties.pv_variable_name + ' is not indexed, '
+              'the Histogram opacity function is not available for it')
+        return None
+    return scan_variable_histogram(
+        xdmf_index, scalar_properties.pv_variable_name,
+        scalar_properties.pv_opacity.pv_number_of_bins, number_of_processes)
+
+
+def get_mesh_bounds(input_file, number_of_processes=1):
     '''
-    Read data from XDMF file specified in yaml file.
+    Bounds of the mesh over all time steps, read from the HDF5 files (see
+    get_data_range for number_of_processes) and cached next to the XDMF
+    file
+    '''
+    return scan_mesh_bounds(get_xdmf_index(input_file.pv_file_path),
+                            number_of_processes)
+
+
+def get_xdmf_reader(xdmf_file_path, point_arrays=None):
+    '''
+    Read data from XDMF file specified in yaml file, or from the VTKHDF
+    file converted from it (see ConvertToVtkHdf) while it is up to date.
+    Only the point arrays in point_arrays are read (all if None), see
+    get_required_point_arrays.
     Return XdmfReader object and set as active source
     '''
+    vtkhdf_file_name = get_converted_file(xdmf_file_path, point_arrays)
     try:
-        xdmf_reader = XDMFReader(FileNames=xdmf_file_path)
+        if vtkhdf_file_name is not None:
+            print('Reading', vtkhdf_file_name)
+            xdmf_reader = VTKHDFReader(FileName=vtkhdf_file_name)
+        else:
+            xdmf_reader = XDMFReader(FileNames=xdmf_file_path)
     except IOError as (errno, sterror):
         print("I/O error({0}): {1}".format(errno, strerror))
         sys.exit()
+    if point_arrays is not None:
+        xdmf_index = get_xdmf_index(xdmf_file_path)
+        available_arrays = xdmf_index.get_attribute_names() +\
+            xdmf_index.unindexed_attribute_names
+        for point_array in point_arrays:
+            if point_array not in available_arrays:
+                sys.exit("Variable " + point_array + " is not in " +
+                         xdmf_file_path + ", choose from: " +
+                         ", ".join(available_arrays))
+        # Skipped attributes are never read from the HDF5 files
+        xdmf_reader.PointArrayStatus = point_arrays
     SetActiveSource(xdmf_reader)
     return xdmf_reader
 
 
-def save_images(render_view, xdmf_reader, save, image_resolution):
+def get_region_source(xdmf_reader, input_file, region):
+    '''
+    Source of the elements of xdmf_reader that may intersect region (see
+    RegionOfInterest) if Region_of_interest is set in the input file,
+    else xdmf_reader. Grids without any such element are not read at all.
+    '''
+    if not input_file.pv_filters.pv_region_of_interest:
+        return xdmf_reader
+    xdmf_index = get_xdmf_index(input_file.pv_file_path)
+    # Scanned serially, see get_data_range
+    grid_names = get_region_grid_names(
+        xdmf_index, scan_element_bounds(xdmf_index, 1), region)
+    if not grid_names:
+        sys.exit("The clip or slice does not touch the data")
+    # A converted VTKHDF file has the grids merged, only elements are
+    # selected then
+    if hasattr(xdmf_reader, 'GridStatus') and\
+       len(grid_names) < len(xdmf_index.time_steps[0]):
+        xdmf_reader.GridStatus = grid_names
+    region_filter = ProgrammableFilter(Input=xdmf_reader)
+    region_filter.OutputDataSetType = 'Same as Input'
+    region_filter.Script =\
+        "from RegionOfInterest import Region, extract_region_data_object\n"\
+        "extract_region_data_object(self.GetInputDataObject(0, 0), "\
+        "self.GetOutputDataObject(0),\n    " + repr(region) + ", " +\
+        repr(input_file.pv_file_path) + ")\n"
+    return region_filter
+
+
+def get_prefetcher(xdmf_reader):
+    '''
+    Prefetcher for the HDF5 datasets of the XDMF file read by xdmf_reader,
+    limited to the point arrays enabled in the reader. None for a converted
+    VTKHDF file, whose time steps are already read sequentially.
+    '''
+    if not hasattr(xdmf_reader, 'FileNames'):
+        return None
+    xdmf_index = get_xdmf_index(xdmf_reader.FileNames[0])
+    return Prefetcher(xdmf_index, list(xdmf_reader.PointArrayStatus))
+
+
+def launch_workers(args):
+    '''
+    Relaunch the running script as args["number_of_workers"] worker
+    processes, each rendering its own share of the timesteps.
+    Returns True if workers were launched (the caller should then return
+    without building a pipeline) and False if this process should render.
+    '''
+    if args["number_of_workers"] <= 1 or args["worker_index"] is not None:
+        return False
+    # Under mpirun every rank is already a worker
+    if get_mpi_rank_and_size()[1] > 1:
+        return False
+    # Scan the data once here on every core, before ParaView renders
+    # anything, the workers then find it in the cache
+    input_file = load_input_file(args["input_file"], None)
+    get_data_range(input_file, None)
+    get_histogram(input_file, None)
+    save = args["save"]
+    number_of_workers = args["number_of_workers"]
+    # Left behind by a run that was killed
+    remove_worker_timings(save)
+    workers = []
+    for worker_index in range(number_of_workers):
+        command = [args["pvbatch"]] + sys.argv +\
+                  ['--worker-index', str(worker_index)]
+        print('Launching worker', worker_index)
+        workers.append(subprocess.Popen(command))
+    failed_workers = [worker_index for worker_index, worker in
+                      enumerate(workers) if worker.wait() != 0]
+    if failed_workers:
+        sys.exit("Workers {0} did not finish rendering".format(failed_workers))
+    # Stills are rendered without timing
+    worker_frame_times = read_worker_timings(save, number_of_workers, 0.0)
+    if worker_frame_times:
+        write_timing_report(save, worker_frame_times)
+    output_format = input_file.pv_save_properties.pv_output_format
+    if output_format in ['MP4', 'WebM'] and os.path.exists(
+            get_video_name(save, output_format, 0, number_of_workers)):
+        concatenate_videos(
+            [get_video_name(save, output_format, worker_index,
+                            number_of_workers)
+             for worker_index in range(number_of_workers)],
+            get_video_name(save, output_format, 0, 1))
+    return True
+
+
+def get_paraview_mpi_mode():
+    '''
+    Returns (size, symmetric) of the MPI processes ParaView runs on, for
+    ex. 'mpirun -np 24 pvbatch RenderXdmf.py ...'. symmetric is True if
+    every process runs the script (pvbatch --symmetric), otherwise only
+    rank 0 runs it and the other ranks serve it data. (1, False) when
+    ParaView did not initialize MPI, as in pvpython.
+    '''
+    try:
+        from paraview import servermanager
+        process_module = servermanager.vtkProcessModule.GetProcessModule()
+        size = process_module.GetNumberOfLocalPartitions()
+    except Exception:
+        return 1, False
+    if size <= 1:
+        return 1, False
+    try:
+        symmetric = process_module.GetSymmetricMPIMode()
+    except AttributeError:
+        # ParaView 5.9 and older
+        try:
+            symmetric = process_module.GetOptions().GetSymmetricMPIMode()
+        except AttributeError:
+            symmetric = '--symmetric' in sys.argv or '-sym' in sys.argv
+    return size, bool(symmetric)
+
+
+def get_mpi_rank_and_size():
+    '''
+    Returns (rank, size, communicator) when independent serial ParaView
+    processes run under MPI, for ex. 'mpirun -np 24 pvpython RenderXdmf.py
+    ...', and (0, 1, None) otherwise. Under 'mpirun pvbatch' only rank 0
+    runs the script, it renders every frame. The communicator is None if
+    mpi4py is not available, the rank and size are then read from the MPI
+    launcher's environment.
+    '''
+    paraview_size, symmetric = get_paraview_mpi_mode()
+    if paraview_size > 1:
+        # The ranks of pvbatch share the data of each frame and composite
+        # it together, they cannot render different frames
+        if symmetric:
+            sys.exit("pvbatch --symmetric is not supported, run 'mpirun "
+                     "pvbatch' without it or 'mpirun pvpython'")
+        return 0, 1, None
+    try:
+        from mpi4py import MPI
+        if MPI.COMM_WORLD.Get_size() > 1:
+            return MPI.COMM_WORLD.Get_rank(), MPI.COMM_WORLD.Get_size(),\
+                MPI.COMM_WORLD
+    except ImportError:
+        pass
+    # Open MPI, then MPICH/Intel MPI
+    for rank_variable, size_variable in [
+            ('OMPI_COMM_WORLD_RANK', 'OMPI_COMM_WORLD_SIZE'),
+            ('PMI_RANK', 'PMI_SIZE')]:
+        if rank_variable in os.environ and size_variable in os.environ:
+            return int(os.environ[rank_variable]),\
+                int(os.environ[size_variable]), None
+    return 0, 1, None
+
+
+def get_worker_index_and_count(args):
+    '''
+    Returns (worker index, number of workers, MPI communicator or None)
+    for this process, either from launch_workers or from the MPI rank
+    '''
+    if args["worker_index"] is not None:
+        return args["worker_index"], max(args["number_of_workers"], 1), None
+    return get_mpi_rank_and_size()
+
+
+def get_selected_time_step_indices(times, save_properties):
+    '''
+    Indices of the timesteps to render: those between Start_time and
+    End_time, every Time_stride-th of them, and at most Max_frames of
+    these evenly spread out, first and last included
+    '''
+    start_time = save_properties.pv_start_time
+    end_time = save_properties.pv_end_time
+    selected_indices = [time_step_index for time_step_index, time_value
+                        in enumerate(times)
+                        if (start_time is None or time_value >= start_time)
+                        and (end_time is None or time_value <= end_time)]
+    selected_indices = selected_indices[::max(save_properties.pv_time_stride,
+                                              1)]
+    max_frames = save_properties.pv_max_frames
+    if max_frames is not None and len(selected_indices) > max_frames:
+        selected_indices = [selected_indices[position] for position in
+                            sorted(set(np.linspace(
+                                0, len(selected_indices) - 1,
+                                max(max_frames, 1)).round().astype(int)))]
+    if not selected_indices:
+        sys.exit("No timestep between Start_time and End_time")
+    return selected_indices
+
+
+def get_worker_time_step_indices(number_of_time_steps, worker_index,
+                                 number_of_workers, frame_distribution):
+    '''
+    Returns the timestep indices rendered by worker_index.
+    'round-robin': worker i renders timesteps i, i + n, i + 2n, ...
+    'blocks': worker i renders the i-th contiguous block of timesteps
+    '''
+    if frame_distribution == 'round-robin':
+        return list(range(worker_index, number_of_time_steps,
+                          number_of_workers))
+    elif frame_distribution == 'blocks':
+        block_size, remainder = divmod(number_of_time_steps, number_of_workers)
+        # The first 'remainder' workers get one extra timestep
+        start = worker_index * block_size + min(worker_index, remainder)
+        end = start + block_size + (1 if worker_index < remainder else 0)
+        return list(range(start, end))
+    sys.exit("Unknown frame distribution: " + frame_distribution)
+
+
+def get_image_name(save, time_step_index, image_format='PNG'):
+    '''
+    Image name for a time step, with a 6-digit index,
+    for ex save_000001.png instead of save_1.png
+    '''
+    extensions = {'PNG': '.png', 'JPEG': '.jpg', 'WebP': '.webp'}
+    return save + '_' + str(time_step_index).zfill(6) +\
+        extensions[image_format]
+
+
+def save_images(render_view, xdmf_reader, args, save_properties):
     '''
     Saves single image or multiple images based on number of
-    time steps in data. One image is saved per time step.
+    time steps in data. One image is saved per time step (Output_format
+    PNG, JPEG or WebP), or with Output_format MP4/WebM the frames are
+    streamed into a single video. Frames are captured into memory and
+    compressed and written on background threads.
+    When running as one of several workers (see launch_workers) only this
+    worker's share of the time steps is rendered.
     '''
+    save = args["save"]
+    image_resolution = save_properties.pv_image_resolution
+    output_format = save_properties.pv_output_format
+    save_video = output_format in ['MP4', 'WebM']
+    worker_index, number_of_workers, mpi_comm =\
+        get_worker_index_and_count(args)
+    # Ranks without mpi4py exchange their timings through files, those of
+    # a killed run must not be read as this run's
+    if args["worker_index"] is None and number_of_workers > 1 and\
+       mpi_comm is None and worker_index == 0:
+        remove_worker_timings(save)
+    frame_times = []
     time_steps = xdmf_reader.TimestepValues  # list of timesteps
     #Check if there a multiple timesteps
     #VectorProperty below is a paraview type vector object 
@@ -86,28 +478,324 @@ def save_images(render_view, xdmf_reader, save, image_resolution):
         time_steps = [time_steps]
     
     if number_of_time_steps == 1:
-        SaveScreenshot(save + '.png', render_view)
+        # A still is only rendered once
+        if worker_index == 0:
+            SaveScreenshot(save + '.png', render_view)
     elif number_of_time_steps > 1:
         anim = GetAnimationScene()
         anim.PlayMode = 'Snap To TimeSteps'
-        for time_step_index in range(number_of_time_steps):
+        # Add time step value to window, the annotation follows the
+        # animation time so it is only created once
+        display_time(xdmf_reader, GetRenderView())
+        if not save_video:
+            config_hash = get_config_hash(args["input_file"])
+            completed_frames = get_completed_frames(save, config_hash)\
+                if args["resume"] else set()
+            manifest = open_manifest(save, config_hash, worker_index,
+                                     number_of_workers, args["resume"])
+            time_step_indices = {}
+
+            def record_frame(image_name):
+                # Called once the image is fully written
+                manifest.write('- ' + str(time_step_indices[image_name]) +
+                               '\n')
+                manifest.flush()
+            image_writer = ImageWriter(output_format,
+                                       save_properties.pv_compression_level,
+                                       save_properties.pv_quality,
+                                       save_properties.pv_writer_threads,
+                                       record_frame)
+        else:
+            # Each worker encodes a contiguous part of the movie
+            if number_of_workers > 1 and\
+               args["frame_distribution"] != 'blocks':
+                sys.exit("Video output with several workers needs "
+                         "--frame-distribution blocks")
+            # The animated PNG parts written without ffmpeg cannot be joined
+            if number_of_workers > 1 and which('ffmpeg') is None:
+                sys.exit("Video output with several workers needs ffmpeg, "
+                         "use a single worker to write an animated PNG")
+            if args["resume"]:
+                print('--resume only applies to image output, '
+                      'rendering all time steps')
+            completed_frames = set()
+            video_writer = VideoWriter(
+                get_video_name(save, output_format, worker_index,
+                               number_of_workers),
+                save_properties.pv_frame_rate)
+        # The timesteps are selected before any is read, images keep the
+        # index of their timestep
+        selected_indices = get_selected_time_step_indices(time_steps,
+                                                          save_properties)
+        worker_time_step_indices = [
+            selected_indices[position] for position in
+            get_worker_time_step_indices(
+                len(selected_indices), worker_index, number_of_workers,
+                args["frame_distribution"])]
+        prefetcher = None if args["no_prefetch"] else\
+            get_prefetcher(xdmf_reader)
+        for position, time_step_index in enumerate(worker_time_step_indices):
+            # Read the next time step's data while this one renders
+            if prefetcher is not None and\
+               position + 1 < len(worker_time_step_indices):
+                prefetcher.prefetch(worker_time_step_indices[position + 1])
+            if time_step_index in completed_frames and is_complete_image(
+                    get_image_name(save, time_step_index, output_format)):
+                print('Skipping completed time step', time_step_index)
+                continue
             print('Rendering time step', time_step_index)
+            start_time = time.time()
             anim.AnimationTime = time_steps[time_step_index]
             current_view = GetRenderView()
-            #Add time step value to window
-            display_time(xdmf_reader, current_view)
-            #Generating 6-digit index for image name for ex 000001 instead of 1
-            time_step_index_str = str(time_step_index)
-            time_step_index_str =\
-                    (6-len(time_step_index_str))*"0" + time_step_index_str
-            SaveScreenshot(save + '_' + time_step_index_str +
-                           '.png', current_view, ImageResolution=image_resolution)
+            # Compressed and written on a background thread while the
+            # next time step renders
+            frame = capture_frame(current_view, image_resolution)
+            if not save_video:
+                image_name = get_image_name(save, time_step_index,
+                                            output_format)
+                time_step_indices[image_name] = time_step_index
+                image_writer.write_image(frame, image_name)
+            else:
+                video_writer.write_frame(frame)
+            frame_times.append(time.time() - start_time)
+        if prefetcher is not None:
+            prefetcher.close()
+        if not save_video:
+            image_writer.close()
+            manifest.close()
+        else:
+            video_writer.close()
+        if args["worker_index"] is not None:
+            # launch_workers reports the timings and joins the video parts
+            # once every worker has exited
+            write_worker_timing(save, frame_times, worker_index)
+        elif number_of_workers > 1:
+            report_timing(save, frame_times, worker_index, number_of_workers,
+                          mpi_comm)
+            # All parts are written once rank 0 has everyone's timing
+            if save_video and worker_index == 0:
+                concatenate_videos(
+                    [get_video_name(save, output_format, other_worker_index,
+                                    number_of_workers) for other_worker_index
+                     in range(number_of_workers)],
+                    get_video_name(save, output_format, 0, 1))
+    return None
+
+
+def get_video_name(save, output_format, worker_index, number_of_workers):
+    '''
+    Name of the movie, or of this worker's part of it
+    '''
+    extension = '.' + output_format.lower()
+    if number_of_workers > 1:
+        return save + '_part' + str(worker_index).zfill(6) + extension
+    return save + extension
+
+
+def get_config_hash(input_file_name):
+    '''
+    Hash of the yaml input file, images rendered with a different
+    input file are not reused when resuming
+    '''
+    with open(input_file_name, 'rb') as input_stream:
+        return hashlib.sha1(input_stream.read()).hexdigest()
+
+
+def get_manifest_name(save, worker_index, number_of_workers):
+    '''
+    Name of the manifest listing the frames completed by a worker
+    '''
+    if number_of_workers > 1:
+        return save + '_manifest_worker' + str(worker_index) + '.yaml'
+    return save + '_manifest.yaml'
+
+
+def open_manifest(save, config_hash, worker_index, number_of_workers,
+                  resume):
+    '''
+    Open this worker's manifest for appending completed frame indices.
+    When resuming with the same config the frames it already lists are
+    kept, otherwise the manifest is started afresh.
+    '''
+    manifest_name = get_manifest_name(save, worker_index, number_of_workers)
+    previous_frames = read_manifest(manifest_name, config_hash)\
+        if resume else None
+    # Rewritten rather than appended to, to drop a partial last line
+    manifest = open(manifest_name, 'w')
+    manifest.write('Config_hash: ' + config_hash + '\n')
+    manifest.write('Completed_frames:\n')
+    for time_step_index in sorted(previous_frames or []):
+        manifest.write('- ' + str(time_step_index) + '\n')
+    manifest.flush()
+    return manifest
+
+
+def read_manifest(manifest_name, config_hash):
+    '''
+    Returns the completed frames listed in a manifest, or None if the
+    manifest is missing, unreadable or was written for another config
+    '''
+    try:
+        with open(manifest_name, 'r') as manifest:
+            lines = manifest.readlines()
+    except IOError:
+        return None
+    # A job killed mid-write can leave a partial last line
+    if lines and not lines[-1].endswith('\n'):
+        lines = lines[:-1]
+    try:
+        manifest_dictionary = yaml.safe_load(''.join(lines))
+    except yaml.YAMLError:
+        return None
+    if not isinstance(manifest_dictionary, dict) or\
+       manifest_dictionary.get('Config_hash') != config_hash:
+        return None
+    return set(manifest_dictionary.get('Completed_frames') or [])
+
+
+def get_completed_frames(save, config_hash):
+    '''
+    Frames listed in any manifest of save with a matching config hash,
+    whatever number of workers wrote them
+    '''
+    completed_frames = set()
+    for manifest_name in glob.glob(save + '_manifest*.yaml'):
+        manifest_frames = read_manifest(manifest_name, config_hash)
+        if manifest_frames is not None:
+            completed_frames |= manifest_frames
+    return completed_frames
+
+
+def is_complete_image(image_name):
+    '''
+    Check that an image exists and is not truncated: a PNG starts with the
+    PNG signature and ends with the IEND chunk, a JPEG starts and ends
+    with the SOI and EOI markers and a WebP is as long as its RIFF header
+    says
+    '''
+    header_and_trailer = {
+        '.png': (b'\x89PNG\r\n\x1a\n', b'\x00\x00\x00\x00IEND\xaeB`\x82'),
+        '.jpg': (b'\xff\xd8', b'\xff\xd9')}
+    extension = os.path.splitext(image_name)[1]
+    try:
+        with open(image_name, 'rb') as image:
+            image.seek(0, os.SEEK_END)
+            image_size = image.tell()
+            image.seek(0)
+            if extension == '.webp':
+                riff_header = image.read(12)
+                return len(riff_header) == 12 and\
+                    riff_header[:4] == b'RIFF' and riff_header[8:] == b'WEBP'\
+                    and struct.unpack('<I', riff_header[4:8])[0] + 8 ==\
+                    image_size
+            header, trailer = header_and_trailer[extension]
+            if image_size < len(header) + len(trailer) or\
+               image.read(len(header)) != header:
+                return False
+            image.seek(-len(trailer), os.SEEK_END)
+            return image.read() == trailer
+    except IOError:
+        return False
+
+
+def get_worker_timing_name(save, worker_index):
+    '''
+    Name of the file a worker writes its per-frame render times to
+    '''
+    return save + '_timing_worker' + str(worker_index) + '.yaml'
+
+
+def remove_worker_timings(save):
+    '''
+    Remove the per-worker timing files of an earlier run
+    '''
+    for worker_file_name in glob.glob(save + '_timing_worker*.yaml'):
+        os.remove(worker_file_name)
+    return None
+
+
+def write_worker_timing(save, frame_times, worker_index):
+    '''
+    Write the per-frame render times of a worker for read_worker_timings
+    '''
+    worker_file_name = get_worker_timing_name(save, worker_index)
+    # Write and rename so that a partial file is never read
+    temporary_name = worker_file_name + '.tmp' + str(os.getpid())
+    with open(temporary_name, 'w') as worker_file:
+        yaml.safe_dump(frame_times, worker_file)
+    os.rename(temporary_name, worker_file_name)
+    return None
+
+
+def read_worker_timings(save, number_of_workers, timeout):
+    '''
+    Read and remove the timing files of the workers, waiting at most
+    timeout seconds for those not written yet. Returns a list of (worker
+    index, frame times), the workers whose file is missing are left out.
+    '''
+    end_time = time.time() + timeout
+    worker_frame_times = []
+    for worker_index in range(number_of_workers):
+        worker_file_name = get_worker_timing_name(save, worker_index)
+        while not os.path.exists(worker_file_name) and\
+                time.time() < end_time:
+            time.sleep(1.0)
+        if not os.path.exists(worker_file_name):
+            print('No timing from worker ' + str(worker_index))
+            continue
+        with open(worker_file_name, 'r') as worker_file:
+            worker_frame_times.append((worker_index,
+                                       yaml.safe_load(worker_file)))
+        os.remove(worker_file_name)
+    return worker_frame_times
+
+
+def write_timing_report(save, worker_frame_times):
+    '''
+    Print a per-worker summary of (worker index, frame times) pairs and
+    write it to save + '_timing.yaml'
+    '''
+    timing_report = []
+    for worker_index, times in worker_frame_times:
+        timing_report.append({
+            'Worker': worker_index,
+            'Frames': len(times),
+            'Total_time': float(sum(times)),
+            'Mean_frame_time': float(sum(times) / len(times)) if times else 0.0
+        })
+        print('Worker {0}: {1} frames in {2:.1f} s'.format(
+            worker_index, len(times), sum(times)))
+    with open(save + '_timing.yaml', 'w') as timing_file:
+        yaml.safe_dump(timing_report, timing_file, default_flow_style=False)
+    return None
+
+
+def report_timing(save, frame_times, worker_index, number_of_workers,
+                  mpi_comm):
+    '''
+    Gather the per-frame render times of all MPI ranks at rank 0, which
+    writes them with write_timing_report. With mpi4py the times are
+    gathered over MPI, otherwise each rank writes its times to a file
+    that rank 0 waits for, at most TIMING_TIMEOUT seconds.
+    '''
+    if mpi_comm is not None:
+        all_frame_times = mpi_comm.gather(frame_times, root=0)
+        if worker_index == 0:
+            write_timing_report(save, list(enumerate(all_frame_times)))
+        return None
+    write_worker_timing(save, frame_times, worker_index)
+    if worker_index == 0:
+        write_timing_report(save, read_worker_timings(
+            save, number_of_workers, TIMING_TIMEOUT))
     return None
 
 
 def display_time(xdmf_reader, render_view):
     '''
-    Prints current time to images rendered in save_images
+    Prints current time to images rendered in save_images.
+    Call once per view: the AnnotateTimeFilter is updated whenever the
+    animation time changes, creating a new one per time step grows the
+    pipeline with every frame.
     '''
     annotate_time = AnnotateTimeFilter(xdmf_reader)
     annotate_time.Format = 'Time: %f s'
@@ -116,7 +804,7 @@ def display_time(xdmf_reader, render_view):
     annotate_time_display.FontFamily = 'Courier'
     annotate_time_display.FontSize = 13
     render_view.Update()
-    return None
+    return annotate_time_display
 
 
             
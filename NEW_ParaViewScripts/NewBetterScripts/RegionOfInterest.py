@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+
+# Distributed under the MIT License.
+# See LICENSE.txt for details.
+
+from collections import namedtuple
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+from XdmfIndex import get_xdmf_index
+from DataScan import scan_element_bounds
+from TopologyCache import get_mesh_ids, get_time_step_index
+
+# Selection of the elements a Clip or Slice of the input file can touch,
+# from the bounds of the elements (see scan_element_bounds), so the others
+# are neither read nor passed down the pipeline: grids without any such
+# element are disabled in the reader (get_region_grid_names) and the
+# elements of the other grids are extracted by the programmable filter of
+# get_region_source (ReadWriteFunctions). The tests are conservative, an
+# element may be kept that the filter then removes, never the reverse.
+
+# A region of space: shape and parameters of a Clip or Slice, surface is
+# True for a slice (the elements crossing the shape's surface) and False
+# for a clip (the elements in the part of space it keeps)
+Region = namedtuple('Region', ['shape', 'parameters', 'surface'])
+
+
+def get_region(filter_properties, surface):
+    '''
+    Region of the Clip or Slice properties of the input file
+    '''
+    if filter_properties.pv_type == 'Plane':
+        parameters = (filter_properties.pv_origin, filter_properties.pv_normal)
+    elif filter_properties.pv_type == 'Box':
+        parameters = (filter_properties.pv_position,
+                      filter_properties.pv_rotation,
+                      filter_properties.pv_scale)
+    elif filter_properties.pv_type == 'Sphere':
+        parameters = (filter_properties.pv_sphere_center,
+                      filter_properties.pv_sphere_radius)
+    elif filter_properties.pv_type == 'Cylinder':
+        parameters = (filter_properties.pv_cylinder_center,
+                      filter_properties.pv_axis,
+                      filter_properties.pv_cylinder_radius)
+    else:
+        raise ValueError("Unknown filter type: " + filter_properties.pv_type)
+    return Region(filter_properties.pv_type,
+                  tuple([float(value) for value in np.ravel(parameter)]
+                        if np.ndim(parameter) > 0 else float(parameter)
+                        for parameter in parameters), surface)
+
+
+def get_clip_region(clip_properties):
+    '''
+    Region a Clip keeps. ParaView's Clip keeps the inside of the clip
+    function by default (Invert), the side of a plane opposite its normal.
+    '''
+    return get_region(clip_properties, False)
+
+
+def get_slice_region(slice_properties):
+    '''
+    Region a Slice cuts through
+    '''
+    return get_region(slice_properties, True)
+
+
+def unit_vector(vector):
+    '''
+    vector divided by its norm
+    '''
+    vector = np.asarray(vector, dtype=float)
+    return vector / max(np.linalg.norm(vector), np.finfo(float).tiny)
+
+
+def intersect_region(bounds, region):
+    '''
+    For each of (number of boxes, 6) bounds [xmin, xmax, ymin, ymax, zmin,
+    zmax], True if the box may intersect the region
+    '''
+    lower = bounds[:, 0::2]
+    upper = bounds[:, 1::2]
+    centers = 0.5 * (lower + upper)
+    half_sizes = 0.5 * (upper - lower)
+    if region.shape == 'Plane':
+        origin, normal = region.parameters
+        normal = unit_vector(normal)
+        distances = (centers - origin).dot(normal)
+        radii = half_sizes.dot(np.abs(normal))
+        if region.surface:
+            return np.abs(distances) <= radii
+        return distances - radii <= 0.0
+    elif region.shape == 'Sphere':
+        center, radius = region.parameters
+        center = np.asarray(center)
+        nearest_distances = np.linalg.norm(
+            np.clip(center, lower, upper) - center, axis=1)
+        intersect = nearest_distances <= radius
+        if region.surface:
+            farthest_distances = np.linalg.norm(
+                np.maximum(np.abs(lower - center), np.abs(upper - center)),
+                axis=1)
+            intersect &= farthest_distances >= radius
+        return intersect
+    elif region.shape == 'Box':
+        position, rotation, scale = [np.asarray(parameter) for parameter
+                                     in region.parameters]
+        if np.any(rotation != 0.0):
+            # Any rotation of the box about its position stays in the
+            # sphere around it through its far corner
+            return intersect_region(bounds, Region(
+                'Sphere', (position, np.linalg.norm(scale)), False))
+        box_lower = np.minimum(position, position + scale)
+        box_upper = np.maximum(position, position + scale)
+        return np.all((lower <= box_upper) & (upper >= box_lower), axis=1)
+    elif region.shape == 'Cylinder':
+        center, axis, radius = region.parameters
+        axis = unit_vector(axis)
+        offsets = centers - center
+        axis_distances = np.linalg.norm(
+            offsets - np.outer(offsets.dot(axis), axis), axis=1)
+        return axis_distances <= radius + np.linalg.norm(half_sizes, axis=1)
+    raise ValueError("Unknown region shape: " + region.shape)
+
+
+def get_region_grid_names(xdmf_index, element_bounds, region):
+    '''
+    Names of the grids with an element that may intersect the region at
+    some time step
+    '''
+    grid_names = set()
+    for time_step_index in sorted(set(element_bounds)):
+        for grid, (first_cells, bounds) in zip(
+                xdmf_index.time_steps[time_step_index],
+                element_bounds[time_step_index]):
+            if grid.name not in grid_names and\
+               np.any(intersect_region(bounds, region)):
+                grid_names.add(grid.name)
+    return [grid.name for grid in xdmf_index.time_steps[0]
+            if grid.name in grid_names]
+
+
+def get_region_cells(grid, first_cells, bounds, region):
+    '''
+    For each cell of a grid, True if its element may intersect the region
+    '''
+    numbers_of_cells = np.diff(np.append(first_cells,
+                                         grid.number_of_elements))
+    return np.repeat(intersect_region(bounds, region), numbers_of_cells)
+
+
+def extract_cells(input_data, output_data, kept_cells):
+    '''
+    Set output_data to the cells of input_data for which kept_cells is True
+    and the points they use
+    '''
+    if np.all(kept_cells):
+        output_data.ShallowCopy(input_data)
+        return None
+    data_set = vtk.vtkUnstructuredGrid()
+    data_set.ShallowCopy(input_data)
+    kept_array = numpy_support.numpy_to_vtk(kept_cells.astype(np.uint8),
+                                            deep=1)
+    kept_array.SetName('Region_of_interest')
+    data_set.GetCellData().AddArray(kept_array)
+    threshold = vtk.vtkThreshold()
+    threshold.SetInputData(data_set)
+    threshold.SetInputArrayToProcess(
+        0, 0, 0, vtk.vtkDataObject.FIELD_ASSOCIATION_CELLS,
+        'Region_of_interest')
+    if hasattr(threshold, 'SetThresholdFunction'):
+        threshold.SetLowerThreshold(0.5)
+        threshold.SetUpperThreshold(1.5)
+    else:
+        # VTK 9.0 and older
+        threshold.ThresholdBetween(0.5, 1.5)
+    threshold.Update()
+    output_data.ShallowCopy(threshold.GetOutput())
+    output_data.GetCellData().RemoveArray('Region_of_interest')
+    return None
+
+
+def extract_region_data_object(input_data, output_data, region,
+                               xdmf_file_name):
+    '''
+    Set output_data to the elements of input_data, read from an XDMF file
+    or from the VTKHDF file converted from it, that may intersect the
+    region. The blocks of a multiblock data set are matched to the grids
+    of the time step by name, a single data set is the grids merged.
+    '''
+    time_step_index = get_time_step_index(input_data, xdmf_file_name)
+    mesh_ids = get_mesh_ids(input_data, xdmf_file_name)
+    if time_step_index is None or mesh_ids is None:
+        output_data.ShallowCopy(input_data)
+        return None
+    grids = get_xdmf_index(xdmf_file_name).time_steps[time_step_index]
+    grid_bounds = scan_element_bounds(get_xdmf_index(xdmf_file_name),
+                                      number_of_processes=1)[mesh_ids[0]]
+    region_cells = [get_region_cells(grid, first_cells, bounds, region)
+                    for grid, (first_cells, bounds) in zip(grids,
+                                                           grid_bounds)]
+    if not input_data.IsA('vtkCompositeDataSet'):
+        kept_cells = np.concatenate(region_cells)
+        if len(kept_cells) != input_data.GetNumberOfCells():
+            output_data.ShallowCopy(input_data)
+            return None
+        extract_cells(input_data, output_data, kept_cells)
+        return None
+    grid_indices = dict((grid.name, grid_index)
+                        for grid_index, grid in enumerate(grids))
+    output_data.CopyStructure(input_data)
+    iterator = input_data.NewIterator()
+    iterator.InitTraversal()
+    while not iterator.IsDoneWithTraversal():
+        block = iterator.GetCurrentDataObject()
+        meta_data = iterator.GetCurrentMetaData()
+        grid_index = grid_indices.get(
+            meta_data.Get(vtk.vtkCompositeDataSet.NAME())
+            if meta_data.Has(vtk.vtkCompositeDataSet.NAME()) else None)
+        if grid_index is None or not block.IsA('vtkUnstructuredGrid') or\
+           len(region_cells[grid_index]) != block.GetNumberOfCells():
+            output_block = block.NewInstance()
+            output_block.ShallowCopy(block)
+        else:
+            output_block = vtk.vtkUnstructuredGrid()
+            extract_cells(block, output_block, region_cells[grid_index])
+        output_data.SetDataSet(iterator, output_block)
+        iterator.GoToNextItem()
+    return None
@@ -21,6 +21,11 @@ def main(args):
     :param args: command line arguments
     Render image(s) based on parameters specified
     '''    
+    # Split the timesteps between worker processes if requested,
+    # each worker builds its own pipeline
+    if launch_workers(args):
+        return None
+
     # Disable automatic camera reset on 'Show'
     paraview.simple._DisableFirstRenderCameraReset()
 
@@ -29,29 +34,33 @@ def main(args):
     scalar_variable = input_file.pv_scalar_variable_properties.pv_variable_name
     vector_variable = input_file.pv_vector_variable_properties.pv_variable_name
     render_view = CreateRenderView()
-    xdmf_reader = get_xdmf_reader(input_file.pv_file_path)
+    xdmf_reader = get_xdmf_reader(
+        input_file.pv_file_path, get_required_point_arrays(input_file))
 
-    # Tetrahedralize
-    display=tetrahedralize(xdmf_reader, render_view)
+    # Tetrahedralize, or one Lagrange cell per element
+    display=show_element_cells(xdmf_reader, render_view,
+                               input_file.pv_scalar_variable_properties,
+                               input_file.pv_cache_directory,
+                               input_file.pv_file_path)
 
     # Update display properties
     display=set_representation(
         input_file.pv_scalar_variable_properties.pv_representation,
         display)
     display, render_view, variable_lookup_table=\
-    set_color_map(scalar_variable, render_view, display,
-                  input_file.pv_scalar_variable_properties.pv_color_map)
-    render_view=\
-    set_opacity(scalar_variable,
-        input_file.pv_scalar_variable_properties.pv_opacity.pv_function_type,
-        input_file.pv_scalar_variable_properties.pv_opacity.pv_value,
-        render_view, xdmf_reader, variable_lookup_table)
+    set_transfer_functions(scalar_variable, render_view, display,
+                           xdmf_reader,
+                           input_file.pv_scalar_variable_properties,
+                           get_data_range(input_file), get_histogram(input_file),
+                           input_file.pv_cache_directory)
 
     # Add a vector field (glyphs in ParaView) if specified in
     # input file
     if input_file.pv_vector_variable_properties.pv_add_vector_field:
         render_view, vector_field_display =\
-        add_vector_field(vector_variable, xdmf_reader, render_view)
+        add_vector_field(vector_variable,
+                         get_filter_source(xdmf_reader, input_file),
+                         render_view)
         # Update vector field display
         render_view = set_vector_field_color_map(vector_field_display,
                             vector_variable,
@@ -66,8 +75,8 @@ def main(args):
     render_view.ResetCamera()
 
     # Save images
-    save_images(render_view, xdmf_reader, args["save"], 
-                input_file.pv_save_properties.pv_image_resolution)
+    save_images(render_view, xdmf_reader, args,
+                input_file.pv_save_properties)
     
     return None
 
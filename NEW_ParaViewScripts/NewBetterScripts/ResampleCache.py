@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+
+# Distributed under the MIT License.
+# See LICENSE.txt for details.
+
+import hashlib
+import os
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+from TopologyCache import get_mesh_counts, get_mesh_ids,\
+    get_topology_key
+
+# Resampling of a point array of an unstructured grid of hexahedra and
+# tetrahedra onto a uniform image grid, for volume rendering. Each image
+# point is interpolated from the points of the cell containing it, with
+# weights (stencils) that only depend on the mesh: they are computed once
+# per geometry, cached, and each time step is then resampled with a
+# sparse matrix-vector product. Used by the programmable filter of
+# resampled_volume_render (SetDisplayFunctions).
+
+# Corners of a hexahedron in VTK order, as parametric coordinates
+HEXAHEDRON_CORNERS = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0],
+                               [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]],
+                              dtype=float)
+# Newton iterations inverting the trilinear map of a hexahedron
+NEWTON_ITERATIONS = 8
+# Number of geometries whose stencils are kept in memory, a moving mesh
+# would otherwise hold the stencils of every time step
+MAX_LOADED_STENCILS = 4
+
+# Stencils of the last MAX_LOADED_STENCILS geometries resampled, by
+# stencil key, and their keys from the least recently loaded
+loaded_stencils = {}
+loaded_stencil_keys = []
+# Stencil keys and the numbers of points and cells of the mesh they were
+# computed for, by XDMF file, geometry id (see scan_mesh_changes),
+# resolution and bounds, so a geometry seen before is not hashed again
+stencil_keys = {}
+
+
+def get_image_spacing(bounds, resolution):
+    '''
+    Spacing of an image of resolution points spanning bounds
+    '''
+    return [(bounds[2 * dimension + 1] - bounds[2 * dimension]) /
+            max(resolution[dimension] - 1, 1) for dimension in range(3)]
+
+
+def get_image_points(bounds, resolution):
+    '''
+    (number of points, 3) coordinates of the points of the image, with x
+    varying fastest as in vtkImageData
+    '''
+    axes = [bounds[2 * dimension] + spacing * np.arange(resolution[dimension])
+            for dimension, spacing
+            in enumerate(get_image_spacing(bounds, resolution))]
+    z, y, x = np.meshgrid(axes[2], axes[1], axes[0], indexing='ij')
+    return np.column_stack([x.ravel(), y.ravel(), z.ravel()])
+
+
+def locate_image_points(unstructured_grid, bounds, resolution):
+    '''
+    Id of the cell containing each point of the image, -1 outside the mesh
+    '''
+    image = vtk.vtkImageData()
+    image.SetDimensions(resolution)
+    image.SetOrigin(bounds[0::2])
+    image.SetSpacing(get_image_spacing(bounds, resolution))
+    source = vtk.vtkUnstructuredGrid()
+    source.ShallowCopy(unstructured_grid)
+    source.GetPointData().Initialize()
+    source.GetCellData().Initialize()
+    cell_ids = numpy_support.numpy_to_vtk(
+        np.arange(unstructured_grid.GetNumberOfCells(), dtype=float), deep=1)
+    cell_ids.SetName('Cell_ids')
+    source.GetCellData().AddArray(cell_ids)
+    probe = vtk.vtkProbeFilter()
+    probe.SetInputData(image)
+    probe.SetSourceData(source)
+    probe.Update()
+    probed_data = probe.GetOutput().GetPointData()
+    valid = numpy_support.vtk_to_numpy(
+        probed_data.GetArray(probe.GetValidPointMaskArrayName()))
+    return np.where(valid > 0, numpy_support.vtk_to_numpy(
+        probed_data.GetArray('Cell_ids')), -1).astype(np.int64)
+
+
+def get_cell_point_ids(unstructured_grid, cell_ids):
+    '''
+    (number of cells, 8) point ids of some cells, padded with -1, and the
+    number of points of each
+    '''
+    cells = unstructured_grid.GetCells()
+    if hasattr(cells, 'GetConnectivityArray'):
+        connectivity = numpy_support.vtk_to_numpy(
+            cells.GetConnectivityArray())
+        offsets = numpy_support.vtk_to_numpy(cells.GetOffsetsArray())
+        starts = offsets[cell_ids]
+        sizes = offsets[cell_ids + 1] - starts
+    else:
+        # VTK 8 and older store [number of points, ids...] per cell
+        connectivity = numpy_support.vtk_to_numpy(cells.GetData())
+        starts = numpy_support.vtk_to_numpy(
+            unstructured_grid.GetCellLocationsArray())[cell_ids] + 1
+        sizes = connectivity[starts - 1]
+    corners = np.arange(8)
+    indices = np.minimum(starts[:, np.newaxis] + corners,
+                         len(connectivity) - 1)
+    return np.where(corners < sizes[:, np.newaxis], connectivity[indices],
+                    -1), sizes
+
+
+def hexahedron_weights(corners, targets):
+    '''
+    Trilinear interpolation weights of targets in the hexahedra with
+    (number of targets, 8, 3) corners, from their parametric coordinates
+    found by Newton's method
+    '''
+    signs = 2.0 * HEXAHEDRON_CORNERS - 1.0
+    parametric_coordinates = np.full((len(targets), 3), 0.5)
+    for iteration in range(NEWTON_ITERATIONS + 1):
+        factors = np.where(HEXAHEDRON_CORNERS > 0,
+                           parametric_coordinates[:, np.newaxis, :],
+                           1.0 - parametric_coordinates[:, np.newaxis, :])
+        weights = np.prod(factors, axis=2)
+        if iteration == NEWTON_ITERATIONS:
+            break
+        derivatives = signs * np.stack(
+            [factors[:, :, 1] * factors[:, :, 2],
+             factors[:, :, 0] * factors[:, :, 2],
+             factors[:, :, 0] * factors[:, :, 1]], axis=2)
+        residuals = targets - np.einsum('nk,nki->ni', weights, corners)
+        jacobians = np.einsum('nkd,nki->nid', derivatives, corners)
+        # Degenerate hexahedra keep their parametric coordinates
+        singular = np.abs(np.linalg.det(jacobians)) < 1e-300
+        jacobians[singular] = np.eye(3)
+        residuals[singular] = 0.0
+        steps = np.linalg.solve(jacobians, residuals[:, :, np.newaxis])
+        parametric_coordinates = np.clip(
+            parametric_coordinates + steps[:, :, 0], 0.0, 1.0)
+    return weights
+
+
+def tetrahedron_weights(corners, targets):
+    '''
+    Barycentric interpolation weights of targets in the tetrahedra with
+    (number of targets, 4, 3) corners
+    '''
+    edges = np.transpose(corners[:, 1:, :] - corners[:, :1, :], (0, 2, 1))
+    singular = np.abs(np.linalg.det(edges)) < 1e-300
+    edges[singular] = np.eye(3)
+    coordinates = np.clip(np.linalg.solve(
+        edges, (targets - corners[:, 0, :])[:, :, np.newaxis])[:, :, 0],
+        0.0, 1.0)
+    return np.column_stack([1.0 - coordinates.sum(axis=1), coordinates])
+
+
+def compute_stencils(unstructured_grid, bounds, resolution):
+    '''
+    Interpolation stencils of the image points inside the mesh: their
+    indices in the image, the (number of points inside, 8) ids of the
+    mesh points they are interpolated from and the weights of these.
+    Only hexahedra and tetrahedra are interpolated, image points in other
+    cells are left outside.
+    '''
+    image_points = get_image_points(bounds, resolution)
+    cell_ids = locate_image_points(unstructured_grid, bounds, resolution)
+    inside = np.nonzero(cell_ids >= 0)[0]
+    point_ids, sizes = get_cell_point_ids(unstructured_grid, cell_ids[inside])
+    points = numpy_support.vtk_to_numpy(
+        unstructured_grid.GetPoints().GetData()).astype(float)
+    weights = np.zeros(point_ids.shape)
+    hexahedra = sizes == 8
+    weights[hexahedra] = hexahedron_weights(points[point_ids[hexahedra]],
+                                            image_points[inside[hexahedra]])
+    tetrahedra = sizes == 4
+    weights[tetrahedra, :4] = tetrahedron_weights(
+        points[point_ids[tetrahedra, :4]], image_points[inside[tetrahedra]])
+    interpolated = hexahedra | tetrahedra
+    index_type = np.int32 if len(points) < 2**31 else np.int64
+    return (inside[interpolated],
+            np.maximum(point_ids[interpolated], 0).astype(index_type),
+            weights[interpolated].astype(np.float32))
+
+
+def apply_stencils(stencils, values, number_of_image_points):
+    '''
+    Resampled values at the image points: the product of the sparse
+    interpolation matrix, one row of at most 8 weights per image point,
+    with the values at the mesh points. NaN outside the mesh.
+    '''
+    image_indices, point_ids, weights = stencils
+    resampled_values = np.full(number_of_image_points, np.nan,
+                               dtype=np.float32)
+    resampled_values[image_indices] = np.einsum('ij,ij->i', weights,
+                                                values[point_ids])
+    return resampled_values
+
+
+def get_stencil_file_name(cache_directory, stencil_key):
+    '''
+    Name of the file caching the stencils of a geometry
+    '''
+    return os.path.join(cache_directory, 'stencils_' + stencil_key + '.npz')
+
+
+def get_stencil_key(unstructured_grid, bounds, resolution):
+    '''
+    Hash of the cells and points of an unstructured grid and of the image
+    '''
+    stencil_hash = hashlib.sha1(
+        (get_topology_key(unstructured_grid) + repr(list(bounds)) +
+         repr(list(resolution))).encode('utf-8'))
+    stencil_hash.update(np.ascontiguousarray(numpy_support.vtk_to_numpy(
+        unstructured_grid.GetPoints().GetData())))
+    return stencil_hash.hexdigest()
+
+
+def load_stencils(unstructured_grid, stencil_key, bounds, resolution,
+                  cache_directory=None):
+    '''
+    Stencils of a geometry, read from the cache directory or computed and
+    stored there
+    '''
+    if cache_directory is not None:
+        stencil_file_name = get_stencil_file_name(cache_directory,
+                                                  stencil_key)
+        try:
+            with np.load(stencil_file_name) as stencil_file:
+                return (stencil_file['image_indices'],
+                        stencil_file['point_ids'], stencil_file['weights'])
+        except Exception:
+            pass
+    stencils = compute_stencils(unstructured_grid, bounds, resolution)
+    if cache_directory is not None:
+        try:
+            if not os.path.isdir(cache_directory):
+                os.makedirs(cache_directory)
+            temporary_name = stencil_file_name + '.tmp' + str(os.getpid())
+            with open(temporary_name, 'wb') as stencil_file:
+                np.savez(stencil_file, image_indices=stencils[0],
+                         point_ids=stencils[1], weights=stencils[2])
+            os.rename(temporary_name, stencil_file_name)
+        except (IOError, OSError):
+            print('Could not cache the resampling stencils in',
+                  cache_directory)
+    return stencils
+
+
+def resample_data_object(input_data, output_data, variable, resolution,
+                         bounds, cache_directory=None, xdmf_file_name=None):
+    '''
+    Set output_data, a vtkImageData of resolution points spanning bounds,
+    to variable resampled from input_data, an unstructured grid such as the
+    merged blocks of cached_merge_blocks. With the XDMF file the data was
+    read from, a geometry seen before reuses its stencils without hashing
+    the mesh: its geometry id (see scan_mesh_changes) comes from a hash of
+    all of its coordinates.
+    '''
+    geometry = None
+    if xdmf_file_name is not None:
+        mesh_ids = get_mesh_ids(input_data, xdmf_file_name)
+        if mesh_ids is not None:
+            geometry = (xdmf_file_name, mesh_ids[1], tuple(resolution),
+                        tuple(bounds))
+    mesh_counts = get_mesh_counts([input_data])
+    if geometry is not None and geometry in stencil_keys and\
+       stencil_keys[geometry][1] == mesh_counts:
+        stencil_key = stencil_keys[geometry][0]
+    else:
+        stencil_key = get_stencil_key(input_data, bounds, resolution)
+        if geometry is not None:
+            stencil_keys[geometry] = (stencil_key, mesh_counts)
+    if stencil_key not in loaded_stencils:
+        if len(loaded_stencil_keys) >= MAX_LOADED_STENCILS:
+            del loaded_stencils[loaded_stencil_keys.pop(0)]
+        loaded_stencils[stencil_key] = load_stencils(
+            input_data, stencil_key, bounds, resolution, cache_directory)
+        loaded_stencil_keys.append(stencil_key)
+    output_data.SetDimensions(resolution)
+    output_data.SetOrigin(bounds[0::2])
+    output_data.SetSpacing(get_image_spacing(bounds, resolution))
+    resampled_array = numpy_support.numpy_to_vtk(apply_stencils(
+        loaded_stencils[stencil_key], numpy_support.vtk_to_numpy(
+            input_data.GetPointData().GetArray(variable)),
+        int(np.prod(resolution))), deep=1)
+    resampled_array.SetName(variable)
+    output_data.GetPointData().SetScalars(resampled_array)
+    return None
@@ -7,6 +7,9 @@ from paraview.simple import *
 import sys
 import yaml
 import numpy as np
+from TransferFunctions import get_opacity_points, get_preset_name,\
+    get_transfer_function_key, make_preset, read_cached_preset,\
+    write_cached_preset
 
 # First few functions modify display properties
 
@@ -91,69 +94,231 @@ def set_vector_color_map(vector_var_display, vector_variable, color_map,
     return render_view
 
 
+def set_data_range(var, var_lookup_table, var_range):
+    '''
+    Fix the color and opacity maps of var to var_range for every time
+    step, instead of rescaling them to each time step's data
+    '''
+    var_lookup_table.RescaleTransferFunction(var_range[0], var_range[1])
+    GetOpacityTransferFunction(var).RescaleTransferFunction(var_range[0],
+                                                            var_range[1])
+    var_lookup_table.AutomaticRescaleRangeMode = 'Never'
+    return var_lookup_table
+
+
 def set_opacity(var, function_type, opacity_val, render_view,\
-                scalar_var_source, var_lookup_table):
+                scalar_var_source, var_lookup_table, var_range=None,
+                histogram=None, tolerance=0.0, max_points=None):
     '''
     Set opacity based on option chosen in yaml input file:
     'Constant': some value between 0 and 1 
     'Proportional': opacity set proportional to the variable being visualized,
+    'Histogram': opacity up to opacity_val following how many points have
+    each value, from histogram = (counts, bin_edges) over all time steps
     (Under 'Scalar_variable_properties')
+    The opacity is built over var_range, for ex. the range over all time
+    steps, which the color map is then fixed to. If None, the range of
+    the current time step is used.
+    The opacity function is simplified to the fewest points within
+    tolerance of it and at most max_points, see TransferFunctions.
     '''
     # Get range of var array
-    var_range = scalar_var_source.PointData.GetArray(var).GetRange()
-    # Set variables to construct gaussians
-    var_max = var_range[1]
-    var_min = var_range[0]
-    
-    if function_type == 'Constant':  # Constant Opacity
-        var_lookup_table.EnableOpacityMapping = 1
-        var_pointwise_function = GetOpacityTransferFunction(var)
-        var_pointwise_function.Points = [var_min, opacity_val, 0.5,
-                                         0.0, var_max, opacity_val, 0.5, 0.0]
-        
-    elif function_type == 'Proportional':  # Varying opacity
-        var_lookup_table.EnableOpacityMapping = 1
-        var_pointwise_function = GetOpacityTransferFunction(var)
-        num_points = 200  # Number of points to evaluate opacity function 
-        num_gauss = 5  # Number of gaussians
-        var_values = np.asarray(np.linspace(
-            var_min, var_max, num_points))  # Array of var values
-        center_values = np.asarray(np.linspace(
-            var_min, var_max, num_gauss))  # centers of gaussian
-        # amplitudes of gaussians
-        amplitude_values = abs(center_values)/max(abs(var_max), abs(var_min))
-        sigma = (var_values[1] - var_values[0]) * 2.0
-
-        gaussians = []
-        gaussians = [np.asarray([center_values[i], amplitude_values[i]])
-                     for i in range(num_gauss)]
-        opacity_function = np.zeros(len(var_values))
-        for gaussian in gaussians:
-            opacity_function += gaussian[1] * np.exp(-1.0 * np.square(
-                var_values - gaussian[0])/(2.0 * sigma**2))
-        # Create opacity list with var_values, opacity function,
-        # midpoint value, sharpness
-        # Midpoint value used here is 0.5, sharpness value used is 0.0
-        opacity_list = []
-        for point in range(num_points):
-            opacity_list += [var_values[point],
-                             opacity_function[point], 0.5, 0.0]
-        var_pointwise_function.Points = opacity_list
+    if var_range is None:
+        var_range = scalar_var_source.PointData.GetArray(var).GetRange()
+    else:
+        set_data_range(var, var_lookup_table, var_range)
+    var_lookup_table.EnableOpacityMapping = 1
+    var_pointwise_function = GetOpacityTransferFunction(var)
+    # Opacity list with var values, opacity function, midpoint value
+    # (0.5) and sharpness (0.0)
+    var_pointwise_function.Points = get_opacity_points(
+        function_type, opacity_val, var_range, histogram, tolerance,
+        max_points)
     render_view.Update()
     return render_view
 
+
+def set_transfer_functions(var, render_view, display, scalar_var_source,
+                           scalar_properties, var_range, histogram,
+                           cache_directory):
+    '''
+    Set the color map (set_color_map) and opacity (set_opacity) of var
+    from the input file's Scalar_variable_properties. The resulting tables
+    are cached in cache_directory as ParaView presets, keyed on the
+    variable, range, color map and opacity parameters, and loaded from
+    there instead of being recomputed when rendering with the same ones.
+    '''
+    fixed_range = var_range is not None
+    if var_range is None:
+        var_range = scalar_var_source.PointData.GetArray(var).GetRange()
+    key = get_transfer_function_key(var, var_range,
+                                    scalar_properties.pv_color_map,
+                                    scalar_properties.pv_opacity, histogram)
+    preset = read_cached_preset(cache_directory, key)
+    if preset is None:
+        display, render_view, variable_lookup_table =\
+            set_color_map(var, render_view, display,
+                          scalar_properties.pv_color_map)
+        render_view = set_opacity(
+            var, scalar_properties.pv_opacity.pv_function_type,
+            scalar_properties.pv_opacity.pv_value, render_view,
+            scalar_var_source, variable_lookup_table,
+            var_range if fixed_range else None, histogram,
+            scalar_properties.pv_opacity.pv_tolerance,
+            scalar_properties.pv_opacity.pv_max_points)
+        preset_name = get_preset_name(
+            var + ' ' + scalar_properties.pv_color_map + ' ' +
+            scalar_properties.pv_opacity.pv_function_type, key)
+        write_cached_preset(cache_directory, key, make_preset(
+            preset_name,
+            variable_lookup_table.RGBPoints, variable_lookup_table.ColorSpace,
+            GetOpacityTransferFunction(var).Points))
+        return display, render_view, variable_lookup_table
+    # Same as set_color_map, with the cached color table instead of
+    # applying the preset
+    ColorBy(display, ('POINTS', var))
+    variable_lookup_table = GetColorTransferFunction(var)
+    variable_lookup_table.ColorSpace = preset['ColorSpace']
+    variable_lookup_table.RGBPoints = preset['RGBPoints']
+    display.SetScalarBarVisibility(render_view, True)
+    display.SetScaleArray = ['POINTS', var]
+    display.ScaleTransferFunction = 'PiecewiseFunction'
+    variable_lookup_table.EnableOpacityMapping = 1
+    GetOpacityTransferFunction(var).Points = preset['Points']
+    if fixed_range:
+        variable_lookup_table.AutomaticRescaleRangeMode = 'Never'
+    render_view.Update()
+    return display, render_view, variable_lookup_table
+
 # Next few functions apply filters on the source
 
-def tetrahedralize(scalar_var_source, render_view):
+def cached_tetrahedralize(var_source, cache_directory=None,
+                          xdmf_file_name=None):
+    '''
+    Same as the Tetrahedralize filter, but the tetrahedra are computed
+    once per mesh topology and reused for every time step with the same
+    cells, only the points and point data change (see TopologyCache).
+    They are also stored in cache_directory for later runs. Without a
+    cache_directory, for ex. for slices or clips whose cells change with
+    every time step, this is the Tetrahedralize filter. With the XDMF file
+    var_source reads, time steps whose connectivity is unchanged are found
+    without hashing it.
+    '''
+    if cache_directory is None:
+        return Tetrahedralize(Input=var_source)
+    return topology_cache_filter(var_source, 'tetrahedralize_data_object',
+                                 'Same as Input', cache_directory,
+                                 xdmf_file_name)
+
+
+def cached_merge_blocks(var_source, cache_directory=None,
+                        xdmf_file_name=None):
+    '''
+    Same as the MergeBlocks filter without merging points, but the cells
+    are merged once per mesh topology and only the points and point data
+    of a time step are put into them (see TopologyCache). They are also
+    stored in cache_directory for later runs. Without a cache_directory,
+    this is the MergeBlocks filter.
+    '''
+    if cache_directory is None:
+        merge_blocks = MergeBlocks(Input=var_source)
+        merge_blocks.MergePoints = 0
+        return merge_blocks
+    return topology_cache_filter(var_source, 'merge_blocks_data_object',
+                                 'vtkUnstructuredGrid', cache_directory,
+                                 xdmf_file_name)
+
+
+def topology_cache_filter(var_source, function_name, output_type,
+                          cache_directory, xdmf_file_name, arguments=()):
+    '''
+    Programmable filter calling a function of TopologyCache on its input,
+    with arguments between the output and the cache directory
+    '''
+    topology_filter = ProgrammableFilter(Input=var_source)
+    topology_filter.OutputDataSetType = output_type
+    topology_filter.Script =\
+        "from TopologyCache import " + function_name + "\n" +\
+        function_name + "(self.GetInputDataObject(0, 0), "\
+        "self.GetOutputDataObject(0),\n    " +\
+        "".join(repr(argument) + ", " for argument in arguments) +\
+        repr(cache_directory) + ", " + repr(xdmf_file_name) + ")\n"
+    return topology_filter
+
+
+def cached_weld_points(var_source, tolerance, cache_directory=None,
+                       xdmf_file_name=None):
+    '''
+    Merge the blocks and weld the points closer than tolerance times the
+    size of the mesh, the copies neighboring elements have of the points of
+    their shared faces, so later filters and glyphs do not work on them
+    again. Which points are welded is computed once per mesh topology
+    (see TopologyCache) and stored in cache_directory for later runs.
+    '''
+    return topology_cache_filter(var_source, 'weld_points_data_object',
+                                 'vtkUnstructuredGrid', cache_directory,
+                                 xdmf_file_name, [float(tolerance)])
+
+
+def get_filter_source(var_source, input_file):
+    '''
+    Source of the filters and glyphs: var_source, with its points welded if
+    Weld_points is set in the input file
+    '''
+    if not input_file.pv_weld_points:
+        return var_source
+    return cached_weld_points(var_source, input_file.pv_weld_tolerance,
+                              input_file.pv_cache_directory,
+                              input_file.pv_file_path)
+
+
+def tetrahedralize(scalar_var_source, render_view, cache_directory=None,
+                   xdmf_file_name=None):
     '''
     Apply tetrahedralize filter and update view 
     '''
-    tetrahedralize = Tetrahedralize(Input=scalar_var_source)
+    tetrahedralize = cached_tetrahedralize(scalar_var_source, cache_directory,
+                                           xdmf_file_name)
     Hide(scalar_var_source, render_view)
     scalar_var_display = Show(tetrahedralize, render_view)
     return scalar_var_display
 
 
+def lagrange_hexahedra(scalar_var_source, render_view, subdivision_level=1,
+                       cache_directory=None, xdmf_file_name=None):
+    '''
+    Make each element (the lattice of its Gauss-Lobatto points) one VTK
+    Lagrange hexahedron of the element's degree and update view. The cells
+    are made once per mesh topology (see TopologyCache). ParaView
+    tessellates their surface subdivision_level times when rendering.
+    '''
+    lagrange = topology_cache_filter(scalar_var_source,
+                                     'lagrange_hexahedra_data_object',
+                                     'Same as Input', cache_directory,
+                                     xdmf_file_name)
+    Hide(scalar_var_source, render_view)
+    scalar_var_display = Show(lagrange, render_view)
+    scalar_var_display.NonlinearSubdivisionLevel = subdivision_level
+    return scalar_var_display
+
+
+def show_element_cells(scalar_var_source, render_view, scalar_properties,
+                       cache_directory=None, xdmf_file_name=None):
+    '''
+    Show the elements as the Element_cells of the input file: tetrahedra
+    or one Lagrange hexahedron per element
+    '''
+    if scalar_properties.pv_element_cells == 'Lagrange':
+        return lagrange_hexahedra(scalar_var_source, render_view,
+                                  scalar_properties.pv_subdivision_level,
+                                  cache_directory, xdmf_file_name)
+    elif scalar_properties.pv_element_cells == 'Tetrahedra':
+        return tetrahedralize(scalar_var_source, render_view,
+                              cache_directory, xdmf_file_name)
+    raise ValueError("Unknown Element_cells: " +
+                     scalar_properties.pv_element_cells)
+
+
 def apply_clip(clip_properties, var, render_view, var_source):
     '''
     Apply the clip filter based on clip type chosen in Input file
@@ -218,20 +383,51 @@ def apply_slice(slice_properties, var, render_view, var_source):
     display = Show(slice_pv, render_view)
     return render_view, pv_slice, display
 
-def volume_render(scalar_var_source, render_view):
+def volume_render(scalar_var_source, render_view, cache_directory=None,
+                  xdmf_file_name=None):
     '''
-    
+    Merge the blocks into one grid (see cached_merge_blocks) and show it
+    as a volume
     '''
     material_library = GetMaterialLibrary()
     # not sure what this is for ^
-    merge_blocks = MergeBlocks(Input=scalar_var_source)
-    # Do not merge points
-    merge_blocks.MergePoints = 0
+    merge_blocks = cached_merge_blocks(scalar_var_source, cache_directory,
+                                       xdmf_file_name)
     merge_blocks_display = Show(merge_blocks, render_view)
     merge_blocks_display.SetRepresentationType('Volume')
     return merge_blocks_display
 
 
+def resampled_volume_render(scalar_var_source, render_view, var, resolution,
+                            bounds, cache_directory=None,
+                            xdmf_file_name=None):
+    '''
+    Resample var onto a uniform image of resolution points spanning bounds
+    and show it as a volume, which renders much faster than the
+    unstructured grid on CPU. The interpolation stencils are computed once
+    per mesh geometry and stored in cache_directory (see ResampleCache).
+    Points of the image outside the mesh are NaN.
+    '''
+    merge_blocks = cached_merge_blocks(scalar_var_source, cache_directory,
+                                       xdmf_file_name)
+    resample = ProgrammableFilter(Input=merge_blocks)
+    resample.OutputDataSetType = 'vtkImageData'
+    resample.RequestInformationScript =\
+        "from paraview import util\n"\
+        "util.SetOutputWholeExtent(self, " + repr(
+            [0, resolution[0] - 1, 0, resolution[1] - 1,
+             0, resolution[2] - 1]) + ")\n"
+    resample.Script =\
+        "from ResampleCache import resample_data_object\n"\
+        "resample_data_object(self.GetInputDataObject(0, 0), "\
+        "self.GetOutputDataObject(0),\n    " + repr(var) + ", " +\
+        repr(list(resolution)) + ", " + repr(list(bounds)) + ",\n    " +\
+        repr(cache_directory) + ", " + repr(xdmf_file_name) + ")\n"
+    resample_display = Show(resample, render_view)
+    resample_display.SetRepresentationType('Volume')
+    return resample_display
+
+
 # Functions used for warp
 def create_neg_scalar_var(scalar_var, var_source):
     '''
@@ -256,18 +452,20 @@ def create_log_scalar_var(scalar_var, var_source):
     
 
 def add_scalar_warp(scalar_var, var_source, scale_type, scale_factor,
-                    render_view):
+                    render_view, cache_directory=None,
+                    xdmf_file_name=None):
     '''
     Create a surface warp.
     Warps by variable being visualized
     '''
-    if scale_type == 'Linear'
-    scaling_scalar_var, calculator = create_neg_scalar_var(scalar_var,
-                                                           var_source)
+    if scale_type == 'Linear':
+        scaling_scalar_var, calculator = create_neg_scalar_var(scalar_var,
+                                                               var_source)
     elif scale_type == 'Log':
         scaling_scalar_var, calculator = create_log_scalar_var(scalar_var,
                                                                var_source)
-    tetrahedralize = Tetrahedralize(Input=calculator)
+    tetrahedralize = cached_tetrahedralize(calculator, cache_directory,
+                                           xdmf_file_name)
     slice_pv = Slice(Input=tetrahedralize)
     slice_pv.SliceType = 'Plane'
     slice_pv.SliceOffsetValues = [0.0]
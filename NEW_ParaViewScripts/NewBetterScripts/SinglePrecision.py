@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+# Distributed under the MIT License.
+# See LICENSE.txt for details.
+
+import argparse
+import os
+import xml.etree.ElementTree as ElementTree
+import numpy as np
+from XdmfIndex import get_xdmf_index
+from DataScan import scan_mesh_bounds, scan_variable_range
+
+# Reading the coordinates and attributes of an XDMF file as float32: the
+# copy of the XDMF file written by write_single_precision_file declares
+# its floating point DataItems single precision, still referencing the
+# original HDF5 datasets, so the HDF5 library converts the doubles while
+# the XDMF reader reads them and no double array is ever held in memory
+# (read_data_items in DataScan does the same). get_precision_report
+# compares the ranges of the data read in both precisions.
+
+# Suffix of the single precision copy of an XDMF file
+SINGLE_PRECISION_SUFFIX = '_float32'
+# Relative error of a range above which the report warns, the colors of
+# values this close cannot be told apart in single precision
+RANGE_ERROR_WARNING = 1e-4
+
+
+def get_single_precision_file_name(xdmf_file_name):
+    '''
+    Name of the single precision copy of an XDMF file, next to it
+    '''
+    stem, extension = os.path.splitext(xdmf_file_name)
+    return stem + SINGLE_PRECISION_SUFFIX + extension
+
+
+def write_single_precision_file(xdmf_file_name):
+    '''
+    Write the single precision copy of an XDMF file if it is missing or
+    older than the file, and return its name
+    '''
+    single_precision_file_name = get_single_precision_file_name(
+        xdmf_file_name)
+    if os.path.isfile(single_precision_file_name) and\
+       os.path.getmtime(single_precision_file_name) >=\
+       os.path.getmtime(xdmf_file_name):
+        return single_precision_file_name
+    tree = ElementTree.parse(xdmf_file_name)
+    for data_item in tree.iter('DataItem'):
+        if data_item.get('NumberType', 'Float') in ('Float', 'Double'):
+            data_item.set('NumberType', 'Float')
+            data_item.set('Precision', '4')
+    temporary_name = single_precision_file_name + '.tmp' + str(os.getpid())
+    tree.write(temporary_name, encoding='utf-8', xml_declaration=True)
+    os.rename(temporary_name, single_precision_file_name)
+    return single_precision_file_name
+
+
+def get_range_error(double_range, single_range):
+    '''
+    Largest difference between the bounds of a range read in double and
+    in single precision, relative to the width of the range (to the
+    bounds' magnitude for an empty range)
+    '''
+    double_range = np.asarray(double_range, dtype=np.float64)
+    single_range = np.asarray(single_range, dtype=np.float64)
+    if not np.all(np.isfinite(single_range)):
+        return np.inf
+    scale = double_range[1] - double_range[0]
+    if scale <= 0.0:
+        scale = np.abs(double_range).max()
+    return np.abs(single_range - double_range).max() /\
+        max(scale, np.finfo(np.float64).tiny)
+
+
+def get_precision_report(xdmf_file_name, variables,
+                         number_of_processes=None):
+    '''
+    Ranges of the coordinates and of each of variables read in double and
+    in single precision from an XDMF file, and their relative errors (see
+    get_range_error): a list of (name, double range, single range, error).
+    The ranges are scanned from the HDF5 files and cached.
+    '''
+    double_index = get_xdmf_index(xdmf_file_name)
+    single_index = get_xdmf_index(
+        write_single_precision_file(xdmf_file_name))
+    double_bounds = scan_mesh_bounds(double_index, number_of_processes)
+    single_bounds = scan_mesh_bounds(single_index, number_of_processes)
+    ranges = [(name, double_bounds[2 * dimension:2 * dimension + 2],
+               single_bounds[2 * dimension:2 * dimension + 2])
+              for dimension, name in enumerate(['x', 'y', 'z'])]
+    ranges += [(variable,
+                scan_variable_range(double_index, variable,
+                                    number_of_processes),
+                scan_variable_range(single_index, variable,
+                                    number_of_processes))
+               for variable in variables]
+    return [(name, tuple(double_range), tuple(single_range),
+             get_range_error(double_range, single_range))
+            for name, double_range, single_range in ranges]
+
+
+def print_precision_report(report):
+    '''
+    Print a report of get_precision_report, warning about the ranges with
+    an error above RANGE_ERROR_WARNING
+    '''
+    print('Ranges read in double and in single precision:')
+    for name, double_range, single_range, error in report:
+        print('  {0}: [{1!r}, {2!r}] -> [{3!r}, {4!r}], relative error '
+              '{5:.2e}{6}'.format(name, double_range[0], double_range[1],
+                                  single_range[0], single_range[1], error,
+                                  ' WARNING' if error > RANGE_ERROR_WARNING
+                                  else ''))
+    return None
+
+
+def parse_cmd_line():
+    '''
+    parse command-line arguments
+    :return: dictionary of the command-line args, dashes are underscores
+    '''
+    parser = argparse.ArgumentParser(
+        description='Write the single precision copy of an XDMF file and '
+        'report the error on the ranges of its data',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('xdmf_file', type=str,
+                        help="path to the XDMF (.xmf) file")
+    parser.add_argument('--variables', type=str, nargs='*', default=None,
+                        help="attributes to report on, all by default")
+    return vars(parser.parse_args())
+
+
+def main(args):
+    '''
+    :param args: command line arguments
+    '''
+    variables = args["variables"]
+    if variables is None:
+        variables = get_xdmf_index(args["xdmf_file"]).get_attribute_names()
+    print('Wrote', write_single_precision_file(args["xdmf_file"]))
+    print_precision_report(get_precision_report(args["xdmf_file"],
+                                                variables))
+    return None
+
+
+if __name__ == "__main__":
+    try:
+        main(parse_cmd_line())
+    except KeyboardInterrupt:
+        pass
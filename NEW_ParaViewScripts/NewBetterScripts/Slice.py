@@ -22,20 +22,30 @@ def main(args):
     :param args: command line arguments
     Render image(s) based on parameters specified
     '''
-    
+    # Split the timesteps between worker processes if requested,
+    # each worker builds its own pipeline
+    if launch_workers(args):
+        return None
+
     # Disable automatic camera reset on 'Show'
     paraview.simple._DisableFirstRenderCameraReset()
     # Get data from file, set default camera properties    
     input_file = load_input_file(args["input_file"])
     scalar_variable = input_file.pv_scalar_variable_properties.pv_variable_name
-    xdmf_reader= get_xdmf_reader(input_file.pv_file_path)
+    xdmf_reader= get_xdmf_reader(
+        input_file.pv_file_path, get_required_point_arrays(input_file))
     render_view = CreateRenderView()
     set_default_camera(render_view)
+    # Only the elements the filter can touch are read, and the points
+    # neighboring elements share are welded, if asked for
+    filter_source = get_filter_source(get_region_source(
+        xdmf_reader, input_file,
+        get_slice_region(input_file.pv_filters.pv_slice)), input_file)
 
     # Slice data
     render_view, pv_slice, display=\
             apply_slice(input_file.pv_filters.pv_slice,
-                        scalar_variable, render_view, xdmf_reader)
+                        scalar_variable, render_view, filter_source)
     # Uncomment next line to tetrahedralize
     display=tetrahedralize(pv_slice, render_view)
 
@@ -43,13 +53,11 @@ def main(args):
     display=set_representation(
         input_file.pv_scalar_variable_properties.pv_representation,display)
     display, render_view, variable_lookup_table=\
-    set_color_map(scalar_variable, render_view, display,
-                  input_file.pv_scalar_variable_properties.pv_color_map)
-    render_view=\
-    set_opacity(scalar_variable,
-        input_file.pv_scalar_variable_properties.pv_opacity.pv_function_type,
-        input_file.pv_scalar_variable_properties.pv_opacity.pv_value,
-        render_view, xdmf_reader, variable_lookup_table)
+    set_transfer_functions(scalar_variable, render_view, display,
+                           xdmf_reader,
+                           input_file.pv_scalar_variable_properties,
+                           get_data_range(input_file), get_histogram(input_file),
+                           input_file.pv_cache_directory)
 
     # Update the view
     update_view(render_view)
@@ -59,7 +67,8 @@ def main(args):
     render_view.ResetCamera()
 
     # Save images
-    save_images(render_view, xdmf_reader, args["save"])
+    save_images(render_view, xdmf_reader, args,
+                input_file.pv_save_properties)
     
     return None
 
@@ -0,0 +1,77 @@
+# !/usr/bin/env python
+# Distributed under the MIT License.
+# See LICENSE.txt for details.
+
+# Unit tests of the element layouts and of the lattices of the levels of
+# detail, run with python -m unittest discover -p 'Test_*.py'
+
+import unittest
+import numpy as np
+from DataScan import get_element_layouts, get_lattice_hexahedra
+from DataPyramid import compute_level_layout, get_level_lattice
+
+
+def get_elements_hexahedra(element_extents):
+    '''
+    Hexahedra of elements of element_extents points per dimension, the
+    points of each element after those of the previous one
+    '''
+    hexahedra = []
+    first_point = 0
+    for extents in element_extents:
+        hexahedra.append(first_point + get_lattice_hexahedra(extents))
+        first_point += np.prod(extents)
+    return np.concatenate(hexahedra)
+
+
+class TestElementLayouts(unittest.TestCase):
+    def test_elements(self):
+        element_extents = [(3, 3, 3), (2, 4, 3), (3, 3, 3)]
+        first_hexahedra, first_points, extents = get_element_layouts(
+            get_elements_hexahedra(element_extents))
+        np.testing.assert_array_equal(first_hexahedra, [0, 8, 14])
+        np.testing.assert_array_equal(first_points, [0, 27, 51])
+        np.testing.assert_array_equal(extents, element_extents)
+
+    def test_not_elements(self):
+        hexahedra = get_elements_hexahedra([(3, 3, 3)])
+        with self.assertRaises(ValueError):
+            get_element_layouts(hexahedra[::-1])
+        with self.assertRaises(ValueError):
+            get_element_layouts(np.zeros((0, 8), dtype=np.int64))
+
+
+class TestLevelLattice(unittest.TestCase):
+    def test_keeps_ends(self):
+        lattice_ids, level_extents = get_level_lattice((5, 3, 2), 3)
+        self.assertEqual(level_extents, (3, 3, 2))
+        # x keeps 0, 2 and 4, y and z keep every point
+        expected_ids = [i + 5 * (j + 3 * k) for k in range(2)
+                        for j in range(3) for i in (0, 2, 4)]
+        np.testing.assert_array_equal(lattice_ids, expected_ids)
+
+    def test_more_points_than_lattice(self):
+        lattice_ids, level_extents = get_level_lattice((2, 2, 2), 4)
+        self.assertEqual(level_extents, (2, 2, 2))
+        np.testing.assert_array_equal(lattice_ids, np.arange(8))
+
+
+class TestLevelLayout(unittest.TestCase):
+    def test_level_of_elements(self):
+        hexahedra = get_elements_hexahedra([(5, 5, 5), (3, 3, 3)])
+        point_ids, cells = compute_level_layout(hexahedra, 3)
+        # 27 points per element, the second one is kept as is
+        self.assertEqual(len(point_ids), 54)
+        np.testing.assert_array_equal(point_ids[27:], 125 + np.arange(27))
+        self.assertEqual(len(cells), 16)
+        np.testing.assert_array_equal(cells[:8], get_lattice_hexahedra(
+            (3, 3, 3)))
+        np.testing.assert_array_equal(cells[8:], 27 + get_lattice_hexahedra(
+            (3, 3, 3)))
+        # The level is itself laid out as elements
+        np.testing.assert_array_equal(get_element_layouts(cells)[2],
+                                      [(3, 3, 3), (3, 3, 3)])
+
+
+if __name__ == '__main__':
+    unittest.main()
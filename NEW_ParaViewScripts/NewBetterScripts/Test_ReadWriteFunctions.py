@@ -0,0 +1,154 @@
+# !/usr/bin/env python
+# Distributed under the MIT License.
+# See LICENSE.txt for details.
+
+# Unit tests of the timestep selection, the split of the timesteps between
+# workers and the resume manifests, run with pvpython -m unittest discover
+# -p 'Test_*.py'. ReadWriteFunctions imports paraview.simple and is
+# Python 2 code, these tests are skipped without ParaView's Python 2.
+
+import os
+import shutil
+import tempfile
+import unittest
+try:
+    from ReadWriteFunctions import get_completed_frames,\
+        get_selected_time_step_indices, get_worker_time_step_indices,\
+        is_complete_image, open_manifest, read_manifest
+    has_paraview = True
+except (ImportError, SyntaxError):
+    has_paraview = False
+
+
+class SaveProperties():
+    def __init__(self, start_time=None, end_time=None, time_stride=1,
+                 max_frames=None):
+        '''
+        The Save_properties read by get_selected_time_step_indices
+        '''
+        self.pv_start_time = start_time
+        self.pv_end_time = end_time
+        self.pv_time_stride = time_stride
+        self.pv_max_frames = max_frames
+
+
+@unittest.skipUnless(has_paraview, "needs pvpython")
+class TestSelectedTimeSteps(unittest.TestCase):
+    def test_every_time_step(self):
+        self.assertEqual(get_selected_time_step_indices(
+            [0.0, 1.0, 2.0], SaveProperties()), [0, 1, 2])
+
+    def test_start_end_and_stride(self):
+        times = [0.5 * index for index in range(10)]
+        self.assertEqual(get_selected_time_step_indices(
+            times, SaveProperties(1.0, 4.0, 2)), [2, 4, 6, 8])
+
+    def test_max_frames_keeps_first_and_last(self):
+        self.assertEqual(get_selected_time_step_indices(
+            list(range(11)), SaveProperties(max_frames=3)), [0, 5, 10])
+
+    def test_no_time_step(self):
+        with self.assertRaises(SystemExit):
+            get_selected_time_step_indices([0.0, 1.0],
+                                           SaveProperties(start_time=2.0))
+
+
+@unittest.skipUnless(has_paraview, "needs pvpython")
+class TestWorkerTimeSteps(unittest.TestCase):
+    def test_every_time_step_once(self):
+        for frame_distribution in ['round-robin', 'blocks']:
+            for number_of_workers in range(1, 8):
+                time_steps = sum([get_worker_time_step_indices(
+                    10, worker_index, number_of_workers, frame_distribution)
+                    for worker_index in range(number_of_workers)], [])
+                self.assertEqual(sorted(time_steps), list(range(10)))
+
+    def test_round_robin(self):
+        self.assertEqual(get_worker_time_step_indices(10, 1, 3,
+                                                      'round-robin'),
+                         [1, 4, 7])
+
+    def test_blocks(self):
+        self.assertEqual([get_worker_time_step_indices(
+            10, worker_index, 3, 'blocks') for worker_index in range(3)],
+            [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]])
+
+    def test_unknown_distribution(self):
+        with self.assertRaises(SystemExit):
+            get_worker_time_step_indices(10, 0, 3, 'random')
+
+
+@unittest.skipUnless(has_paraview, "needs pvpython")
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.save = os.path.join(self.directory, 'movie')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_resume(self):
+        manifest = open_manifest(self.save, 'config', 0, 2, False)
+        manifest.write('- 3\n- 5\n')
+        manifest.close()
+        manifest = open_manifest(self.save, 'config', 0, 2, True)
+        manifest.write('- 7\n')
+        manifest.close()
+        self.assertEqual(get_completed_frames(self.save, 'config'),
+                         set([3, 5, 7]))
+        # Frames rendered with another input file are not reused
+        self.assertEqual(get_completed_frames(self.save, 'other config'),
+                         set())
+
+    def test_partial_last_line(self):
+        manifest = open_manifest(self.save, 'config', 0, 1, False)
+        manifest.write('- 3\n- 1')
+        manifest.close()
+        self.assertEqual(read_manifest(self.save + '_manifest.yaml',
+                                       'config'), set([3]))
+
+    def test_missing_manifest(self):
+        self.assertIsNone(read_manifest(self.save + '_manifest.yaml',
+                                        'config'))
+
+
+@unittest.skipUnless(has_paraview, "needs pvpython")
+class TestCompleteImage(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_image(self, file_name, contents):
+        image_name = os.path.join(self.directory, file_name)
+        with open(image_name, 'wb') as image:
+            image.write(contents)
+        return image_name
+
+    def test_png(self):
+        png = b'\x89PNG\r\n\x1a\n' + b'chunks' +\
+            b'\x00\x00\x00\x00IEND\xaeB`\x82'
+        self.assertTrue(is_complete_image(self.write_image('a.png', png)))
+        self.assertFalse(is_complete_image(self.write_image('b.png',
+                                                            png[:-4])))
+
+    def test_jpeg(self):
+        jpeg = b'\xff\xd8' + b'segments' + b'\xff\xd9'
+        self.assertTrue(is_complete_image(self.write_image('a.jpg', jpeg)))
+        self.assertFalse(is_complete_image(self.write_image('b.jpg',
+                                                            jpeg[:-1])))
+
+    def test_webp(self):
+        webp = b'RIFF\x08\x00\x00\x00WEBPdata'
+        self.assertTrue(is_complete_image(self.write_image('a.webp', webp)))
+        self.assertFalse(is_complete_image(self.write_image('b.webp',
+                                                            webp[:-1])))
+
+    def test_missing_image(self):
+        self.assertFalse(is_complete_image(os.path.join(self.directory,
+                                                        'c.png')))
+
+
+if __name__ == '__main__':
+    unittest.main()
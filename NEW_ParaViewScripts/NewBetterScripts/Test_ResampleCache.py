@@ -0,0 +1,50 @@
+# !/usr/bin/env python
+# Distributed under the MIT License.
+# See LICENSE.txt for details.
+
+# Unit tests of the interpolation weights of the resampling stencils,
+# run with python -m unittest discover -p 'Test_*.py'
+
+import unittest
+import numpy as np
+from ResampleCache import HEXAHEDRON_CORNERS, hexahedron_weights,\
+    tetrahedron_weights
+
+
+class TestHexahedronWeights(unittest.TestCase):
+    def test_corners(self):
+        corners = np.broadcast_to(HEXAHEDRON_CORNERS, (8, 8, 3))
+        np.testing.assert_allclose(
+            hexahedron_weights(corners, HEXAHEDRON_CORNERS), np.eye(8),
+            atol=1e-12)
+
+    def test_reproduces_trilinear_function(self):
+        random = np.random.RandomState(0)
+        # Distorted hexahedra: the unit cube with its corners moved
+        corners = HEXAHEDRON_CORNERS +\
+            random.uniform(-0.1, 0.1, (50, 8, 3))
+        parametric_coordinates = random.uniform(0.0, 1.0, (50, 3))
+        factors = np.where(HEXAHEDRON_CORNERS > 0,
+                           parametric_coordinates[:, np.newaxis, :],
+                           1.0 - parametric_coordinates[:, np.newaxis, :])
+        expected_weights = np.prod(factors, axis=2)
+        targets = np.einsum('nk,nki->ni', expected_weights, corners)
+        weights = hexahedron_weights(corners, targets)
+        np.testing.assert_allclose(weights, expected_weights, atol=1e-9)
+        np.testing.assert_allclose(np.einsum('nk,nki->ni', weights, corners),
+                                   targets, atol=1e-9)
+
+
+class TestTetrahedronWeights(unittest.TestCase):
+    def test_barycentric_coordinates(self):
+        random = np.random.RandomState(1)
+        corners = random.uniform(0.0, 1.0, (50, 4, 3))
+        expected_weights = random.dirichlet(np.ones(4), 50)
+        targets = np.einsum('nk,nki->ni', expected_weights, corners)
+        weights = tetrahedron_weights(corners, targets)
+        np.testing.assert_allclose(weights, expected_weights, atol=1e-9)
+        np.testing.assert_allclose(weights.sum(axis=1), 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+# !/usr/bin/env python
+# Distributed under the MIT License.
+# See LICENSE.txt for details.
+
+# Unit tests of the point welding, run with
+# python -m unittest discover -p 'Test_*.py'
+
+import unittest
+import numpy as np
+from TopologyCache import compute_weld, compute_weld_pairs
+
+
+def get_brute_force_pairs(points, tolerance):
+    '''
+    Pairs of different points at most tolerance apart, from all distances
+    '''
+    distances = np.sqrt(np.sum((points[:, np.newaxis, :] -
+                                points[np.newaxis, :, :])**2, axis=2))
+    first_ids, second_ids = np.nonzero(distances <= tolerance)
+    different = first_ids != second_ids
+    return set(zip(first_ids[different], second_ids[different]))
+
+
+class TestComputeWeldPairs(unittest.TestCase):
+    def test_matches_brute_force(self):
+        random = np.random.RandomState(0)
+        tolerance = 0.05
+        for trial in range(10):
+            # Clusters of points around a few centers, some within
+            # tolerance of each other, across cell boundaries
+            centers = random.uniform(-1.0, 1.0, (20, 3))
+            points = centers[random.randint(0, 20, 300)] +\
+                random.normal(0.0, tolerance, (300, 3))
+            first_ids, second_ids = compute_weld_pairs(points, tolerance)
+            pairs = list(zip(first_ids, second_ids))
+            self.assertEqual(len(pairs), len(set(pairs)))
+            self.assertEqual(set(pairs),
+                             get_brute_force_pairs(points, tolerance))
+
+    def test_duplicate_points(self):
+        points = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0],
+                           [0.0, 0.0, 0.0]])
+        first_ids, second_ids = compute_weld_pairs(points, 1e-8)
+        self.assertEqual(set(zip(first_ids, second_ids)),
+                         set([(0, 2), (2, 0)]))
+
+
+class TestComputeWeld(unittest.TestCase):
+    def test_welds_do_not_chain(self):
+        # Each point is within tolerance of the next only
+        points = np.array([[0.0, 0.0, 0.0], [0.8, 0.0, 0.0],
+                           [1.6, 0.0, 0.0], [2.4, 0.0, 0.0]])
+        kept_ids, welded_indices = compute_weld(points, 1.0)
+        np.testing.assert_array_equal(kept_ids, [0, 2])
+        np.testing.assert_array_equal(kept_ids[welded_indices], [0, 0, 2, 2])
+
+    def test_kept_points_apart_and_welded_points_close(self):
+        random = np.random.RandomState(1)
+        tolerance = 0.05
+        points = random.uniform(0.0, 0.5, (400, 3))
+        kept_ids, welded_indices = compute_weld(points, tolerance)
+        self.assertEqual(len(get_brute_force_pairs(points[kept_ids],
+                                                   tolerance)), 0)
+        distances = np.sqrt(np.sum(
+            (points - points[kept_ids[welded_indices]])**2, axis=1))
+        self.assertLessEqual(distances.max(), tolerance)
+        np.testing.assert_array_equal(welded_indices[kept_ids],
+                                      np.arange(len(kept_ids)))
+
+    def test_zero_tolerance_keeps_every_point(self):
+        points = np.zeros((3, 3))
+        kept_ids, welded_indices = compute_weld(points, 0.0)
+        np.testing.assert_array_equal(kept_ids, [0, 1, 2])
+        np.testing.assert_array_equal(welded_indices, [0, 1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
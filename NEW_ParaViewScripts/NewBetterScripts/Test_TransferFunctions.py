@@ -0,0 +1,73 @@
+# !/usr/bin/env python
+# Distributed under the MIT License.
+# See LICENSE.txt for details.
+
+# Unit tests of the opacity functions and their simplification, run with
+# python -m unittest discover -p 'Test_*.py'
+
+import unittest
+import numpy as np
+from TransferFunctions import get_preset_name, histogram_opacity,\
+    simplify_curve
+
+
+class TestHistogramOpacity(unittest.TestCase):
+    def test_most_populated_bin_is_opacity_val(self):
+        var_values, opacity_function = histogram_opacity(
+            [0, 1, 3], np.array([0.0, 1.0, 2.0, 3.0]), 0.5)
+        np.testing.assert_allclose(var_values, [0.5, 1.5, 2.5])
+        np.testing.assert_allclose(opacity_function,
+                                   [0.0, 0.25, 0.5])
+
+    def test_empty_histogram_is_transparent(self):
+        var_values, opacity_function = histogram_opacity(
+            [0, 0], np.array([0.0, 1.0, 2.0]), 0.5)
+        np.testing.assert_array_equal(opacity_function, [0.0, 0.0])
+
+
+class TestSimplifyCurve(unittest.TestCase):
+    def test_straight_line_keeps_end_points(self):
+        var_values = np.linspace(0.0, 1.0, 11)
+        np.testing.assert_array_equal(
+            simplify_curve(var_values, 2.0 * var_values, 1e-12), [0, 10])
+
+    def test_keeps_corner(self):
+        var_values = np.linspace(0.0, 1.0, 11)
+        opacity_function = np.minimum(var_values, 0.3)
+        np.testing.assert_array_equal(
+            simplify_curve(var_values, opacity_function, 1e-12), [0, 3, 10])
+
+    def test_within_tolerance(self):
+        var_values = np.linspace(-1.0, 1.0, 201)
+        opacity_function = np.exp(-var_values**2 / 0.1)
+        kept = simplify_curve(var_values, opacity_function, 0.01)
+        interpolated = np.interp(var_values, var_values[kept],
+                                 opacity_function[kept])
+        self.assertLessEqual(np.abs(interpolated - opacity_function).max(),
+                             0.01)
+        self.assertLess(len(kept), len(var_values))
+
+    def test_max_points(self):
+        var_values = np.linspace(-1.0, 1.0, 201)
+        opacity_function = np.exp(-var_values**2 / 0.1)
+        kept = simplify_curve(var_values, opacity_function, 0.0, 5)
+        self.assertEqual(len(kept), 5)
+        self.assertEqual(kept[0], 0)
+        self.assertEqual(kept[-1], 200)
+
+    def test_single_point(self):
+        np.testing.assert_array_equal(
+            simplify_curve(np.array([1.0]), np.array([0.5]), 0.0), [0])
+
+
+class TestPresetName(unittest.TestCase):
+    def test_name_ends_with_key(self):
+        self.assertEqual(get_preset_name('Psi jet Ramp', '0123456789abcdef'),
+                         'Psi jet Ramp 01234567')
+        self.assertEqual(get_preset_name('Psi jet Ramp 01234567',
+                                         '0123456789abcdef'),
+                         'Psi jet Ramp 01234567')
+
+
+if __name__ == '__main__':
+    unittest.main()
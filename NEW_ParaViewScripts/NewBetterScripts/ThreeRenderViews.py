@@ -46,7 +46,8 @@ def main(args):
     layout.AssignView(2, render_view2)
     layout.AssignView(4, render_view3)
 
-    xdmf_reader = get_xdmf_reader(input_file.pv_file_path)
+    xdmf_reader = get_xdmf_reader(
+        input_file.pv_file_path, get_required_point_arrays(input_file))
     SetActiveView(render_view1)
     # Add script to render in first view
 
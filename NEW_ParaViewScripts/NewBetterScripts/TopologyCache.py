@@ -0,0 +1,985 @@
+#!/usr/bin/env python
+
+# Distributed under the MIT License.
+# See LICENSE.txt for details.
+
+import hashlib
+import itertools
+import os
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+from XdmfIndex import get_xdmf_index
+from DataScan import get_element_layouts, get_lattice_hexahedra,\
+    scan_mesh_changes
+
+# Tetrahedralization of unstructured grids that is computed once per mesh
+# topology and reused for every time step with the same cells: only the
+# point coordinates and point data of a time step are put on the cached
+# tetrahedra. Used by the programmable filter of cached_tetrahedralize
+# (SetDisplayFunctions). The tetrahedra are also stored in the cache
+# directory, so later runs on the same data skip the filter altogether.
+# With the XDMF file the data comes from, the connectivity is only hashed
+# for the first time step of each topology, see scan_mesh_changes.
+# Making each element of SpECTRE data, a lattice of Gauss-Lobatto points
+# written as the hexahedra between them, one Lagrange hexahedron of the
+# element's degree is cached likewise, see lagrange_hexahedra_data_object.
+# The same goes for merging the blocks of a multiblock data set into one
+# unstructured grid (the MergeBlocks filter without merging points), see
+# merge_blocks_data_object and cached_merge_blocks, and for welding the
+# points neighboring elements share, see weld_points_data_object.
+
+# Field array of merged blocks holding the offsets of the blocks' points
+BLOCK_OFFSETS_NAME = 'Block_point_offsets'
+# numpy type of VTK point ids
+ID_TYPE = numpy_support.get_numpy_array_type(vtk.VTK_ID_TYPE)
+# Odd factors mixing the cell indices of points into one hash, see
+# get_weld_cell_keys
+WELD_HASH_FACTORS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F,
+                              0x165667B19E3779F9], dtype=np.uint64)
+
+# Cell array of the tetrahedra and the cell each comes from, by topology key
+loaded_tetrahedra = {}
+# Cell array of the Lagrange hexahedra, their degrees and the first
+# hexahedron of each element, by topology key
+loaded_lagrange_hexahedra = {}
+# Order of the points of Lagrange hexahedra, by numbers of points of the
+# element in each dimension
+lagrange_point_orders = {}
+# Welded points, the welded point of each point and the welded cells, by
+# weld key (topology and tolerance)
+loaded_welds = {}
+# Topology keys and the numbers of points and cells of the data they were
+# computed for, by XDMF file, topology id (see scan_mesh_changes) and
+# block, so the cells of a time step whose topology was seen before are
+# not hashed again
+topology_keys = {}
+# Times, topology ids and geometry ids of the time steps, by XDMF file.
+# The ids are None without h5py, the cells are then always hashed.
+loaded_mesh_ids = {}
+# Unstructured grid holding the cells of the merged blocks, by key of
+# the topologies of the blocks
+loaded_merged_topologies = {}
+# Points of the last merged time step and its geometry, reused while the
+# geometry is unchanged and they are the points of the blocks
+merged_points = {}
+
+
+def get_cell_arrays(unstructured_grid):
+    '''
+    numpy views of the cells of an unstructured grid, which together
+    identify its topology
+    '''
+    cells = unstructured_grid.GetCells()
+    if hasattr(cells, 'GetConnectivityArray'):
+        cell_arrays = [cells.GetConnectivityArray(), cells.GetOffsetsArray()]
+    else:
+        # VTK 8 and older store [number of points, ids...] per cell
+        cell_arrays = [cells.GetData()]
+    cell_arrays.append(unstructured_grid.GetDistinctCellTypesArray())
+    return [numpy_support.vtk_to_numpy(cell_array)
+            for cell_array in cell_arrays]
+
+
+def get_tetrahedra_ids(cells):
+    '''
+    (number of tetrahedra, 4) point ids of a cell array of tetrahedra
+    '''
+    if hasattr(cells, 'GetConnectivityArray'):
+        return numpy_support.vtk_to_numpy(
+            cells.GetConnectivityArray()).reshape(-1, 4)
+    return numpy_support.vtk_to_numpy(cells.GetData()).reshape(-1, 5)[:, 1:]
+
+
+def make_cell_array(cell_point_ids, offsets=None):
+    '''
+    vtkCellArray of cells given as (number of cells, points per cell)
+    point ids, or as the point ids of every cell one after the other with
+    the offsets of the cells in them (and their total number at the end)
+    '''
+    if offsets is None:
+        offsets = np.arange(0, cell_point_ids.size + 1,
+                            max(cell_point_ids.shape[1], 1))
+    connectivity = np.ravel(cell_point_ids).astype(ID_TYPE)
+    cell_array = vtk.vtkCellArray()
+    if hasattr(cell_array, 'GetConnectivityArray'):
+        cell_array.SetData(
+            numpy_support.numpy_to_vtkIdTypeArray(
+                np.asarray(offsets).astype(ID_TYPE), deep=1),
+            numpy_support.numpy_to_vtkIdTypeArray(connectivity, deep=1))
+    else:
+        cell_array.SetCells(len(offsets) - 1,
+                            numpy_support.numpy_to_vtkIdTypeArray(
+                                np.insert(connectivity, offsets[:-1],
+                                          np.diff(offsets)).astype(ID_TYPE),
+                                deep=1))
+    return cell_array
+
+
+def get_topology_key(unstructured_grid):
+    '''
+    Hash of the cells and number of points of an unstructured grid
+    '''
+    topology_hash = hashlib.sha1(
+        str(unstructured_grid.GetNumberOfPoints()).encode('utf-8'))
+    for cell_array in get_cell_arrays(unstructured_grid):
+        topology_hash.update(np.ascontiguousarray(cell_array))
+    return topology_hash.hexdigest()
+
+
+def get_tetrahedra_file_name(cache_directory, topology_key):
+    '''
+    Name of the file caching the tetrahedra of a topology
+    '''
+    return os.path.join(cache_directory, 'tetrahedra_' + topology_key + '.npz')
+
+
+def compute_tetrahedra(unstructured_grid):
+    '''
+    Run the Tetrahedralize filter (vtkDataSetTriangleFilter) on the cells
+    of an unstructured grid. Returns the (number of tetrahedra, 4) point
+    ids, which index the grid's points as the filter keeps them, and the
+    id of the cell each tetrahedron comes from.
+    '''
+    topology = vtk.vtkUnstructuredGrid()
+    topology.ShallowCopy(unstructured_grid)
+    topology.GetPointData().Initialize()
+    topology.GetCellData().Initialize()
+    cell_ids = numpy_support.numpy_to_vtk(
+        np.arange(unstructured_grid.GetNumberOfCells(), dtype=np.int64),
+        deep=1)
+    cell_ids.SetName('Original_cell_ids')
+    topology.GetCellData().AddArray(cell_ids)
+    triangle_filter = vtk.vtkDataSetTriangleFilter()
+    triangle_filter.TetrahedraOnlyOn()
+    triangle_filter.SetInputData(topology)
+    triangle_filter.Update()
+    tetrahedra_grid = triangle_filter.GetOutput()
+    if tetrahedra_grid.GetNumberOfPoints() !=\
+       unstructured_grid.GetNumberOfPoints():
+        raise ValueError("Tetrahedralize added points, its output cannot "
+                         "be cached")
+    return np.array(get_tetrahedra_ids(tetrahedra_grid.GetCells())),\
+        numpy_support.vtk_to_numpy(
+            tetrahedra_grid.GetCellData().GetArray('Original_cell_ids'))
+
+
+def load_tetrahedra(unstructured_grid, topology_key, cache_directory=None):
+    '''
+    Cell array of the tetrahedra of a topology and the cell each comes
+    from, read from the cache directory or computed and stored there
+    '''
+    tetrahedra = None
+    if cache_directory is not None:
+        tetrahedra_file_name = get_tetrahedra_file_name(cache_directory,
+                                                        topology_key)
+        try:
+            with np.load(tetrahedra_file_name) as tetrahedra_file:
+                tetrahedra = tetrahedra_file['tetrahedra']
+                cell_ids = tetrahedra_file['cell_ids']
+        except Exception:
+            tetrahedra = None
+    if tetrahedra is None:
+        tetrahedra, cell_ids = compute_tetrahedra(unstructured_grid)
+        if cache_directory is not None:
+            try:
+                if not os.path.isdir(cache_directory):
+                    os.makedirs(cache_directory)
+                temporary_name = tetrahedra_file_name + '.tmp' +\
+                    str(os.getpid())
+                with open(temporary_name, 'wb') as tetrahedra_file:
+                    np.savez(tetrahedra_file, tetrahedra=tetrahedra,
+                             cell_ids=cell_ids)
+                os.rename(temporary_name, tetrahedra_file_name)
+            except (IOError, OSError):
+                print('Could not cache the tetrahedra in', cache_directory)
+    return make_cell_array(tetrahedra), cell_ids
+
+
+def get_time_step_index(data_object, xdmf_file_name):
+    '''
+    Index in the XDMF file of the time step of a data object read from
+    it, None if it has no time
+    '''
+    information = data_object.GetInformation()
+    if not information.Has(vtk.vtkDataObject.DATA_TIME_STEP()):
+        return None
+    if xdmf_file_name not in loaded_mesh_ids:
+        xdmf_index = get_xdmf_index(xdmf_file_name)
+        try:
+            mesh_ids = scan_mesh_changes(xdmf_index, number_of_processes=1)
+        except ImportError:
+            print('h5py not found, the mesh of every time step is hashed')
+            mesh_ids = (None, None)
+        loaded_mesh_ids[xdmf_file_name] = (np.asarray(xdmf_index.times),) +\
+            tuple(mesh_ids)
+    return int(np.argmin(np.abs(loaded_mesh_ids[xdmf_file_name][0] -
+        information.Get(vtk.vtkDataObject.DATA_TIME_STEP()))))
+
+
+def get_mesh_ids(data_object, xdmf_file_name):
+    '''
+    Topology id and geometry id (see scan_mesh_changes) of the time step of
+    a data object read from an XDMF file, None if it has no time or they
+    cannot be scanned
+    '''
+    time_step_index = get_time_step_index(data_object, xdmf_file_name)
+    if time_step_index is None:
+        return None
+    times, topology_ids, geometry_ids = loaded_mesh_ids[xdmf_file_name]
+    if topology_ids is None:
+        return None
+    return topology_ids[time_step_index], geometry_ids[time_step_index]
+
+
+def get_topology_id(data_object, xdmf_file_name):
+    '''
+    Topology id (see scan_mesh_changes) of the time step of a data object
+    read from an XDMF file, None if it has no time
+    '''
+    mesh_ids = get_mesh_ids(data_object, xdmf_file_name)
+    return None if mesh_ids is None else mesh_ids[0]
+
+
+def get_mesh_counts(data_sets):
+    '''
+    Total numbers of points and of cells of some data sets
+    '''
+    return (sum(data_set.GetNumberOfPoints() for data_set in data_sets),
+            sum(data_set.GetNumberOfCells() for data_set in data_sets))
+
+
+def get_known_topology_key(block_topology, mesh_counts):
+    '''
+    Topology key stored for block_topology, None if there is none or the
+    data it was computed for had other numbers of points and cells than
+    mesh_counts (see get_mesh_counts): the sampled hashes of
+    scan_mesh_changes are then wrong about the topology
+    '''
+    if block_topology is None or block_topology not in topology_keys:
+        return None
+    topology_key, known_counts = topology_keys[block_topology]
+    return topology_key if known_counts == mesh_counts else None
+
+
+def get_block_topology_key(unstructured_grid, block_topology=None):
+    '''
+    Topology key of an unstructured grid. block_topology identifies the
+    grid's topology without hashing it once it was seen.
+    '''
+    mesh_counts = get_mesh_counts([unstructured_grid])
+    topology_key = get_known_topology_key(block_topology, mesh_counts)
+    if topology_key is not None:
+        return topology_key
+    topology_key = get_topology_key(unstructured_grid)
+    if block_topology is not None:
+        topology_keys[block_topology] = (topology_key, mesh_counts)
+    return topology_key
+
+
+def set_cached_cells(unstructured_grid, output, cell_type, cell_array,
+                     cell_ids):
+    '''
+    Set output to cached cells of cell_type on the points and point data of
+    the unstructured grid they were made from, with the cell data of the
+    cell each comes from
+    '''
+    output.SetPoints(unstructured_grid.GetPoints())
+    output.SetCells(cell_type, cell_array)
+    output.GetPointData().PassData(unstructured_grid.GetPointData())
+    output.GetFieldData().PassData(unstructured_grid.GetFieldData())
+    cell_data = unstructured_grid.GetCellData()
+    for array_index in range(cell_data.GetNumberOfArrays()):
+        cell_array_data = cell_data.GetArray(array_index)
+        if cell_array_data is None:
+            continue
+        output_array = numpy_support.numpy_to_vtk(
+            numpy_support.vtk_to_numpy(cell_array_data)[cell_ids], deep=1)
+        output_array.SetName(cell_array_data.GetName())
+        output.GetCellData().AddArray(output_array)
+    return None
+
+
+def tetrahedralize_grid(unstructured_grid, output, cache_directory=None,
+                        block_topology=None):
+    '''
+    Set output to the tetrahedralized unstructured grid: the cached
+    tetrahedra of its topology, with its points and point data and the
+    cell data of the cell each tetrahedron comes from
+    '''
+    topology_key = get_block_topology_key(unstructured_grid, block_topology)
+    if topology_key not in loaded_tetrahedra:
+        loaded_tetrahedra[topology_key] = load_tetrahedra(
+            unstructured_grid, topology_key, cache_directory)
+    cell_array, cell_ids = loaded_tetrahedra[topology_key]
+    set_cached_cells(unstructured_grid, output, vtk.VTK_TETRA, cell_array,
+                     cell_ids)
+    return None
+
+
+def tetrahedralize_block(input_data, output_data, cache_directory=None,
+                         block_topology=None):
+    '''
+    Tetrahedralize one data set. Data sets other than unstructured grids
+    go through the Tetrahedralize filter without caching.
+    '''
+    if input_data.IsA('vtkUnstructuredGrid'):
+        tetrahedralize_grid(input_data, output_data, cache_directory,
+                            block_topology)
+    else:
+        triangle_filter = vtk.vtkDataSetTriangleFilter()
+        triangle_filter.SetInputData(input_data)
+        triangle_filter.Update()
+        output_data.ShallowCopy(triangle_filter.GetOutput())
+    return None
+
+
+def convert_data_object(convert_block, input_data, output_data,
+                        cache_directory=None, xdmf_file_name=None):
+    '''
+    Apply convert_block (input block, output unstructured grid, cache
+    directory, block topology) to a data set, or to each block of a
+    multiblock data set such as the grids of an XDMF collection. With the
+    XDMF file the data was read from, the block topologies identify time
+    steps whose connectivity is the same as an earlier one's (see
+    scan_mesh_changes), whose cached cells are then reused without hashing.
+    '''
+    topology_id = None
+    if xdmf_file_name is not None:
+        topology_id = get_topology_id(input_data, xdmf_file_name)
+    if not input_data.IsA('vtkCompositeDataSet'):
+        convert_block(input_data, output_data, cache_directory,
+                      None if topology_id is None else
+                      (xdmf_file_name, topology_id, 0))
+        return None
+    output_data.CopyStructure(input_data)
+    iterator = input_data.NewIterator()
+    iterator.InitTraversal()
+    block_index = 0
+    while not iterator.IsDoneWithTraversal():
+        output_block = vtk.vtkUnstructuredGrid()
+        convert_block(iterator.GetCurrentDataObject(), output_block,
+                      cache_directory,
+                      None if topology_id is None else
+                      (xdmf_file_name, topology_id, block_index))
+        output_data.SetDataSet(iterator, output_block)
+        iterator.GoToNextItem()
+        block_index += 1
+    return None
+
+
+def tetrahedralize_data_object(input_data, output_data, cache_directory=None,
+                               xdmf_file_name=None):
+    '''
+    Tetrahedralize a data set, or each block of a multiblock data set,
+    reusing the tetrahedra of each topology, see convert_data_object
+    '''
+    convert_data_object(tetrahedralize_block, input_data, output_data,
+                        cache_directory, xdmf_file_name)
+    return None
+
+
+def get_hexahedra_ids(unstructured_grid):
+    '''
+    (number of hexahedra, 8) point ids of an unstructured grid of
+    hexahedra only, None if it has other cells
+    '''
+    cell_types = numpy_support.vtk_to_numpy(
+        unstructured_grid.GetDistinctCellTypesArray())
+    if list(cell_types) != [vtk.VTK_HEXAHEDRON]:
+        return None
+    cells = unstructured_grid.GetCells()
+    if hasattr(cells, 'GetConnectivityArray'):
+        return numpy_support.vtk_to_numpy(
+            cells.GetConnectivityArray()).reshape(-1, 8)
+    return numpy_support.vtk_to_numpy(cells.GetData()).reshape(-1, 9)[:, 1:]
+
+
+def get_lagrange_point_order(extents):
+    '''
+    Index, in the points of a lattice of extents points with x varying
+    fastest, of each point of the Lagrange hexahedron of the lattice in
+    VTK order (corners, edges, faces then interior points). The order is
+    taken from the running VTK, as it changed between versions.
+    '''
+    extents = tuple(int(extent) for extent in extents)
+    if extents not in lagrange_point_orders:
+        degrees = [extent - 1 for extent in extents]
+        point_order = np.empty(int(np.prod(extents)), dtype=np.int64)
+        for k in range(extents[2]):
+            for j in range(extents[1]):
+                for i in range(extents[0]):
+                    point_order[vtk.vtkLagrangeHexahedron.PointIndexFromIJK(
+                        i, j, k, degrees)] = i + extents[0] * (
+                            j + extents[1] * k)
+        lagrange_point_orders[extents] = point_order
+    return lagrange_point_orders[extents]
+
+
+def get_lagrange_file_name(cache_directory, topology_key):
+    '''
+    Name of the file caching the Lagrange hexahedra of a topology
+    '''
+    return os.path.join(cache_directory, 'lagrange_' + topology_key + '.npz')
+
+
+def compute_lagrange_hexahedra(unstructured_grid):
+    '''
+    One Lagrange hexahedron per element of a grid of the hexahedra between
+    the points of each element (see get_element_layouts), on the same
+    points. Returns the point ids of the Lagrange hexahedra one after the
+    other, their offsets, the (number of elements, 3) polynomial degrees
+    of the elements and the first hexahedron of each.
+    '''
+    first_hexahedra, first_points, extents = get_element_layouts(
+        get_hexahedra_ids(unstructured_grid))
+    offsets = np.concatenate([[0], np.cumsum(np.prod(extents, axis=1))])
+    connectivity = np.empty(offsets[-1], dtype=ID_TYPE)
+    for element_extents in set(map(tuple, extents)):
+        elements = np.nonzero(np.all(extents == element_extents, axis=1))[0]
+        point_order = get_lagrange_point_order(element_extents)
+        connectivity[offsets[elements, np.newaxis] +
+                     np.arange(len(point_order))] =\
+            first_points[elements, np.newaxis] + point_order
+    return connectivity, offsets, extents - 1, first_hexahedra
+
+
+def load_lagrange_hexahedra(unstructured_grid, topology_key,
+                            cache_directory=None):
+    '''
+    Cell array of the Lagrange hexahedra of a topology, the VTK array of
+    their degrees and the cell each comes from, read from the cache
+    directory or computed and stored there
+    '''
+    lagrange_hexahedra = None
+    if cache_directory is not None:
+        lagrange_file_name = get_lagrange_file_name(cache_directory,
+                                                    topology_key)
+        try:
+            with np.load(lagrange_file_name) as lagrange_file:
+                lagrange_hexahedra = (lagrange_file['connectivity'],
+                                      lagrange_file['offsets'],
+                                      lagrange_file['degrees'],
+                                      lagrange_file['cell_ids'])
+        except Exception:
+            lagrange_hexahedra = None
+    if lagrange_hexahedra is None:
+        lagrange_hexahedra = compute_lagrange_hexahedra(unstructured_grid)
+        if cache_directory is not None:
+            try:
+                if not os.path.isdir(cache_directory):
+                    os.makedirs(cache_directory)
+                temporary_name = lagrange_file_name + '.tmp' + str(os.getpid())
+                with open(temporary_name, 'wb') as lagrange_file:
+                    np.savez(lagrange_file,
+                             connectivity=lagrange_hexahedra[0],
+                             offsets=lagrange_hexahedra[1],
+                             degrees=lagrange_hexahedra[2],
+                             cell_ids=lagrange_hexahedra[3])
+                os.rename(temporary_name, lagrange_file_name)
+            except (IOError, OSError):
+                print('Could not cache the Lagrange hexahedra in',
+                      cache_directory)
+    connectivity, offsets, degrees, cell_ids = lagrange_hexahedra
+    degrees_array = numpy_support.numpy_to_vtk(degrees.astype(np.float64),
+                                               deep=1)
+    degrees_array.SetName('HigherOrderDegrees')
+    return make_cell_array(connectivity, offsets), degrees_array, cell_ids
+
+
+def lagrange_hexahedra_block(input_data, output_data, cache_directory=None,
+                             block_topology=None):
+    '''
+    Set output_data to the Lagrange hexahedra of the elements of an
+    unstructured grid, with its points and point data and the cell data
+    of the first hexahedron of each element. Data sets other than
+    unstructured grids are passed through.
+    '''
+    if not input_data.IsA('vtkUnstructuredGrid'):
+        output_data.ShallowCopy(input_data)
+        return None
+    topology_key = get_block_topology_key(input_data, block_topology)
+    if topology_key not in loaded_lagrange_hexahedra:
+        loaded_lagrange_hexahedra[topology_key] = load_lagrange_hexahedra(
+            input_data, topology_key, cache_directory)
+    cell_array, degrees_array, cell_ids =\
+        loaded_lagrange_hexahedra[topology_key]
+    set_cached_cells(input_data, output_data, vtk.VTK_LAGRANGE_HEXAHEDRON,
+                     cell_array, cell_ids)
+    # Elements with the same number of points in every dimension have their
+    # degree deduced from it, the others need the degrees
+    if hasattr(output_data.GetCellData(), 'SetHigherOrderDegrees'):
+        output_data.GetCellData().SetHigherOrderDegrees(degrees_array)
+    else:
+        output_data.GetCellData().AddArray(degrees_array)
+    return None
+
+
+def lagrange_hexahedra_data_object(input_data, output_data,
+                                   cache_directory=None, xdmf_file_name=None):
+    '''
+    Make each element of a data set, or of each block of a multiblock data
+    set, one Lagrange hexahedron, reusing the cells of each topology, see
+    convert_data_object
+    '''
+    convert_data_object(lagrange_hexahedra_block, input_data, output_data,
+                        cache_directory, xdmf_file_name)
+    return None
+
+
+def get_blocks(composite_data):
+    '''
+    Leaf data sets of a composite data set, in order
+    '''
+    blocks = []
+    iterator = composite_data.NewIterator()
+    iterator.InitTraversal()
+    while not iterator.IsDoneWithTraversal():
+        blocks.append(iterator.GetCurrentDataObject())
+        iterator.GoToNextItem()
+    return blocks
+
+
+def get_merged_topology_file_name(cache_directory, merged_key):
+    '''
+    Name of the file caching the cells of merged blocks
+    '''
+    return os.path.join(cache_directory, 'merged_' + merged_key + '.vtu')
+
+
+def get_block_point_offsets(blocks):
+    '''
+    Where the points of each block start among the points of the merged
+    blocks, and their number at the end
+    '''
+    return np.cumsum([0] + [block.GetNumberOfPoints() for block in blocks])
+
+
+def get_merged_block_offsets(merged_topology):
+    '''
+    Block point offsets (see get_block_point_offsets) the cells of merged
+    blocks were merged with, None if unknown
+    '''
+    block_offsets = merged_topology.GetFieldData().GetArray(
+        BLOCK_OFFSETS_NAME)
+    if block_offsets is None:
+        return None
+    return numpy_support.vtk_to_numpy(block_offsets)
+
+
+def compute_merged_topology(blocks):
+    '''
+    Unstructured grid of the cells of all blocks, with point ids offset
+    by the number of points of the blocks before, as MergeBlocks does
+    without merging points. These offsets, where the points of each block
+    start among the merged points, are its field array
+    BLOCK_OFFSETS_NAME.
+    '''
+    append_filter = vtk.vtkAppendFilter()
+    append_filter.MergePointsOff()
+    for block in blocks:
+        topology = vtk.vtkUnstructuredGrid()
+        topology.ShallowCopy(block)
+        topology.GetPointData().Initialize()
+        topology.GetCellData().Initialize()
+        topology.GetFieldData().Initialize()
+        append_filter.AddInputData(topology)
+    append_filter.Update()
+    merged_topology = vtk.vtkUnstructuredGrid()
+    merged_topology.ShallowCopy(append_filter.GetOutput())
+    block_offsets = numpy_support.numpy_to_vtk(
+        get_block_point_offsets(blocks), deep=1)
+    block_offsets.SetName(BLOCK_OFFSETS_NAME)
+    merged_topology.GetFieldData().AddArray(block_offsets)
+    return merged_topology
+
+
+def load_merged_topology(blocks, merged_key, cache_directory=None):
+    '''
+    Cells of the merged blocks, read from the cache directory or
+    computed and stored there
+    '''
+    if cache_directory is not None:
+        merged_file_name = get_merged_topology_file_name(cache_directory,
+                                                         merged_key)
+        if os.path.isfile(merged_file_name):
+            reader = vtk.vtkXMLUnstructuredGridReader()
+            reader.SetFileName(merged_file_name)
+            reader.Update()
+            return reader.GetOutput()
+    merged_topology = compute_merged_topology(blocks)
+    if cache_directory is not None:
+        try:
+            if not os.path.isdir(cache_directory):
+                os.makedirs(cache_directory)
+            writer = vtk.vtkXMLUnstructuredGridWriter()
+            temporary_name = merged_file_name + '.tmp' + str(os.getpid())
+            writer.SetFileName(temporary_name)
+            writer.SetInputData(merged_topology)
+            writer.SetDataModeToAppended()
+            if not writer.Write():
+                raise IOError(merged_file_name)
+            os.rename(temporary_name, merged_file_name)
+        except (IOError, OSError):
+            print('Could not cache the merged blocks in', cache_directory)
+    return merged_topology
+
+
+def concatenate_arrays(data_arrays):
+    '''
+    New VTK array of the values of data_arrays one after the other
+    '''
+    merged_array = numpy_support.numpy_to_vtk(np.concatenate(
+        [numpy_support.vtk_to_numpy(data_array)
+         for data_array in data_arrays]), deep=1)
+    merged_array.SetName(data_arrays[0].GetName())
+    return merged_array
+
+
+def has_block_points(points, blocks, block_offsets):
+    '''
+    True if points are the points of the blocks one after the other, those
+    of block i from block_offsets[i] on (see get_block_point_offsets)
+    '''
+    if points.GetNumberOfPoints() != block_offsets[-1]:
+        return False
+    point_values = numpy_support.vtk_to_numpy(points.GetData())
+    return all(np.array_equal(
+        point_values[block_offsets[block_index]:
+                     block_offsets[block_index + 1]],
+        numpy_support.vtk_to_numpy(block.GetPoints().GetData()))
+        for block_index, block in enumerate(blocks))
+
+
+def merge_data_arrays(blocks, get_data, merged_data, array_names=None):
+    '''
+    Add to merged_data the arrays (point or cell data, from get_data) of
+    the blocks, those in array_names or all of them if None. Only arrays
+    that every block has are merged.
+    '''
+    first_data = get_data(blocks[0])
+    if array_names is None:
+        array_names = [first_data.GetArrayName(array_index) for array_index
+                       in range(first_data.GetNumberOfArrays())]
+    for array_name in array_names:
+        data_arrays = [get_data(block).GetArray(array_name)
+                       for block in blocks]
+        if any(data_array is None for data_array in data_arrays):
+            continue
+        merged_data.AddArray(concatenate_arrays(data_arrays))
+    return None
+
+
+def merge_blocks_data_object(input_data, output_data, cache_directory=None,
+                             xdmf_file_name=None):
+    '''
+    Set output_data to the unstructured grid of all blocks of input_data,
+    as the MergeBlocks filter without merging points. The cells are
+    merged once per topology and cached, only the points and arrays the
+    reader loaded into the blocks of a time step are put into them: the
+    points of block i are merged points block_offsets[i] onwards. With the
+    XDMF file the data was read from, the topology is found without
+    hashing the blocks (see scan_mesh_changes) and the points are reused
+    while the geometry is unchanged, once compared with those of the
+    blocks.
+    '''
+    if not input_data.IsA('vtkCompositeDataSet'):
+        output_data.ShallowCopy(input_data)
+        return None
+    blocks = [block for block in get_blocks(input_data)
+              if block.GetNumberOfPoints() > 0]
+    mesh_ids = None
+    if xdmf_file_name is not None:
+        mesh_ids = get_mesh_ids(input_data, xdmf_file_name)
+    block_offsets = get_block_point_offsets(blocks)
+    block_topology = None if mesh_ids is None else\
+        (xdmf_file_name, mesh_ids[0], 'Merged')
+    mesh_counts = get_mesh_counts(blocks)
+    merged_key = get_known_topology_key(block_topology, mesh_counts)
+    if merged_key is None:
+        merged_hash = hashlib.sha1()
+        for block in blocks:
+            merged_hash.update(get_topology_key(block).encode('utf-8'))
+        merged_key = merged_hash.hexdigest()
+        if block_topology is not None:
+            topology_keys[block_topology] = (merged_key, mesh_counts)
+    if merged_key not in loaded_merged_topologies:
+        loaded_merged_topologies[merged_key] = load_merged_topology(
+            blocks, merged_key, cache_directory)
+    merged_topology = loaded_merged_topologies[merged_key]
+    # Cells merged for blocks of other sizes are never put on these points
+    merged_offsets = get_merged_block_offsets(merged_topology)
+    if merged_offsets is None or\
+       not np.array_equal(merged_offsets, block_offsets) or\
+       merged_topology.GetNumberOfCells() != mesh_counts[1]:
+        merged_topology = compute_merged_topology(blocks)
+        merged_key = None
+    output_data.ShallowCopy(merged_topology)
+    output_data.GetFieldData().RemoveArray(BLOCK_OFFSETS_NAME)
+    geometry = None if mesh_ids is None or merged_key is None else\
+        (xdmf_file_name, mesh_ids[1], merged_key)
+    if geometry is None or geometry not in merged_points or\
+       not has_block_points(merged_points[geometry], blocks, block_offsets):
+        points = vtk.vtkPoints()
+        points.SetData(concatenate_arrays([block.GetPoints().GetData()
+                                           for block in blocks]))
+        merged_points.clear()
+        if geometry is not None:
+            merged_points[geometry] = points
+    else:
+        points = merged_points[geometry]
+    output_data.SetPoints(points)
+    merge_data_arrays(blocks, lambda block: block.GetPointData(),
+                      output_data.GetPointData())
+    if blocks[0].GetCellData().GetNumberOfArrays() > 0:
+        merge_data_arrays(blocks, lambda block: block.GetCellData(),
+                          output_data.GetCellData())
+    output_data.GetFieldData().PassData(blocks[0].GetFieldData())
+    return None
+
+
+def get_weld_cell_keys(cells, extents):
+    '''
+    One integer per cell of a grid of extents cells, from the (number of
+    cells, 3) indices of the cells: its index in the grid if the grid has
+    few enough cells, else a hash of the indices (different cells may then
+    have the same key, compute_weld_pairs tests the distances anyway)
+    '''
+    if np.prod(extents.astype(float)) < 2.0**62:
+        return cells[:, 0] + extents[0] * (cells[:, 1] +
+                                           extents[1] * cells[:, 2])
+    unsigned_cells = cells.astype(np.uint64)
+    cell_keys = np.zeros(len(cells), dtype=np.uint64)
+    for dimension in range(3):
+        cell_keys = (cell_keys ^ unsigned_cells[:, dimension]) *\
+            WELD_HASH_FACTORS[dimension]
+    return cell_keys
+
+
+def compute_weld_pairs(points, tolerance):
+    '''
+    Ids of the pairs of different points at most tolerance apart, each
+    pair once in each order. Points are hashed to the cells of a grid of
+    spacing 4 tolerance, shifted by 0 or 2 tolerance along each axis:
+    along an axis two points that close are split by the cells of at most
+    one of the two shifts, so they share a cell for at least one of the
+    8 shifts. Each pair is kept for the first shift they share a cell
+    for, a shift along an axis only needs the points within tolerance of
+    the cell boundaries of the unshifted grid along it.
+    '''
+    scaled_points = points / (4.0 * tolerance)
+    unshifted_cells = np.floor(scaled_points).astype(np.int64)
+    boundary_distances = np.abs(scaled_points - np.round(scaled_points))
+    first_ids = []
+    second_ids = []
+    for shift in itertools.product([0, 1], repeat=3):
+        shifted = np.array(shift, dtype=bool)
+        point_ids = np.flatnonzero(np.all(
+            boundary_distances[:, shifted] <= 0.25, axis=1))
+        if len(point_ids) < 2:
+            continue
+        cells = np.floor(scaled_points[point_ids] +
+                         0.5 * shifted).astype(np.int64)
+        cells -= cells.min(axis=0)
+        cell_keys = get_weld_cell_keys(cells, cells.max(axis=0) + 1)
+        order = np.argsort(cell_keys)
+        sorted_keys = cell_keys[order]
+        starts = np.flatnonzero(np.append(
+            True, sorted_keys[1:] != sorted_keys[:-1]))
+        counts = np.diff(np.append(starts, len(point_ids)))
+        # Cells with a single point have no pair
+        starts = starts[counts > 1]
+        counts = counts[counts > 1]
+        # Each point of a cell, then paired with every point of the cell,
+        # by position in order
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) +\
+            np.arange(counts.sum())
+        pair_counts = np.repeat(counts, counts)
+        first = np.repeat(positions, pair_counts)
+        second = np.repeat(np.repeat(starts, counts), pair_counts) +\
+            np.arange(pair_counts.sum()) -\
+            np.repeat(np.cumsum(pair_counts) - pair_counts, pair_counts)
+        found = first < second
+        first = order[first[found]]
+        second = order[second[found]]
+        # Hashed cell keys may put points of different cells together
+        found = np.all(cells[first] == cells[second], axis=1)
+        first = point_ids[first[found]]
+        second = point_ids[second[found]]
+        # Pairs not split by the unshifted grid along the shifted axes
+        # share a cell of an earlier shift
+        found = np.all(unshifted_cells[first][:, shifted] !=
+                       unshifted_cells[second][:, shifted], axis=1)
+        first = first[found]
+        second = second[found]
+        close = np.sum((points[first] - points[second])**2,
+                       axis=1) <= tolerance**2
+        first_ids.append(first[close])
+        second_ids.append(second[close])
+    first_ids = np.concatenate(first_ids)
+    second_ids = np.concatenate(second_ids)
+    return np.append(first_ids, second_ids), np.append(second_ids, first_ids)
+
+
+def compute_weld(points, tolerance):
+    '''
+    Ids of the points kept when welding points at most tolerance apart,
+    and for each point the index among these of the kept point it is
+    welded to. Welds do not chain: kept points are more than tolerance
+    apart and every point is at most tolerance from its kept point, the
+    first of the points close to it that is kept. Points are kept, and
+    the points close to them welded to them, in rounds: a point is kept
+    once no point before it close to it is left.
+    '''
+    if len(points) == 0 or tolerance <= 0.0:
+        return np.arange(len(points)), np.arange(len(points))
+    first_ids, second_ids = compute_weld_pairs(points, tolerance)
+    # Point each point is welded to (itself if kept), -1 while undecided
+    welded_ids = np.full(len(points), -1, dtype=np.int64)
+    while np.any(welded_ids < 0):
+        undecided = (welded_ids[first_ids] < 0) & (welded_ids[second_ids] < 0)
+        waiting = np.zeros(len(points), dtype=bool)
+        waiting[first_ids[undecided & (second_ids < first_ids)]] = True
+        kept = (welded_ids < 0) & ~waiting
+        welded_ids[kept] = np.nonzero(kept)[0]
+        welding = kept[second_ids] & (welded_ids[first_ids] < 0)
+        targets = np.full(len(points), len(points), dtype=np.int64)
+        np.minimum.at(targets, first_ids[welding], second_ids[welding])
+        welded_ids[targets < len(points)] = targets[targets < len(points)]
+    kept_ids = np.nonzero(welded_ids == np.arange(len(points)))[0]
+    return kept_ids, np.searchsorted(kept_ids, welded_ids)
+
+
+def get_weld_file_name(cache_directory, weld_key):
+    '''
+    Name of the file caching the welded points of a topology
+    '''
+    return os.path.join(cache_directory, 'weld_' + weld_key + '.npz')
+
+
+def get_cell_connectivity(unstructured_grid):
+    '''
+    Point ids of the cells of an unstructured grid one after the other
+    and the offsets of the cells in them (and their total number at the end)
+    '''
+    cells = unstructured_grid.GetCells()
+    if hasattr(cells, 'GetConnectivityArray'):
+        return numpy_support.vtk_to_numpy(cells.GetConnectivityArray()),\
+            numpy_support.vtk_to_numpy(cells.GetOffsetsArray())
+    # VTK 8 and older store [number of points, ids...] per cell
+    cell_data = numpy_support.vtk_to_numpy(cells.GetData())
+    locations = numpy_support.vtk_to_numpy(
+        unstructured_grid.GetCellLocationsArray())
+    point_ids = np.ones(len(cell_data), dtype=bool)
+    point_ids[locations] = False
+    return cell_data[point_ids], np.append(
+        locations - np.arange(len(locations)), len(cell_data) -
+        len(locations))
+
+
+def set_cells_of(output, unstructured_grid, cell_array):
+    '''
+    Set the cells of output to cell_array, cells of the same types and
+    sizes as those of unstructured_grid
+    '''
+    cell_types = numpy_support.vtk_to_numpy(
+        unstructured_grid.GetDistinctCellTypesArray())
+    if len(cell_types) == 1:
+        output.SetCells(int(cell_types[0]), cell_array)
+        return None
+    types_array = unstructured_grid.GetCellTypesArray()
+    if types_array is None:
+        # Newer VTK may hold the types in an implicit array
+        types_array = vtk.vtkUnsignedCharArray()
+        types_array.DeepCopy(unstructured_grid.GetCellTypes())
+    if hasattr(cell_array, 'GetConnectivityArray'):
+        output.SetCells(types_array, cell_array)
+    else:
+        output.SetCells(types_array,
+                        unstructured_grid.GetCellLocationsArray(), cell_array)
+    return None
+
+
+def load_weld(unstructured_grid, weld_key, tolerance, cache_directory=None):
+    '''
+    Ids of the kept points, the kept point each point is welded to and
+    the cell array of the welded cells of a topology, read from the cache
+    directory or computed and stored there
+    '''
+    weld = None
+    if cache_directory is not None:
+        weld_file_name = get_weld_file_name(cache_directory, weld_key)
+        try:
+            with np.load(weld_file_name) as weld_file:
+                weld = (weld_file['kept_ids'], weld_file['point_map'])
+        except Exception:
+            weld = None
+    if weld is None:
+        weld = compute_weld(numpy_support.vtk_to_numpy(
+            unstructured_grid.GetPoints().GetData()).astype(float),
+            tolerance)
+        if cache_directory is not None:
+            try:
+                if not os.path.isdir(cache_directory):
+                    os.makedirs(cache_directory)
+                temporary_name = weld_file_name + '.tmp' + str(os.getpid())
+                with open(temporary_name, 'wb') as weld_file:
+                    np.savez(weld_file, kept_ids=weld[0], point_map=weld[1])
+                os.rename(temporary_name, weld_file_name)
+            except (IOError, OSError):
+                print('Could not cache the welded points in',
+                      cache_directory)
+    kept_ids, point_map = weld
+    connectivity, offsets = get_cell_connectivity(unstructured_grid)
+    return kept_ids, point_map,\
+        make_cell_array(point_map[connectivity], offsets)
+
+
+def weld_points_data_object(input_data, output_data, tolerance,
+                            cache_directory=None, xdmf_file_name=None):
+    '''
+    Set output_data to the merged blocks of input_data (see
+    merge_blocks_data_object) with the points closer than tolerance times
+    the size of the mesh welded, as neighboring elements duplicate the
+    points of their shared faces. The point data of a welded point is that
+    of the first of its duplicates. Which points are welded is computed
+    once per topology, from the first time step with it, and cached:
+    the duplicates of moving meshes stay together.
+    '''
+    merged_data = vtk.vtkUnstructuredGrid()
+    merge_blocks_data_object(input_data, merged_data, cache_directory,
+                             xdmf_file_name)
+    topology_id = None
+    if xdmf_file_name is not None:
+        topology_id = get_topology_id(input_data, xdmf_file_name)
+    topology_key = get_block_topology_key(
+        merged_data, None if topology_id is None else
+        (xdmf_file_name, topology_id, 'Welded'))
+    # Not the key of welds cached by the grid snapping used before
+    # compute_weld_pairs, which missed or chained some pairs
+    weld_key = hashlib.sha1((topology_key + repr(float(tolerance)) +
+                             'Pairs').encode('utf-8')).hexdigest()
+    if weld_key not in loaded_welds:
+        bounds = np.array(merged_data.GetBounds())
+        loaded_welds[weld_key] = load_weld(
+            merged_data, weld_key, tolerance * max(np.linalg.norm(
+                bounds[1::2] - bounds[0::2]), np.finfo(float).tiny),
+            cache_directory)
+    kept_ids, point_map, cell_array = loaded_welds[weld_key]
+    points = vtk.vtkPoints()
+    points.SetData(numpy_support.numpy_to_vtk(numpy_support.vtk_to_numpy(
+        merged_data.GetPoints().GetData())[kept_ids], deep=1))
+    output_data.SetPoints(points)
+    set_cells_of(output_data, merged_data, cell_array)
+    point_data = merged_data.GetPointData()
+    for array_index in range(point_data.GetNumberOfArrays()):
+        data_array = point_data.GetArray(array_index)
+        if data_array is None:
+            continue
+        welded_array = numpy_support.numpy_to_vtk(
+            numpy_support.vtk_to_numpy(data_array)[kept_ids], deep=1)
+        welded_array.SetName(data_array.GetName())
+        output_data.GetPointData().AddArray(welded_array)
+    output_data.GetCellData().PassData(merged_data.GetCellData())
+    output_data.GetFieldData().PassData(merged_data.GetFieldData())
+    return None
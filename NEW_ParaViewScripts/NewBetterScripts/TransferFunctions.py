@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+
+# Distributed under the MIT License.
+# See LICENSE.txt for details.
+
+import argparse
+import glob
+import hashlib
+import heapq
+import json
+import os
+import numpy as np
+
+# Opacity functions used by set_opacity, evaluated with numpy only so that
+# they can also be used without ParaView. Each returns the variable values
+# and the opacity at each of them.
+
+
+def constant_opacity(var_min, var_max, opacity_val):
+    '''
+    'Constant': opacity_val over the whole range
+    '''
+    return np.array([var_min, var_max], dtype=float),\
+        np.array([opacity_val, opacity_val], dtype=float)
+
+
+def gaussian_opacity(var_min, var_max, num_points=200, num_gauss=5):
+    '''
+    'Proportional': a sum of num_gauss gaussians evenly spaced over the
+    range, with amplitudes proportional to the variable value at their
+    centers, evaluated at num_points values
+    '''
+    var_values = np.linspace(var_min, var_max, num_points)
+    center_values = np.linspace(var_min, var_max, num_gauss)
+    amplitude_values = np.abs(center_values) /\
+        max(abs(var_max), abs(var_min))
+    sigma = (var_values[1] - var_values[0]) * 2.0
+    # One row per gaussian, summed over the gaussians
+    opacity_function = np.sum(amplitude_values[:, np.newaxis] * np.exp(
+        -1.0 * np.square(var_values[np.newaxis, :] -
+                         center_values[:, np.newaxis]) / (2.0 * sigma**2)),
+        axis=0)
+    return var_values, opacity_function
+
+
+def histogram_opacity(counts, bin_edges, opacity_val):
+    '''
+    'Histogram': one value per bin, at its center, with opacity following
+    log(1 + count) up to opacity_val for the most populated bin. The log
+    scale keeps a few very common values (for ex. a background at 0) from
+    hiding everything else.
+    '''
+    var_values = 0.5 * (bin_edges[:-1] + bin_edges[1:])
+    log_counts = np.log1p(np.asarray(counts, dtype=float))
+    largest_log_count = log_counts.max()
+    # An empty histogram is transparent
+    if largest_log_count == 0.0:
+        return var_values, np.zeros_like(log_counts)
+    return var_values, opacity_val * log_counts / largest_log_count
+
+
+def segment_error(var_values, opacity_function, start, end):
+    '''
+    Largest difference between the opacity function and the straight line
+    from point start to point end, and where it is. ParaView interpolates
+    linearly between control points, so this is the error made by
+    dropping the points in between.
+    '''
+    if end - start < 2:
+        return 0.0, start
+    interpolated = np.interp(var_values[start + 1:end],
+                             [var_values[start], var_values[end]],
+                             [opacity_function[start], opacity_function[end]])
+    errors = np.abs(opacity_function[start + 1:end] - interpolated)
+    worst = np.argmax(errors)
+    return errors[worst], start + 1 + worst
+
+
+def simplify_curve(var_values, opacity_function, tolerance, max_points=None):
+    '''
+    Indices of the fewest points that keep the piecewise linear opacity
+    function within tolerance of the full one (Ramer-Douglas-Peucker).
+    Segments are split worst first, so with max_points the budget goes
+    where the error is largest.
+    '''
+    last = len(var_values) - 1
+    if last < 1:
+        return np.arange(len(var_values))
+    kept = set([0, last])
+    # Max-heap of segments by error, heapq is a min-heap
+    error, split = segment_error(var_values, opacity_function, 0, last)
+    segments = [(-error, 0, last, split)]
+    while segments:
+        negative_error, start, end, split = heapq.heappop(segments)
+        if -negative_error <= tolerance:
+            break
+        if max_points is not None and len(kept) >= max_points:
+            break
+        kept.add(split)
+        for segment_start, segment_end in [(start, split), (split, end)]:
+            error, segment_split = segment_error(
+                var_values, opacity_function, segment_start, segment_end)
+            heapq.heappush(segments, (-error, segment_start, segment_end,
+                                      segment_split))
+    return np.array(sorted(kept))
+
+
+def build_control_points(var_values, opacity_function, midpoint=0.5,
+                         sharpness=0.0):
+    '''
+    ParaView piecewise function points: (value, opacity, midpoint,
+    sharpness) for each point, interleaved into one flat list
+    '''
+    number_of_points = len(var_values)
+    return np.column_stack([
+        var_values, opacity_function,
+        np.full(number_of_points, midpoint),
+        np.full(number_of_points, sharpness)]).ravel().tolist()
+
+
+def evaluate_opacity(function_type, opacity_val, var_range, histogram=None):
+    '''
+    Variable values and opacity of the opacity function chosen in the
+    input file, see set_opacity
+    '''
+    var_min, var_max = var_range
+    if function_type == 'Constant':
+        return constant_opacity(var_min, var_max, opacity_val)
+    elif function_type == 'Proportional':
+        return gaussian_opacity(var_min, var_max)
+    elif function_type == 'Histogram':
+        counts, bin_edges = histogram
+        return histogram_opacity(counts, bin_edges, opacity_val)
+    raise ValueError("Unknown opacity function type: " + function_type)
+
+
+def get_opacity_points(function_type, opacity_val, var_range, histogram=None,
+                       tolerance=0.0, max_points=None):
+    '''
+    ParaView opacity points of the chosen opacity function, simplified to
+    the fewest points within tolerance and at most max_points
+    '''
+    var_values, opacity_function = evaluate_opacity(
+        function_type, opacity_val, var_range, histogram)
+    kept = simplify_curve(var_values, opacity_function, tolerance,
+                          max_points)
+    return build_control_points(var_values[kept], opacity_function[kept])
+
+
+# Computed color and opacity tables are cached as ParaView JSON presets,
+# one file per key in the cache directory, see get_transfer_function_key.
+# The cache directory is shared by every dataset and run, preset names
+# end with the start of their key (see get_preset_name) to tell apart
+# presets of the same variable, color map and opacity function.
+# Number of characters of the key in preset names
+PRESET_KEY_LENGTH = 8
+
+
+def get_transfer_function_key(var, var_range, color_map, opacity,
+                              histogram=None):
+    '''
+    Key of the color and opacity tables of var over var_range, with the
+    color map preset and the input file's Opacity (function type and
+    parameters), and the histogram the 'Histogram' function is built from
+    '''
+    key_items = [var, repr(float(var_range[0])), repr(float(var_range[1])),
+                 color_map, opacity.pv_function_type, repr(opacity.pv_value),
+                 repr(opacity.pv_number_of_bins), repr(opacity.pv_tolerance),
+                 repr(opacity.pv_max_points)]
+    if opacity.pv_function_type == 'Histogram' and histogram is not None:
+        counts, bin_edges = histogram
+        key_items += [hashlib.sha1(np.ascontiguousarray(counts)).hexdigest(),
+                      hashlib.sha1(np.ascontiguousarray(bin_edges))
+                      .hexdigest()]
+    return hashlib.sha1('\n'.join(key_items).encode('utf-8')).hexdigest()
+
+
+def get_preset_name(name, key):
+    '''
+    Name of the preset cached for key, name followed by the start of key
+    '''
+    key_suffix = ' ' + key[:PRESET_KEY_LENGTH]
+    if name.endswith(key_suffix):
+        return name
+    return name + key_suffix
+
+
+def make_preset(name, rgb_points, color_space, opacity_points):
+    '''
+    ParaView preset holding a color table and an opacity table
+    '''
+    return {'Name': name,
+            'ColorSpace': color_space,
+            'RGBPoints': [float(value) for value in rgb_points],
+            'Points': [float(value) for value in opacity_points]}
+
+
+def read_cached_preset(cache_directory, key):
+    '''
+    Cached preset for key, or None if it was never computed
+    '''
+    try:
+        with open(os.path.join(cache_directory, key + '.json'),
+                  'r') as preset_file:
+            return json.load(preset_file)[0]
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+
+def write_cached_preset(cache_directory, key, preset):
+    '''
+    Store a preset in the cache, as a file ParaView can import
+    '''
+    preset_file_name = os.path.join(cache_directory, key + '.json')
+    try:
+        if not os.path.isdir(cache_directory):
+            os.makedirs(cache_directory)
+        temporary_name = preset_file_name + '.tmp' + str(os.getpid())
+        with open(temporary_name, 'w') as preset_file:
+            json.dump([preset], preset_file, indent=1)
+        os.rename(temporary_name, preset_file_name)
+    except (IOError, OSError):
+        print('Could not cache the transfer function in', cache_directory)
+    return None
+
+
+def export_presets(cache_directory, file_name):
+    '''
+    Write every cached preset to one JSON file, which can be loaded in
+    ParaView with 'Import' in the color map presets dialog or
+    ImportPresets(file_name) in paraview.simple. Presets cached without
+    their key in the name are renamed with it (see get_preset_name).
+    '''
+    presets = []
+    for preset_file_name in sorted(glob.glob(os.path.join(cache_directory,
+                                                          '*.json'))):
+        key = os.path.splitext(os.path.basename(preset_file_name))[0]
+        with open(preset_file_name, 'r') as preset_file:
+            for preset in json.load(preset_file):
+                preset['Name'] = get_preset_name(preset['Name'], key)
+                presets.append(preset)
+    with open(file_name, 'w') as output_file:
+        json.dump(presets, output_file, indent=1)
+    return len(presets)
+
+
+def parse_cmd_line():
+    '''
+    parse command-line arguments
+    :return: dictionary of the command-line args, dashes are underscores
+    '''
+    parser = argparse.ArgumentParser(
+        description='Export cached transfer functions as ParaView presets',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--cache-directory', type=str, required=True,
+                        help="Cache_directory of the yaml input file")
+    parser.add_argument('--export', type=str, required=True,
+                        help="name of the JSON presets file to write")
+    return vars(parser.parse_args())
+
+
+def main(args):
+    '''
+    :param args: command line arguments
+    '''
+    number_of_presets = export_presets(args["cache_directory"], args["export"])
+    print('Exported {0} presets to {1}'.format(number_of_presets,
+                                               args["export"]))
+    return None
+
+
+if __name__ == "__main__":
+    try:
+        main(parse_cmd_line())
+    except KeyboardInterrupt:
+        pass
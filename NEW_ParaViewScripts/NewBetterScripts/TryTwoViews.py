@@ -35,22 +35,24 @@ def main(args):
     layout1.AssignView(1, render_view1)
     layout1.AssignView(2, render_view2)
 
-    xdmf_reader = get_xdmf_reader(input_file.pv_file_path)
+    xdmf_reader = get_xdmf_reader(
+        input_file.pv_file_path, get_required_point_arrays(input_file))
     
     # Images to render in first view
     SetActiveView(render_view1)
-    display=tetrahedralize(xdmf_reader, render_view1)
+    display=show_element_cells(xdmf_reader, render_view1,
+                               input_file.pv_scalar_variable_properties,
+                               input_file.pv_cache_directory,
+                               input_file.pv_file_path)
     display=set_representation(
         input_file.pv_scalar_variable_properties.pv_representation,
         display)
     display, render_view, variable_lookup_table=\
-        set_color_map(scalar_variable, render_view1, display,
-                      input_file.pv_scalar_variable_properties.pv_color_map)
-    render_view=\
-    set_opacity(scalar_variable,
-    input_file.pv_scalar_variable_properties.pv_opacity.pv_function_type,
-            input_file.pv_scalar_variable_properties.pv_opacity.pv_value,
-            render_view1, xdmf_reader, variable_lookup_table)
+        set_transfer_functions(scalar_variable, render_view1, display,
+                               xdmf_reader,
+                               input_file.pv_scalar_variable_properties,
+                               get_data_range(input_file), get_histogram(input_file),
+                               input_file.pv_cache_directory)
     render_view1.Update()
     render_view1.ResetCamera()
 
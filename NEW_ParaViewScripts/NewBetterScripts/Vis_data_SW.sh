@@ -9,6 +9,15 @@
 
 cd ~/Vis_PV_myGit/NEW_ParaViewScripts/NewBetterScripts/
 
-pvbatch RenderXdmf.py --input-file InputParaView.yaml --save ScalarWave_try
+# Add --resume to skip the frames finished by a job that ran out of time
 
+# Either split the timesteps between 24 pvbatch workers...
+pvbatch RenderXdmf.py --input-file InputParaView.yaml --save ScalarWave_try \
+    --number-of-workers 24
 
+# ...or run one serial ParaView per MPI rank, each rank renders its own
+# timesteps and rank 0 writes ScalarWave_try_timing.yaml
+# mpirun -np 24 pvpython RenderXdmf.py --input-file InputParaView.yaml \
+#     --save ScalarWave_try
+# (under mpirun -np 24 pvbatch only rank 0 runs the script, the ranks
+# render every timestep together)
@@ -22,23 +22,47 @@ def main(args):
     :param args: command line arguments
     Render image(s) based on parameters specified
     '''
-    
+    # Split the timesteps between worker processes if requested,
+    # each worker builds its own pipeline
+    if launch_workers(args):
+        return None
+
     # Disable automatic camera reset on 'Show'
     paraview.simple._DisableFirstRenderCameraReset()
     # Get data from file, set default camera properties
     input_file = load_input_file(args["input_file"])
     scalar_variable = input_file.pv_scalar_variable_properties.pv_variable_name
-    xdmf_reader = get_xdmf_reader(input_file.pv_file_path)
+    xdmf_reader = get_xdmf_reader(
+        input_file.pv_file_path, get_required_point_arrays(input_file))
     render_view = CreateRenderView()
     set_default_camera(render_view)
 
-    # Do volume render
-    display = volume_render(xdmf_reader, render_view)
+    # Do volume render, of the data resampled onto an image if chosen
+    scalar_properties = input_file.pv_scalar_variable_properties
+    if scalar_properties.pv_representation == 'ResampledVolume':
+        display = resampled_volume_render(
+            xdmf_reader, render_view, scalar_variable,
+            scalar_properties.pv_resample_resolution,
+            get_mesh_bounds(input_file), input_file.pv_cache_directory,
+            input_file.pv_file_path)
+    else:
+        display = volume_render(xdmf_reader, render_view,
+                                input_file.pv_cache_directory,
+                                input_file.pv_file_path)
     
     # Set color map
     display, render_view, variable_lookup_table=\
         set_color_map(scalar_variable, render_view, display,
                       input_file.pv_scalar_variable_properties.pv_color_map)
+    if scalar_properties.pv_representation == 'ResampledVolume':
+        # Leave the image outside the mesh transparent (ParaView 5.10+)
+        try:
+            variable_lookup_table.NanOpacity = 0.0
+        except AttributeError:
+            pass
+    var_range = get_data_range(input_file)
+    if var_range is not None:
+        set_data_range(scalar_variable, variable_lookup_table, var_range)
     
     # Update the view
     update_view(render_view)
@@ -48,7 +72,8 @@ def main(args):
     render_view.ResetCamera()
 
     # Save images
-    save_images(render_view, xdmf_reader, args["save"])
+    save_images(render_view, xdmf_reader, args,
+                input_file.pv_save_properties)
     
     return None
     
@@ -53,7 +53,8 @@ def translate_var(warp_by_scalar, var_source, render_view):
 
 
 def add_scalar_warp(scalar_var, var_source, scale_type, scale_factor,
-                    render_view):
+                    render_view, cache_directory=None,
+                    xdmf_file_name=None):
     '''
     Create a surface warp.
     Warps by variable being visualized
@@ -64,7 +65,8 @@ def add_scalar_warp(scalar_var, var_source, scale_type, scale_factor,
     elif scale_type == 'Log':
         scaling_scalar_var, calculator = create_log_scalar_var(scalar_var,
                                                                var_source)
-    tetrahedralize = Tetrahedralize(Input=calculator)
+    tetrahedralize = cached_tetrahedralize(calculator, cache_directory,
+                                           xdmf_file_name)
     slice_pv = Slice(Input=tetrahedralize)
     slice_pv.SliceType = 'Plane'
     slice_pv.SliceOffsetValues = [0.0]
@@ -131,36 +133,40 @@ def main(args):
     :param args: command line arguments
     Render image(s) based on parameters specified
     '''
-    
+    # Split the timesteps between worker processes if requested,
+    # each worker builds its own pipeline
+    if launch_workers(args):
+        return None
+
     # Disable automatic camera reset on 'Show'
     paraview.simple._DisableFirstRenderCameraReset()
     # Get data from file, set default camera properties
     input_file = load_input_file(args["input_file"])
     scalar_variable = input_file.pv_scalar_variable_properties.pv_variable_name
-    xdmf_reader = get_xdmf_reader(input_file.pv_file_path)
+    xdmf_reader = get_xdmf_reader(
+        input_file.pv_file_path, get_required_point_arrays(input_file))
     render_view = CreateRenderView()
     set_default_camera(render_view)
 
     # For Warp
     render_view, display = add_scalar_warp(
         scalar_variable, xdmf_reader, input_file.pv_warp.pv_scale_type,
-        input_file.pv_warp.pv_scale_factor, render_view)
+        input_file.pv_warp.pv_scale_factor, render_view,
+        input_file.pv_cache_directory, input_file.pv_file_path)
 
     display, render_view, variable_lookup_table=\
-                set_color_map(scalar_variable, render_view, display,
-                    input_file.pv_scalar_variable_properties.pv_color_map)
-
-    render_view=\
-                set_opacity(scalar_variable,
-                input_file.pv_scalar_variable_properties.pv_opacity.pv_function_type,
-                input_file.pv_scalar_variable_properties.pv_opacity.pv_value,
-                render_view, xdmf_reader, variable_lookup_table)
+                set_transfer_functions(scalar_variable, render_view, display,
+                                       xdmf_reader,
+                                       input_file.pv_scalar_variable_properties,
+                                       get_data_range(input_file), get_histogram(input_file),
+                                       input_file.pv_cache_directory)
 
     render_view.Update()
     render_view.ResetCamera()
 
     # Save images
-    save_images(render_view, xdmf_reader, args["save"])
+    save_images(render_view, xdmf_reader, args,
+                input_file.pv_save_properties)
     
     return None
     
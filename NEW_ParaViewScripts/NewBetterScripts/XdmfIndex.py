@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+
+# Distributed under the MIT License.
+# See LICENSE.txt for details.
+
+import argparse
+import os
+import pickle
+import xml.etree.ElementTree as ElementTree
+from collections import namedtuple
+
+# Bumped whenever the layout of the sidecar changes
+SIDECAR_VERSION = 2
+
+# One HDF5 dataset referenced by the XDMF file, file_name is absolute
+DataItem = namedtuple('DataItem', ['file_name', 'path', 'dimensions',
+                                   'number_type', 'precision'])
+# One uniform grid of a time step, coordinates are the x, y, z DataItems
+# and attributes maps attribute names to DataItems
+Grid = namedtuple('Grid', ['name', 'topology_type', 'number_of_elements',
+                           'connectivity', 'coordinates', 'attributes'])
+
+
+def parse_data_item(data_item_element, xdmf_directory):
+    '''
+    DataItem for an XDMF <DataItem> of the form file.h5:/path/to/dataset,
+    the file name is relative to the XDMF file. None for the DataItems
+    that are not a single HDF5 dataset, such as the Function (JOIN)
+    DataItems of vector attributes, these are not indexed.
+    '''
+    if data_item_element.get('ItemType', 'Uniform') != 'Uniform' or\
+       data_item_element.get('Format') != 'HDF5' or\
+       ':' not in (data_item_element.text or ''):
+        return None
+    file_name, path = data_item_element.text.strip().split(':', 1)
+    dimensions = tuple(int(dimension) for dimension in
+                       data_item_element.get('Dimensions').split())
+    return DataItem(os.path.join(xdmf_directory, file_name), path, dimensions,
+                    data_item_element.get('NumberType', 'Float'),
+                    int(data_item_element.get('Precision', '4')))
+
+
+def parse_grid(grid_element, xdmf_directory):
+    '''
+    Grid for an XDMF uniform <Grid>, the attributes that are not a single
+    HDF5 dataset are left out of it
+    '''
+    topology = grid_element.find('Topology')
+    connectivity = parse_data_item(topology.find('DataItem'), xdmf_directory)
+    coordinates = [parse_data_item(data_item, xdmf_directory) for data_item
+                   in grid_element.find('Geometry').findall('DataItem')]
+    if connectivity is None or None in coordinates:
+        raise ValueError("The topology and geometry of grid " +
+                         str(grid_element.get('Name')) + " are not read "
+                         "from HDF5 datasets, they cannot be indexed")
+    attributes = {}
+    for attribute in grid_element.findall('Attribute'):
+        data_item = parse_data_item(attribute.find('DataItem'),
+                                    xdmf_directory)
+        if data_item is not None:
+            attributes[attribute.get('Name')] = data_item
+    return Grid(grid_element.get('Name'), topology.get('TopologyType'),
+                int(topology.get('NumberOfElements')), connectivity,
+                coordinates, attributes)
+
+
+def get_sidecar_name(xdmf_file_name):
+    '''
+    Name of the binary index written next to an XDMF file
+    '''
+    return xdmf_file_name + '.index'
+
+
+def get_file_key(file_name):
+    '''
+    Modification time and size of a file, a cached result derived from
+    the file is reused only while this stays the same
+    '''
+    file_status = os.stat(file_name)
+    return (file_status.st_mtime, file_status.st_size)
+
+
+class XdmfIndex():
+    def __init__(self, xdmf_file_name, use_sidecar=True):
+        '''
+        Parses the temporal collection of an XDMF file into the time values
+        and, per time step, the list of its Grids, so that the HDF5
+        datasets of any time step can be found without ParaView.
+        The parsed index is stored in a sidecar file next to the XDMF file
+        (see get_sidecar_name) and reused while the XDMF file is unchanged.
+        '''
+        self.xdmf_file_name = os.path.abspath(xdmf_file_name)
+        file_key = get_file_key(self.xdmf_file_name)
+        if use_sidecar and self.load_sidecar(file_key):
+            return None
+        self.parse()
+        if use_sidecar:
+            self.write_sidecar(file_key)
+
+    def parse(self):
+        xdmf_directory = os.path.dirname(self.xdmf_file_name)
+        temporal_collection = ElementTree.parse(
+            self.xdmf_file_name).getroot().find('Domain').find('Grid')
+        self.times = []
+        self.time_steps = []
+        # Names of the attributes parse_grid left out, ParaView still
+        # reads them
+        unindexed_attribute_names = set()
+        for time_step in temporal_collection.findall('Grid'):
+            self.times.append(float(time_step.find('Time').get('Value')))
+            # A time step is a single uniform grid or a collection of them
+            if time_step.get('GridType') == 'Collection':
+                grid_elements = time_step.findall('Grid')
+            else:
+                grid_elements = [time_step]
+            self.time_steps.append([parse_grid(grid_element, xdmf_directory)
+                                    for grid_element in grid_elements])
+            for grid_element, grid in zip(grid_elements,
+                                          self.time_steps[-1]):
+                unindexed_attribute_names.update(
+                    attribute.get('Name') for attribute
+                    in grid_element.findall('Attribute')
+                    if attribute.get('Name') not in grid.attributes)
+        self.unindexed_attribute_names = sorted(unindexed_attribute_names)
+
+    def load_sidecar(self, file_key):
+        '''
+        Load the index from the sidecar, returns False if there is none
+        or it was written for another version of the XDMF file
+        '''
+        try:
+            with open(get_sidecar_name(self.xdmf_file_name), 'rb') as sidecar:
+                sidecar_dictionary = pickle.load(sidecar)
+        except Exception:
+            return False
+        if sidecar_dictionary.get('Version') != SIDECAR_VERSION or\
+           tuple(sidecar_dictionary.get('File_key', ())) != file_key:
+            return False
+        file_names = sidecar_dictionary['File_names']
+
+        def to_data_item(packed_data_item):
+            return DataItem(file_names[packed_data_item[0]],
+                            *packed_data_item[1:])
+        self.times = sidecar_dictionary['Times']
+        self.unindexed_attribute_names =\
+            sidecar_dictionary['Unindexed_attribute_names']
+        self.time_steps = [[Grid(name, topology_type, number_of_elements,
+                                 to_data_item(connectivity),
+                                 [to_data_item(coordinate)
+                                  for coordinate in coordinates],
+                                 dict((attribute_name, to_data_item(attribute))
+                                      for attribute_name, attribute
+                                      in attributes.items()))
+                            for name, topology_type, number_of_elements,
+                            connectivity, coordinates, attributes in grids]
+                           for grids in sidecar_dictionary['Time_steps']]
+        return True
+
+    def write_sidecar(self, file_key):
+        '''
+        Store the index using only built-in types, so that other tools
+        can unpickle it without this module. Each HDF5 file name is
+        stored once and data items refer to it by position.
+        '''
+        file_names = []
+        file_name_indices = {}
+
+        def pack(data_item):
+            if data_item.file_name not in file_name_indices:
+                file_name_indices[data_item.file_name] = len(file_names)
+                file_names.append(data_item.file_name)
+            return (file_name_indices[data_item.file_name],) +\
+                tuple(data_item[1:])
+        time_steps = [[(grid.name, grid.topology_type,
+                        grid.number_of_elements, pack(grid.connectivity),
+                        [pack(coordinate) for coordinate in grid.coordinates],
+                        dict((attribute_name, pack(attribute))
+                             for attribute_name, attribute
+                             in grid.attributes.items()))
+                       for grid in grids] for grids in self.time_steps]
+        sidecar_dictionary = {'Version': SIDECAR_VERSION,
+                              'File_key': file_key,
+                              'File_names': file_names,
+                              'Times': self.times,
+                              'Unindexed_attribute_names':
+                              self.unindexed_attribute_names,
+                              'Time_steps': time_steps}
+        sidecar_name = get_sidecar_name(self.xdmf_file_name)
+        try:
+            temporary_name = sidecar_name + '.tmp' + str(os.getpid())
+            with open(temporary_name, 'wb') as sidecar:
+                pickle.dump(sidecar_dictionary, sidecar, protocol=2)
+            os.rename(temporary_name, sidecar_name)
+        except (IOError, OSError):
+            # For ex. a read-only data directory, the index is then
+            # parsed again next time
+            print('Could not write the XDMF index to', sidecar_name)
+
+    def get_data_items(self, time_step_index, array_names=None):
+        '''
+        DataItems of a time step: connectivity, coordinates and the
+        attributes in array_names (all attributes if None)
+        '''
+        data_items = []
+        for grid in self.time_steps[time_step_index]:
+            data_items.append(grid.connectivity)
+            data_items += grid.coordinates
+            data_items += [data_item for name, data_item in
+                           sorted(grid.attributes.items())
+                           if array_names is None or name in array_names]
+        return data_items
+
+    def get_attribute_names(self):
+        '''
+        Names of the attributes of the first time step
+        '''
+        return sorted(set(attribute_name for grid in self.time_steps[0]
+                          for attribute_name in grid.attributes))
+
+
+# Indices already loaded in this process, by XDMF file name
+loaded_xdmf_indices = {}
+
+
+def get_xdmf_index(xdmf_file_name):
+    '''
+    XdmfIndex of an XDMF file, shared by everything that needs it in
+    this process
+    '''
+    xdmf_file_name = os.path.abspath(xdmf_file_name)
+    if xdmf_file_name not in loaded_xdmf_indices:
+        loaded_xdmf_indices[xdmf_file_name] = XdmfIndex(xdmf_file_name)
+    return loaded_xdmf_indices[xdmf_file_name]
+
+
+def parse_cmd_line():
+    '''
+    parse command-line arguments
+    :return: dictionary of the command-line args, dashes are underscores
+    '''
+    parser = argparse.ArgumentParser(
+        description='Build the index sidecar of an XDMF file and print a '
+        'summary of it',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('xdmf_file', type=str,
+                        help="path to the XDMF (.xmf) file")
+    return vars(parser.parse_args())
+
+
+def main(args):
+    '''
+    :param args: command line arguments
+    '''
+    xdmf_index = XdmfIndex(args["xdmf_file"])
+    print('Index:', get_sidecar_name(xdmf_index.xdmf_file_name))
+    print('Time steps:', len(xdmf_index.times))
+    if xdmf_index.times:
+        print('Times: {0} to {1}'.format(xdmf_index.times[0],
+                                         xdmf_index.times[-1]))
+        print('Grids per time step:', len(xdmf_index.time_steps[0]))
+        print('Attributes:', ', '.join(xdmf_index.get_attribute_names()))
+        if xdmf_index.unindexed_attribute_names:
+            print('Attributes not indexed:',
+                  ', '.join(xdmf_index.unindexed_attribute_names))
+        # DataScan needs numpy and h5py, the rest of the summary does not
+        try:
+            import h5py
+            from DataScan import get_geometry_unchanged, scan_mesh_changes
+        except ImportError:
+            print('Mesh changes not scanned, they need numpy and h5py')
+            return None
+        topology_ids, geometry_ids = scan_mesh_changes(xdmf_index)
+        print('Distinct topologies:', len(set(topology_ids)))
+        print('Distinct geometries:', len(set(geometry_ids)))
+        print('Time steps with the mesh of the previous one:',
+              sum(get_geometry_unchanged(xdmf_index)))
+    return None
+
+
+if __name__ == "__main__":
+    try:
+        main(parse_cmd_line())
+    except KeyboardInterrupt:
+        pass